@@ -52,11 +52,8 @@ setup(
     python_requires='>=3.6',
     install_requires=[
         'deap>=1.2.2',
+        'numpy>=1.14.0',
         'bokeh>=0.13.0',
-        'pyyaml>=3.13',
-        'socad>=0.1.0'
-    ],
-    dependency_links=[
-      'git+git://github.com/mdmfernandes/socad#egg=SOCAD-0.1.0'
+        'pyyaml>=3.13'
     ]
 )
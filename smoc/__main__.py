@@ -19,7 +19,7 @@ import argparse
 import os.path
 import sys
 
-from smoc import smoc
+from smoc import bench, smoc
 
 
 class CustomFormatter(argparse.HelpFormatter):
@@ -67,6 +67,10 @@ class CustomFormatter(argparse.HelpFormatter):
 
 def main():
     """SMOC main function."""
+    # Benchmark of the optimizer: "smoc bench [options]"
+    if len(sys.argv) > 1 and sys.argv[1] == 'bench':
+        return bench.main(sys.argv[2:])
+
     description = 'SMOC - A Stochastic Multi-objective Optimizer for Cadence Virtuoso'
     parser = argparse.ArgumentParser(description=description, formatter_class=CustomFormatter,
                                      prog='smoc')
@@ -79,7 +83,7 @@ def main():
         metavar='FILE',
         dest='checkpoint_file',
         default=None,
-        help='continue the optimization from a checkpoint file')
+        help='continue the optimization from a checkpoint (directory or file)')
 
     parser.add_argument(
         '-d',
@@ -108,7 +112,7 @@ def main():
         print("[ERROR] Invalid CONFIG file. Exiting the program...")
         return 11
     # Check if checkpoint file exists
-    if checkpoint_file and not os.path.isfile(checkpoint_file):
+    if checkpoint_file and not os.path.exists(checkpoint_file):
         print("[ERROR] Invalid CHECKPOINT file. Exiting the program...")
         return 12
 
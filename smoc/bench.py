@@ -0,0 +1,335 @@
+# This file is part of SMOC
+# Copyright (C) 2018  Miguel Fernandes
+#
+# SMOC is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SMOC is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""Benchmark of the optimizer throughput and overhead.
+
+The optimizer runs with a local zero-latency evaluator (no simulation server),
+so the measured time is the optimizer overhead: variation, evaluation
+bookkeeping, selection, statistics, checkpoints and the printing of the best
+individuals of each generation.
+"""
+
+import argparse
+import contextlib
+import itertools
+import json
+import logging
+import math
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import warnings
+from concurrent.futures import Future
+
+import deap
+import numpy as np
+
+from .optimizer.ga import OptimizerNSGA2
+from .util.checkpoint import CheckpointStore
+
+# Measured phases, in the order they are reported
+PHASES = ('variation', 'prescreen', 'evaluation', 'penalty', 'simulation', 'surrogate',
+          'selection', 'statistics', 'checkpoint', 'print_best')
+
+# Default benchmark matrix
+POP_SIZES = (100, 1000, 5000)
+VAR_COUNTS = (5, 20)
+OBJ_COUNTS = (2, 3)
+CON_COUNTS = (0, 5)
+
+
+class LocalEvaluator:
+    """A zero-latency evaluator, with the interface of a "ServerPool".
+
+    The circuit is replaced by an analytic problem: the objectives are the
+    DTLZ2 functions of the circuit variables (in [0, 1]), and each constraint
+    is the sum of two consecutive variables, which must be in [0.5, 1.5].
+
+    Arguments:
+        circuit_vars (list): names of the circuit variables.
+        n_obj (int): number of objectives.
+        n_con (int): number of constraints.
+    """
+
+    def __init__(self, circuit_vars, n_obj, n_con):
+        """Create the evaluator."""
+        self.circuit_vars = list(circuit_vars)
+        self.n_obj = n_obj
+        self.n_con = n_con
+        self.result_names = [f"f{idx + 1}" for idx in range(n_obj)]
+        self.result_names += [f"c{idx + 1}" for idx in range(n_con)]
+        # Number of evaluated individuals
+        self.num_evals = 0
+
+    def __len__(self):
+        return 1
+
+    def compute(self, x):
+        """Compute the results matrix of a matrix of circuit variables.
+
+        Arguments:
+            x (ndarray): circuit variables (one row per individual).
+
+        Returns:
+            ndarray: results (one row per individual).
+        """
+        num_vars = x.shape[1]
+        num_pos = self.n_obj - 1
+
+        # Position and distance variables
+        theta = x[:, [idx % num_vars for idx in range(num_pos)]] * (math.pi / 2)
+        g = ((x[:, num_pos:] - 0.5) ** 2).sum(axis=1)
+
+        cols = []
+        for obj in range(self.n_obj):
+            num = num_pos - obj
+            val = (1 + g) * np.cos(theta[:, :num]).prod(axis=1)
+            if obj > 0:
+                val = val * np.sin(theta[:, num])
+            cols.append(val)
+
+        for con in range(self.n_con):
+            cols.append(x[:, con % num_vars] + x[:, (con + 1) % num_vars])
+
+        return np.column_stack(cols)
+
+    def evaluate(self, variables):
+        """Evaluate a batch of circuit variables.
+
+        Arguments:
+            variables (list): circuit variables of each individual.
+
+        Returns:
+            list: results of each individual.
+        """
+        self.num_evals += len(variables)
+        x = np.array([[var[key] for key in self.circuit_vars] for var in variables], dtype=float)
+        matrix = self.compute(x.reshape(len(variables), len(self.circuit_vars)))
+
+        return [dict(zip(self.result_names, row)) for row in matrix.tolist()]
+
+    def submit(self, variables):
+        """Evaluate a batch of circuit variables (already finished future).
+
+        Arguments:
+            variables (list): circuit variables of each individual.
+
+        Returns:
+            Future: future with the results of each individual.
+        """
+        future = Future()
+        future.set_result(self.evaluate(variables))
+
+        return future
+
+
+def create_problem(n_vars, n_obj, n_con):
+    """Create the optimization problem of a benchmark case.
+
+    Arguments:
+        n_vars (int): number of circuit variables.
+        n_obj (int): number of objectives.
+        n_con (int): number of constraints.
+
+    Returns:
+        tuple: objectives, constraints and circuit variables.
+    """
+    objectives = {f"f{idx + 1}": -1.0 for idx in range(n_obj)}
+    constraints = {f"c{idx + 1}": [0.5, 1.5] for idx in range(n_con)}
+    circuit_vars = {f"x{idx + 1}": [0.0, 1.0] for idx in range(n_vars)}
+
+    return objectives, constraints, circuit_vars
+
+
+def run_case(pop_size, n_vars, n_obj, n_con, max_gen, workdir, sel_best=5, steady_state=False,
+             batch_size=1):
+    """Run a benchmark case.
+
+    Arguments:
+        pop_size (int): population size (mu and lambda).
+        n_vars (int): number of circuit variables.
+        n_obj (int): number of objectives.
+        n_con (int): number of constraints.
+        max_gen (int): number of generations.
+        workdir (str): directory of the checkpoints and of the archive.
+        sel_best (int, optional): number of best individuals printed at each
+            generation (default: 5).
+        steady_state (bool, optional): run the steady-state algorithm
+            (default: False).
+        batch_size (int, optional): number of offspring per request in
+            steady-state mode (default: 1).
+
+    Returns:
+        dict: benchmark results.
+    """
+    objectives, constraints, circuit_vars = create_problem(n_vars, n_obj, n_con)
+    client = LocalEvaluator(circuit_vars.keys(), n_obj, n_con)
+
+    with warnings.catch_warnings():
+        # DEAP warns that the classes of the previous case are overwritten
+        warnings.simplefilter('ignore', RuntimeWarning)
+        ga = OptimizerNSGA2(objectives, constraints, circuit_vars, pop_size, max_gen, client)
+
+    case_dir = tempfile.mkdtemp(dir=workdir)
+    checkpoints = CheckpointStore(os.path.join(case_dir, 'checkpoint'))
+
+    # The printed best individuals are measured, but not shown
+    start_time = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        ga.run_ga(checkpoints, sel_best=sel_best, steady_state=steady_state,
+                  batch_size=batch_size, archive_dir=os.path.join(case_dir, 'archive'))
+    total_time = time.perf_counter() - start_time
+
+    phases = {key: ga.timer.totals.get(key, 0.0) for key in PHASES}
+    phases['other'] = max(total_time - sum(phases.values()), 0.0)
+
+    return dict(pop_size=pop_size, n_vars=n_vars, n_obj=n_obj, n_con=n_con,
+                generations=max_gen, evaluations=client.num_evals, steady_state=steady_state,
+                total_time=total_time, gens_per_sec=max_gen / total_time,
+                evals_per_sec=client.num_evals / total_time,
+                overhead=1 - phases['simulation'] / total_time, phases=phases,
+                phases_per_gen={key: val / max_gen for key, val in phases.items()})
+
+
+def get_environment():
+    """Get the versions of the software used in a benchmark.
+
+    Returns:
+        dict: software versions and platform.
+    """
+    try:
+        from importlib import metadata
+        version = metadata.version('SMOC')
+    except Exception:  # pylint: disable=broad-except
+        version = None
+
+    return dict(smoc=version, python=platform.python_version(), numpy=np.__version__,
+                deap=deap.__version__, platform=platform.platform())
+
+
+def print_case(res):
+    """Print the results of a benchmark case."""
+    phases = ' | '.join(f"{key}: {val / res['total_time']:.0%}"
+                        for key, val in res['phases'].items() if val > 0)
+    print(f"pop {res['pop_size']:>6} | vars {res['n_vars']:>3} | obj {res['n_obj']} | "
+          f"con {res['n_con']:>2} | {res['gens_per_sec']:8.3f} gen/s | "
+          f"{res['evals_per_sec']:9.1f} evals/s | overhead {res['overhead']:.0%}")
+    print(f"    {phases}")
+
+
+def run_bench(pop_sizes=POP_SIZES, var_counts=VAR_COUNTS, obj_counts=OBJ_COUNTS,
+              con_counts=CON_COUNTS, max_gen=5, sel_best=5, steady_state=False, batch_size=1,
+              seed=42, verbose=True):
+    """Run the benchmark matrix: every combination of population size and
+    number of variables, objectives and constraints.
+
+    Arguments:
+        pop_sizes (list, optional): population sizes.
+        var_counts (list, optional): numbers of circuit variables.
+        obj_counts (list, optional): numbers of objectives.
+        con_counts (list, optional): numbers of constraints.
+        max_gen (int, optional): generations per case (default: 5).
+        sel_best (int, optional): number of best individuals printed at each
+            generation (default: 5).
+        steady_state (bool, optional): run the steady-state algorithm
+            (default: False).
+        batch_size (int, optional): number of offspring per request in
+            steady-state mode (default: 1).
+        seed (int, optional): random seed of each case (default: 42).
+        verbose (bool, optional): print the results of each case (default: True).
+
+    Returns:
+        dict: environment, parameters and results of each case.
+    """
+    cases = []
+
+    with tempfile.TemporaryDirectory(prefix='smoc_bench_') as workdir:
+        for pop_size, n_vars, n_obj, n_con in itertools.product(pop_sizes, var_counts,
+                                                                obj_counts, con_counts):
+            random.seed(seed)
+            res = run_case(pop_size, n_vars, n_obj, n_con, max_gen, workdir, sel_best,
+                           steady_state, batch_size)
+            cases.append(res)
+
+            if verbose:
+                print_case(res)
+
+    return dict(environment=get_environment(), date=time.strftime("%Y-%m-%dT%H:%M:%S"),
+                max_gen=max_gen, sel_best=sel_best, seed=seed, cases=cases)
+
+
+def main(argv=None):
+    """Benchmark main function ("smoc bench").
+
+    Arguments:
+        argv (list or None, optional): command line arguments. If None,
+            "sys.argv" is used (default: None).
+
+    Returns:
+        int: exit code.
+    """
+    description = 'SMOC - Benchmark of the optimizer throughput and overhead'
+    parser = argparse.ArgumentParser(description=description, prog='smoc bench')
+
+    parser.add_argument('-p', '--pop-sizes', metavar='N', type=int, nargs='+',
+                        default=list(POP_SIZES), help='population sizes (e.g. 100 1000 20000)')
+    parser.add_argument('-n', '--vars', metavar='N', type=int, nargs='+',
+                        default=list(VAR_COUNTS), help='numbers of circuit variables')
+    parser.add_argument('-m', '--objectives', metavar='N', type=int, nargs='+',
+                        default=list(OBJ_COUNTS), help='numbers of objectives')
+    parser.add_argument('-k', '--constraints', metavar='N', type=int, nargs='+',
+                        default=list(CON_COUNTS), help='numbers of constraints')
+    parser.add_argument('-g', '--generations', metavar='N', type=int, default=5,
+                        help='generations per case')
+    parser.add_argument('--sel-best', metavar='N', type=int, default=5,
+                        help='best individuals printed per generation')
+    parser.add_argument('--steady-state', action='store_true',
+                        help='run the steady-state algorithm')
+    parser.add_argument('--batch-size', metavar='N', type=int, default=1,
+                        help='offspring per request in steady-state mode')
+    parser.add_argument('--seed', metavar='N', type=int, default=42, help='random seed')
+    parser.add_argument('-o', '--output', metavar='FILE', default=None,
+                        help='JSON file with the results (default: smoc_bench_<date>.json)')
+
+    args = parser.parse_args(argv)
+
+    if min(args.objectives) < 1 or min(args.vars) < 1:
+        print("[ERROR] The number of objectives and variables must be positive.")
+        return 1
+
+    output = args.output or time.strftime("smoc_bench_%Y-%m-%d_%H-%M-%S.json")
+
+    # Only the warnings of the optimizer are shown
+    logging.getLogger('smoc').setLevel(logging.WARNING)
+    if not logging.getLogger().handlers:
+        logging.basicConfig(format='[%(levelname)s] %(message)s')
+
+    results = run_bench(args.pop_sizes, args.vars, args.objectives, args.constraints,
+                        args.generations, args.sel_best, args.steady_state, args.batch_size,
+                        args.seed)
+
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    print(f"\nResults written to {output}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
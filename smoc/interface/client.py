@@ -0,0 +1,273 @@
+# This file is part of SMOC
+# Copyright (C) 2018  Miguel Fernandes
+#
+# SMOC is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SMOC is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""Client that communicates with the server that runs in Cadence Virtuoso."""
+
+import json
+import select
+import socket
+import struct
+import time
+
+import numpy as np
+
+from ..util.timing import PhaseTimer
+
+
+class Client:
+    """A client that sends requests to the simulation server.
+
+    The counterpart of the server in "smoc_cadence/interface/server.py". Each
+    message is a frame with the data length, packed in an unsigned int (I)
+    [4 bytes] with big-endian byte order (>), followed by the data. Control
+    messages are serialized in JSON, and batches of numbers can be sent as
+    matrices of little-endian float64 (see "send_matrix" and "recv_matrix").
+
+    The client counts the bytes sent and received, and measures the time
+    spent serializing the requests, waiting on the server (sending and
+    receiving) and parsing the responses.
+
+    A response can be awaited up to a deadline. The requests whose response
+    missed the deadline are abandoned, and their responses are discarded when
+    they arrive (the server answers the requests in order).
+
+    Arguments:
+        sock (object, optional): socket to use in the connection
+            (default: None).
+    """
+
+    def __init__(self, sock=None):
+        """Create the client socket."""
+        if sock is None:
+            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        else:
+            self.socket = sock
+
+        self.bytes_sent = 0
+        self.bytes_recv = 0
+        self.timer = PhaseTimer()
+        # Number of responses of abandoned requests, still to be discarded
+        self.late = 0
+
+    def run(self, host, port):
+        """Connect to the server.
+
+        Arguments:
+            host (str): server IP address.
+            port (int): server port.
+
+        Raises:
+            ConnectionError: if there's a communication problem.
+
+        Returns:
+            list: server socket name.
+        """
+        try:
+            self.socket.connect((host, port))
+        except OSError as err:
+            raise ConnectionError(err)
+
+        # The server sends the client address, and receives the client socket
+        # name
+        self.recv_data()
+        self.send_data(dict(data=self.socket.getsockname()))
+
+        return self.socket.getpeername()
+
+    def reconnect(self, host, port):
+        """Connect again to the server with a new socket (e.g. after the
+        connection dropped). The responses of the abandoned requests are lost
+        with the previous connection.
+
+        Arguments:
+            host (str): server IP address.
+            port (int): server port.
+
+        Raises:
+            ConnectionError: if there's a communication problem.
+
+        Returns:
+            list: server socket name.
+        """
+        self.socket.close()
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.late = 0
+
+        return self.run(host, port)
+
+    def send_frame(self, data):
+        """Send a frame (data length + data) through the socket.
+
+        Arguments:
+            data (bytes): data to send.
+
+        Raises:
+            ConnectionError: if the socket connection is broken.
+        """
+        try:
+            with self.timer.phase('wait'):
+                self.socket.sendall(struct.pack('>I', len(data)) + data)
+        except OSError as err:
+            raise ConnectionError(f"Socket connection broken while sending data: {err}")
+
+        self.bytes_sent += len(data) + 4
+
+    def wait(self, deadline):
+        """Wait until there's data to receive, up to a deadline.
+
+        Arguments:
+            deadline (float): deadline (time in seconds since the epoch).
+
+        Raises:
+            TimeoutError: if there's no data before the deadline.
+        """
+        readable, _, _ = select.select([self.socket], [], [], max(deadline - time.time(), 0))
+
+        if not readable:
+            raise TimeoutError("No response from the server before the deadline")
+
+    def recv_frame(self, deadline=None):
+        """Receive a frame through the socket.
+
+        Arguments:
+            deadline (float or None, optional): deadline of the start of the
+                frame (time in seconds since the epoch). Once started, the
+                frame is always received completely. If None, it waits
+                indefinitely (default: None).
+
+        Raises:
+            ConnectionError: if the socket connection is broken.
+            TimeoutError: if the frame doesn't start before the deadline.
+
+        Returns:
+            bytes: received data.
+        """
+        with self.timer.phase('wait'):
+            if deadline is not None:
+                self.wait(deadline)
+            data_len = struct.unpack('>I', self.recv_bytes(4))[0]
+            data = self.recv_bytes(data_len)
+
+        self.bytes_recv += data_len + 4
+
+        return data
+
+    def send_data(self, obj):
+        """Send an object, serialized in JSON, through the socket.
+
+        Arguments:
+            obj (dict): object to send.
+
+        Raises:
+            TypeError: if the object is not serializable in JSON.
+            ConnectionError: if the socket connection is broken.
+        """
+        try:
+            with self.timer.phase('serialization'):
+                serialized = json.dumps(obj).encode()
+        except (TypeError, ValueError):
+            raise TypeError('It can only send JSON-serializable data')
+
+        self.send_frame(serialized)
+
+    def recv_data(self, deadline=None):
+        """Receive an object, serialized in JSON, through the socket.
+
+        Arguments:
+            deadline (float or None, optional): deadline of the response (see
+                "recv_frame") (default: None).
+
+        Raises:
+            ConnectionError: if the socket connection is broken.
+            TimeoutError: if there's no response before the deadline.
+            TypeError: if the received data is not in JSON format.
+
+        Returns:
+            dict: decoded and de-serialized received data.
+        """
+        data = self.recv_frame(deadline)
+
+        try:
+            with self.timer.phase('parsing'):
+                return json.loads(data.decode())
+        except (TypeError, ValueError):
+            raise TypeError('Received data is not in JSON format')
+
+    def send_matrix(self, matrix):
+        """Send a matrix of floats, packed as little-endian float64, through
+        the socket.
+
+        Arguments:
+            matrix (ndarray or list): matrix to send.
+
+        Raises:
+            ConnectionError: if the socket connection is broken.
+        """
+        with self.timer.phase('serialization'):
+            data = np.ascontiguousarray(matrix, dtype='<f8').tobytes()
+
+        self.send_frame(data)
+
+    def recv_matrix(self, num_rows):
+        """Receive a matrix of floats through the socket.
+
+        Arguments:
+            num_rows (int): number of rows of the matrix.
+
+        Raises:
+            ConnectionError: if the socket connection is broken.
+
+        Returns:
+            ndarray: received matrix.
+        """
+        data = self.recv_frame()
+
+        with self.timer.phase('parsing'):
+            values = np.frombuffer(data, dtype='<f8')
+
+        return values.reshape(num_rows, -1) if num_rows else values.reshape(0, 0)
+
+    def recv_bytes(self, n_bytes):
+        """Receive a specified number of bytes through the socket.
+
+        Arguments:
+            n_bytes (int): number of bytes to receive.
+
+        Raises:
+            ConnectionError: if the socket connection is broken.
+
+        Returns:
+            bytes: received bytes stream.
+        """
+        data = bytearray(n_bytes)
+        view = memoryview(data)
+        received = 0
+
+        while received < n_bytes:
+            try:
+                num = self.socket.recv_into(view[received:], n_bytes - received)
+            except OSError as err:
+                raise ConnectionError(f"Socket connection broken while receiving bytes: {err}")
+
+            if not num:
+                raise ConnectionError("Socket connection broken while receiving bytes")
+
+            received += num
+
+        return bytes(data)
+
+    def close(self):
+        """Close the client socket."""
+        self.socket.close()
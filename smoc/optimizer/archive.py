@@ -0,0 +1,311 @@
+# This file is part of SMOC
+# Copyright (C) 2018  Miguel Fernandes
+#
+# SMOC is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SMOC is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""Archive of the evolution of the population."""
+
+import os
+import pickle
+
+import numpy as np
+from deap import creator, tools
+
+
+class EvolutionArchive:
+    """An append-only columnar archive of the population at each record
+    (generation or number of evaluations).
+
+    The circuit variables, fitnesses and simulation results of each record are
+    stored as arrays, grouped in chunks of "chunk_size" records. If a directory
+    is given, the complete chunks are written to compressed ".npz" files and
+    released from memory. Only a summary of each record (min/avg/max of each
+    fitness) is kept as a "deap.tools.Logbook".
+
+    The logbook with the complete population of each record (the format used
+    by previous versions) can be reconstructed with "to_logbook".
+
+    Simulation results that are not numbers are not archived.
+
+    Arguments:
+        directory (str or None, optional): directory where the chunks are
+            written. If None, the chunks are kept in memory (default: None).
+        chunk_size (int, optional): number of records per chunk (default: 50).
+    """
+
+    FILE_NAME = 'archive.pickle'
+
+    def __init__(self, directory=None, chunk_size=50):
+        """Create an empty archive."""
+        self.directory = directory
+        self.chunk_size = chunk_size
+
+        # Names of the simulation results (columns of the results arrays).
+        # New names are appended when they show up
+        self.result_names = []
+        self.result_columns = {}
+
+        # Written chunks (file names, or the arrays if kept in memory), their
+        # number of records, and the records of the current chunk
+        self.chunks = []
+        self.chunk_records = []
+        self.buffer = []
+
+        # Summary of each record
+        self.summary = tools.Logbook()
+        self.header = None
+
+        if directory is not None and not os.path.exists(directory):
+            os.makedirs(directory)
+
+    def __len__(self):
+        return len(self.summary)
+
+    def record(self, population, **fields):
+        """Archive the population.
+
+        Arguments:
+            population (list): evaluated population.
+            **fields: other fields of the record (e.g. gen, evals).
+        """
+        for ind in population:
+            for key in ind.result:
+                if key not in self.result_columns:
+                    self.result_columns[key] = len(self.result_names)
+                    self.result_names.append(key)
+
+        num_inds = len(population)
+        num_vars = len(population[0]) if population else 0
+        num_res = len(self.result_names)
+
+        variables = np.array([list(ind) for ind in population], dtype=float)
+        fitness = np.array([ind.fitness.values for ind in population], dtype=float)
+        results = np.full((num_inds, num_res), np.nan)
+        has_result = np.zeros((num_inds, num_res), dtype=bool)
+
+        for row, ind in enumerate(population):
+            for key, val in ind.result.items():
+                try:
+                    results[row, self.result_columns[key]] = val
+                except (TypeError, ValueError):
+                    continue
+                has_result[row, self.result_columns[key]] = True
+
+        self.append(dict(fields=fields, variables=variables.reshape(num_inds, num_vars),
+                         fitness=fitness, results=results, has_result=has_result))
+
+    def append(self, rec, flush=True):
+        """Append an archived record (as returned by "iter_records").
+
+        Arguments:
+            rec (dict): fields, variables, fitness, results and has_result of
+                a record.
+            flush (bool, optional): close the current chunk if it's complete.
+                If False, it's closed with the next flushed record
+                (default: True).
+        """
+        if self.header is None:
+            self.header = tuple(rec['fields'].keys()) + ('population', 'fitness', 'result')
+            self.summary.header = tuple(rec['fields'].keys()) + ('fitness',)
+            self.summary.chapters['fitness'].header = 'min', 'avg', 'max'
+
+        fitness = rec['fitness']
+        self.buffer.append(rec)
+
+        fit_summary = {}
+        if len(fitness):
+            fit_summary = dict(min=fitness.min(axis=0).tolist(), avg=fitness.mean(axis=0).tolist(),
+                               max=fitness.max(axis=0).tolist())
+        self.summary.record(fitness=fit_summary, **rec['fields'])
+
+        if flush and len(self.buffer) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """Close the current chunk and write it, if the archive has a directory."""
+        if not self.buffer:
+            return
+
+        num_res = len(self.result_names)
+        # Records of older chunks may have less results
+        results = [np.pad(rec['results'], ((0, 0), (0, num_res - rec['results'].shape[1])),
+                          constant_values=np.nan) for rec in self.buffer]
+        has_result = [np.pad(rec['has_result'],
+                             ((0, 0), (0, num_res - rec['has_result'].shape[1])))
+                      for rec in self.buffer]
+
+        chunk = dict(sizes=np.array([len(rec['fitness']) for rec in self.buffer], dtype=int),
+                     variables=np.concatenate([rec['variables'] for rec in self.buffer]),
+                     fitness=np.concatenate([rec['fitness'] for rec in self.buffer]),
+                     results=np.concatenate(results),
+                     has_result=np.concatenate(has_result))
+        self.chunk_records.append(len(self.buffer))
+        self.buffer = []
+
+        if self.directory is None:
+            self.chunks.append(chunk)
+            return
+
+        fname = f"chunk_{len(self.chunks):05d}.npz"
+        np.savez_compressed(os.path.join(self.directory, fname), **chunk)
+        self.chunks.append(fname)
+
+        # Keep an index of the archive in the directory
+        with open(os.path.join(self.directory, self.FILE_NAME), 'wb') as f:
+            pickle.dump(self, f)
+
+    def load_chunk(self, chunk):
+        """Load the arrays of a chunk."""
+        if isinstance(chunk, dict):
+            return chunk
+
+        with np.load(os.path.join(self.directory, chunk)) as data:
+            return {key: data[key] for key in data.files}
+
+    def iter_records(self, first=0):
+        """Iterate over the archived records.
+
+        Arguments:
+            first (int, optional): index of the first record (default: 0).
+
+        Yields:
+            dict: fields, variables, fitness, results and has_result of a record.
+        """
+        idx = 0
+
+        for chunk, num_records in zip(self.chunks, self.chunk_records):
+            # Skip the chunks before the first record, without loading them
+            if idx + num_records <= first:
+                idx += num_records
+                continue
+
+            data = self.load_chunk(chunk)
+            start = 0
+            for size in data['sizes'].tolist():
+                if idx >= first:
+                    rec = {key: data[key][start:start + size] for key in data if key != 'sizes'}
+                    rec['fields'] = dict(self.summary[idx])
+                    yield rec
+                start += size
+                idx += 1
+
+        for rec in self.buffer:
+            if idx >= first:
+                yield rec
+            idx += 1
+
+    def export(self, first=0):
+        """Export the records from a given index, e.g. to store them in an
+        incremental checkpoint.
+
+        Arguments:
+            first (int, optional): index of the first record (default: 0).
+
+        Returns:
+            dict: names of the simulation results and the records.
+        """
+        return dict(result_names=list(self.result_names), records=list(self.iter_records(first)))
+
+    def extend(self, exported, flush=True):
+        """Append the records exported from an archive with the same records
+        up to the first exported one.
+
+        Arguments:
+            exported (dict): records exported with "export".
+            flush (bool, optional): close (and write) the complete chunks. If
+                False, the records are kept in memory, e.g. to rebuild an
+                archive without writing to its directory (default: True).
+        """
+        for key in exported['result_names'][len(self.result_names):]:
+            self.result_columns[key] = len(self.result_names)
+            self.result_names.append(key)
+
+        for rec in exported['records']:
+            self.append(rec, flush)
+
+    def to_logbook(self):
+        """Reconstruct the logbook with the population of each record.
+
+        The logbook has the same format as the one created with the
+        "deap.tools.MultiStatistics" of the population, fitnesses and results
+        (chapters "population", "fitness" and "result" with the record
+        "value"). It requires the "creator.Individual" class.
+
+        Returns:
+            Logbook: the logbook of the evolution.
+        """
+        logbook = tools.Logbook()
+        if self.header is not None:
+            logbook.header = self.header
+
+        for rec in self.iter_records():
+            population = []
+            fitnesses = []
+            results = []
+
+            for variables, fitness, res, has_res in zip(rec['variables'], rec['fitness'],
+                                                        rec['results'], rec['has_result']):
+                ind = creator.Individual(variables.tolist())
+                ind.fitness.values = tuple(fitness.tolist())
+                ind.result = {key: val for key, val, has in zip(self.result_names,
+                                                                res.tolist(), has_res)
+                              if has}
+                population.append(ind)
+                fitnesses.append(ind.fitness.values)
+                results.append(dict(ind.result))
+
+            logbook.record(population=dict(value=tuple(population)),
+                           fitness=dict(value=tuple(fitnesses)), result=dict(value=tuple(results)),
+                           **rec['fields'])
+
+        return logbook
+
+    @classmethod
+    def from_logbook(cls, logbook, directory=None, chunk_size=50):
+        """Create an archive from a logbook with the population of each record
+        (e.g. from the checkpoints of previous versions).
+
+        Arguments:
+            logbook (Logbook): logbook of the evolution.
+            directory (str or None, optional): directory of the archive
+                (default: None).
+            chunk_size (int, optional): number of records per chunk (default: 50).
+
+        Returns:
+            EvolutionArchive: the archive.
+        """
+        archive = cls(directory, chunk_size)
+        chapters = ('population', 'fitness', 'result')
+
+        for idx, rec in enumerate(logbook):
+            fields = {key: val for key, val in rec.items() if key not in chapters}
+            archive.record(logbook.chapters['population'][idx]['value'], **fields)
+
+        return archive
+
+    @classmethod
+    def load(cls, directory):
+        """Load an archive written to a directory.
+
+        Arguments:
+            directory (str): directory of the archive.
+
+        Returns:
+            EvolutionArchive: the archive.
+        """
+        with open(os.path.join(directory, cls.FILE_NAME), 'rb') as f:
+            archive = pickle.load(f)
+
+        archive.directory = directory
+
+        return archive
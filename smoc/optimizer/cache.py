@@ -0,0 +1,132 @@
+# This file is part of SMOC
+# Copyright (C) 2018  Miguel Fernandes
+#
+# SMOC is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SMOC is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""Cache of circuit simulation results."""
+
+import hashlib
+import json
+from collections import OrderedDict
+
+
+class Quantizer:
+    """Quantize circuit design variables to build cache/database keys.
+
+    Individuals whose variables only differ below the quantization step of
+    each variable are mapped to the same key.
+
+    Arguments:
+        bound_low (list): lower bounds of the circuit variables.
+        bound_up (list): upper bounds of the circuit variables.
+        resolution (float or list, optional): quantization step of each circuit
+            variable, relative to the variable range (default: 1e-6).
+        names (list or None, optional): names of the circuit variables, used
+            to identify the quantization space (default: None).
+    """
+
+    def __init__(self, bound_low, bound_up, resolution=1e-6, names=None):
+        """Create the quantizer."""
+        if not isinstance(resolution, (list, tuple)):
+            resolution = [resolution] * len(bound_low)
+
+        if len(resolution) != len(bound_low):
+            raise ValueError("The quantizer needs one resolution per circuit variable")
+
+        self.bound_low = list(bound_low)
+        # Quantization step of each variable. If a variable has no range, any
+        # value is mapped to the same key
+        self.steps = []
+        for low, up, res in zip(bound_low, bound_up, resolution):
+            step = (up - low) * float(res)
+            self.steps.append(step if step > 0 else 1.0)
+
+        # Identifies the quantization space, i.e. keys are only comparable
+        # between quantizers with the same digest
+        space = json.dumps([names, self.bound_low, self.steps])
+        self.digest = hashlib.sha1(space.encode()).hexdigest()
+
+    def key(self, ind):
+        """Get the key of an individual.
+
+        Arguments:
+            ind (list): circuit design variables of the individual.
+
+        Returns:
+            tuple: quantized design variables.
+        """
+        return tuple(int(round((val - low) / step))
+                     for val, low, step in zip(ind, self.bound_low, self.steps))
+
+
+class EvalCache:
+    """A least recently used (LRU) cache of simulation results.
+
+    Arguments:
+        max_size (int, optional): max number of cached results (default: 10000).
+    """
+
+    def __init__(self, max_size=10000):
+        """Create the cache."""
+        self.max_size = max_size
+        self.entries = OrderedDict()
+
+        # Counters (can be reset, e.g. at each generation)
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """Get the simulation results stored for a key.
+
+        Arguments:
+            key (tuple): cache key.
+
+        Returns:
+            dict or None: simulation results, or None if the key is not cached.
+        """
+        try:
+            value = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            return None
+
+        # Mark the entry as the most recently used
+        self.entries.move_to_end(key)
+        self.hits += 1
+
+        return dict(value)
+
+    def put(self, key, value):
+        """Store the simulation results of a key, evicting the least recently
+        used entry if the cache is full.
+
+        Arguments:
+            key (tuple): cache key.
+            value (dict): simulation results.
+        """
+        if self.max_size <= 0:
+            return
+
+        self.entries[key] = dict(value)
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def reset_counters(self):
+        """Reset the hit/miss counters."""
+        self.hits = 0
+        self.misses = 0
@@ -0,0 +1,129 @@
+# This file is part of SMOC
+# Copyright (C) 2018  Miguel Fernandes
+#
+# SMOC is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SMOC is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""Adaptive control of the number of offspring per generation."""
+
+import logging
+
+logger = logging.getLogger('smoc.controller')
+
+
+class BatchSizeController:
+    """Tune the number of offspring evaluated per generation (lambda) to the
+    measured throughput of the simulator (evaluated individuals per second).
+
+    The throughput of each batch size is a moving average of the measurements
+    of the generations that used it, so the controller follows the changes of
+    the simulator load. After each generation, it hill-climbs: while the
+    throughput improves, the batch size keeps moving in the same direction
+    (and the step grows back to its initial value); when it gets worse, the
+    direction is reversed and the step is halved. The batch size is always
+    within the given bounds.
+
+    Arguments:
+        size (int): initial batch size.
+        low (int): min batch size.
+        high (int): max batch size.
+        step (int or None, optional): initial (and max) step of the batch size.
+            If None, it's 1/8 of the bounds range (default: None).
+        tolerance (float, optional): relative change of the throughput that is
+            considered noise (default: 0.05).
+        smoothing (float, optional): weight of the last measurement in the
+            throughput moving average (default: 0.5).
+    """
+
+    def __init__(self, size, low, high, step=None, tolerance=0.05, smoothing=0.5):
+        """Create the controller."""
+        self.low = max(int(low), 1)
+        self.high = max(int(high), self.low)
+        self.max_step = int(step) if step else max((self.high - self.low) // 8, 1)
+        self.tolerance = tolerance
+        self.smoothing = smoothing
+
+        # Current and previous batch size, search step and direction
+        self.size = min(max(int(size), self.low), self.high)
+        self.previous = None
+        self.step = self.max_step
+        self.direction = 1
+        # Measured throughput of each batch size (moving average)
+        self.throughput = {}
+
+    def update(self, num_evals, elapsed):
+        """Measure the throughput of a generation and choose the batch size of
+        the next one.
+
+        Arguments:
+            num_evals (int): number of evaluated individuals.
+            elapsed (float): generation wall time, in seconds.
+
+        Returns:
+            int: batch size of the next generation.
+        """
+        if num_evals <= 0 or elapsed <= 0:
+            return self.size
+
+        measured = num_evals / elapsed
+        average = self.throughput.get(self.size)
+        if average is not None:
+            measured = self.smoothing * measured + (1 - self.smoothing) * average
+        self.throughput[self.size] = measured
+
+        reference = self.throughput.get(self.previous)
+        if reference is None:
+            reason = "first measurement"
+        elif measured < reference * (1 - self.tolerance):
+            self.direction = -self.direction
+            self.step = max(self.step // 2, 1)
+            reason = f"worse than {reference:.3g} evals/s with {self.previous}"
+        elif measured > reference * (1 + self.tolerance):
+            self.step = min(self.step * 2, self.max_step)
+            reason = f"better than {reference:.3g} evals/s with {self.previous}"
+        else:
+            reason = f"same as {reference:.3g} evals/s with {self.previous}"
+
+        size = self.size + self.direction * self.step
+        # Bounce back from the bounds
+        if not self.low <= size <= self.high:
+            self.direction = -self.direction
+            size = min(max(self.size + self.direction * self.step, self.low), self.high)
+
+        logger.info("Batch size: %.3g evals/s (%.0f evals/h) with lambda %d (%s). "
+                    "Next lambda: %d", measured, measured * 3600, self.size, reason, size)
+
+        self.previous, self.size = self.size, size
+
+        return size
+
+    def state(self):
+        """Get the controller state, to be stored in a checkpoint.
+
+        Returns:
+            dict: controller state.
+        """
+        return dict(size=self.size, previous=self.previous, step=self.step,
+                    direction=self.direction, throughput=dict(self.throughput))
+
+    def load_state(self, state):
+        """Restore the controller state from a checkpoint. The batch size is
+        kept within the current bounds.
+
+        Arguments:
+            state (dict): controller state.
+        """
+        self.size = min(max(state['size'], self.low), self.high)
+        self.previous = state['previous']
+        self.step = min(max(state['step'], 1), self.max_step)
+        self.direction = state['direction']
+        self.throughput = dict(state['throughput'])
@@ -0,0 +1,107 @@
+# This file is part of SMOC
+# Copyright (C) 2018  Miguel Fernandes
+#
+# SMOC is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SMOC is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""Persistent database of circuit simulation results."""
+
+import json
+import sqlite3
+
+# Max number of keys per query (SQLite limits the number of host parameters)
+MAX_QUERY_KEYS = 500
+
+
+class ResultsDatabase:
+    """An SQLite database of simulation results shared across runs.
+
+    The results are indexed on the simulation template hash, the quantization
+    space and the quantized circuit variables, so they are only reused for the
+    same testbench and the same circuit variables.
+
+    Arguments:
+        fname (str): database file path.
+        template_hash (str): hash of the simulation template.
+    """
+
+    def __init__(self, fname, template_hash):
+        """Open (or create) the database."""
+        self.fname = fname
+        self.template_hash = template_hash
+        self.conn = sqlite3.connect(fname, timeout=30)
+
+        with self.conn:
+            self.conn.execute("""CREATE TABLE IF NOT EXISTS results (
+                                     template TEXT NOT NULL,
+                                     space TEXT NOT NULL,
+                                     key TEXT NOT NULL,
+                                     result TEXT NOT NULL,
+                                     PRIMARY KEY (template, space, key))""")
+
+        # Counter (can be reset, e.g. at each generation)
+        self.hits = 0
+
+    @staticmethod
+    def serialize_key(key):
+        """Serialize a quantized key.
+
+        Arguments:
+            key (tuple): quantized circuit variables.
+
+        Returns:
+            str: serialized key.
+        """
+        return ','.join(str(val) for val in key)
+
+    def get(self, space, keys):
+        """Get the simulation results stored for the given keys.
+
+        Arguments:
+            space (str): quantization space digest.
+            keys (list): quantized circuit variables.
+
+        Returns:
+            dict: simulation results of the keys found in the database.
+        """
+        serialized = {self.serialize_key(key): key for key in keys}
+        names = list(serialized.keys())
+        found = {}
+
+        for idx in range(0, len(names), MAX_QUERY_KEYS):
+            chunk = names[idx:idx + MAX_QUERY_KEYS]
+            query = ("SELECT key, result FROM results WHERE template = ? AND space = ? "
+                     f"AND key IN ({','.join('?' * len(chunk))})")
+
+            for key, result in self.conn.execute(query, [self.template_hash, space] + chunk):
+                found[serialized[key]] = json.loads(result)
+
+        self.hits += len(found)
+
+        return found
+
+    def put(self, space, items):
+        """Store simulation results in bulk (a single transaction).
+
+        Arguments:
+            space (str): quantization space digest.
+            items (list): (key, simulation results) pairs.
+        """
+        rows = [(self.template_hash, space, self.serialize_key(key), json.dumps(res))
+                for key, res in items]
+
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)", rows)
+
+    def close(self):
+        """Close the database."""
+        self.conn.close()
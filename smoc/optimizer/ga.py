@@ -16,15 +16,24 @@
 """NSGA-II genetic algorithm using DEAP."""
 
 import array
-import copy
 import logging
-import math
 import random
 import time
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from types import SimpleNamespace
 
+import numpy as np
 from deap import algorithms, base, creator, tools
 
-from ..util import file
+from ..util.checkpoint import load_checkpoint
+from ..util.timing import PhaseTimer
+from .archive import EvolutionArchive
+from .cache import EvalCache, Quantizer
+from .controller import BatchSizeController
+from .hypervolume import HypervolumeMonitor
+from .penalty import MAX_PENALTY, PenaltyEngine
+from .selection import sel_nsga2, sort_nondominated
+from .surrogate import RBFSurrogate
 
 logger = logging.getLogger('smoc.ga')
 
@@ -37,7 +46,7 @@ class OptimizerNSGA2:
     circuit and simulator independent, requiring only the optimization
     objectives and constraints, and the circuit variables.
     After finishing the optimization, it returns the optimal pareto front
-    and the logbook.
+    and the archive of the evolution.
 
     DEAP source: https://deap.readthedocs.io/en/master/
 
@@ -47,8 +56,8 @@ class OptimizerNSGA2:
         circuit_vars (dict): circuit design variables.
         pop_size (int): population size.
         max_gen (int): max generations.
-        client (handler, optional): client that communicates with the simulator
-            (default: None).
+        client (ServerPool, optional): pool of servers that communicate with
+            the simulator (default: None).
         mut_prob (float, optional): probability of mutation (default: 0.1).
         cx_prob (float, optional): probability of crossover (default: 0.8).
         mut_eta (int, optional): crowding degree of the mutation (default: 20).
@@ -59,12 +68,43 @@ class OptimizerNSGA2:
             individual penalty. Changes the variation rate of the fitness
             penalty with the distance from a valid value (default: 1).
         debug (bool, optional): debug (default: False).
+        cache_size (int, optional): max number of simulation results to keep
+            in the evaluation cache. The cache is disabled if 0 (default: 0).
+        cache_resolution (float or dict, optional): quantization step of the
+            circuit variables used as cache keys, relative to the variables
+            range. A dict maps each variable to its own step (default: 1e-6).
+        database (ResultsDatabase or None, optional): persistent database of
+            simulation results shared across runs (default: None).
+        surrogate_oversample (int, optional): number of candidate offspring
+            generated per offspring to simulate, which are pre-screened with a
+            surrogate model. The pre-screening is disabled if 1 (default: 1).
+        surrogate_top_k (int or None, optional): number of pre-screened
+            offspring to simulate per generation, at most the number of
+            children to produce (the default if None) (default: None).
+        surrogate_samples (int, optional): max number of evaluated individuals
+            used to train the surrogate model (default: 1000).
+        metrics (MetricsRecorder or None, optional): recorder of the metrics
+            of each generation (default: None).
+        stages (list or None, optional): screening stages, simulated in order
+            before the full simulation (dicts with the "name" of the test set
+            in the server and the "constraints" it decides). The individuals
+            that violate the constraints of a stage are not simulated further
+            (default: None).
+        failure_retries (int, optional): number of times a failed offspring
+            (with missing or NaN results) is simulated again, in the next
+            batch, before it's penalized. The individuals simulated again take
+            the place of new offspring in the batch (default: 1).
+        failure_penalty (float, optional): penalty of the failed individuals
+            (default: MAX_PENALTY).
     """
 
     # pylint: disable=too-many-instance-attributes,no-member
     def __init__(self, objectives, constraints, circuit_vars, pop_size, max_gen,
                  client=None, mut_prob=0.1, cx_prob=0.8, mut_eta=20, cx_eta=20,
-                 penalty_delta=2, penalty_weight=1, debug=False):
+                 penalty_delta=2, penalty_weight=1, debug=False, cache_size=0,
+                 cache_resolution=1e-6, database=None, surrogate_oversample=1,
+                 surrogate_top_k=None, surrogate_samples=1000, metrics=None, stages=None,
+                 failure_retries=1, failure_penalty=MAX_PENALTY):
         """Create the NSGA-II Optimizer using the DEAP library."""
         # If debugging we should have a fixed seed to have coherent results
         if debug:
@@ -80,6 +120,19 @@ class OptimizerNSGA2:
         self.max_gen = max_gen
         self.penalty_delta = penalty_delta
         self.penalty_weight = penalty_weight
+        # Constraint handling, compiled once for all evaluations
+        self.penalty = PenaltyEngine(objectives, constraints, penalty_delta, penalty_weight,
+                                     failure_penalty)
+        self.failure_retries = failure_retries
+
+        # Screening stages, simulated in order before the full simulation
+        # (None): the constraints decided by each stage, compiled as above
+        self.stages = []
+        for stage in stages or []:
+            stage_cons = {key: constraints[key] for key in stage['constraints']}
+            self.stages.append((stage['name'], PenaltyEngine({}, stage_cons, penalty_delta,
+                                                             penalty_weight)))
+        self.stages.append((None, None))
 
         if client is not None:
             self.client = client
@@ -92,6 +145,36 @@ class OptimizerNSGA2:
             bound_low.append(float(val[0]))
             bound_up.append(float(val[1]))
 
+        # Create the evaluation cache and the database quantizer
+        self.cache = EvalCache(cache_size) if cache_size > 0 else None
+        self.database = database
+
+        if self.cache is not None or self.database is not None:
+            if isinstance(cache_resolution, dict):
+                cache_resolution = [cache_resolution.get(key, 1e-6) for key in self.circuit_vars]
+            self.quantizer = Quantizer(bound_low, bound_up, cache_resolution, self.circuit_vars)
+        else:
+            self.quantizer = None
+
+        # Create the surrogate model used to pre-screen the offspring
+        self.surrogate_oversample = surrogate_oversample
+        self.surrogate_top_k = surrogate_top_k
+        self.sims_saved = 0
+
+        # Wall time spent in each phase of the optimization, evaluation
+        # counters (since the beginning of the run) and metrics recorder
+        self.timer = PhaseTimer()
+        self.eval_counts = dict(simulations=0, cache_hits=0, cache_misses=0, database_hits=0,
+                                screened_out=0, timeouts=0, retries=0, failures=0, failed=0,
+                                resimulated=0)
+        self.metrics = metrics
+
+        if surrogate_oversample > 1:
+            self.surrogate = RBFSurrogate(bound_low, bound_up, self.penalty.result_names,
+                                          surrogate_samples)
+        else:
+            self.surrogate = None
+
         # Define the Fitness
         fitness_weights = tuple(objectives.values())
         creator.create("FitnessMulti", base.Fitness, weights=fitness_weights)
@@ -111,7 +194,7 @@ class OptimizerNSGA2:
         toolbox.register("population", tools.initRepeat, list, toolbox.individual)
 
         # operator for selecting individuals for breeding the next generation
-        toolbox.register("select", tools.selNSGA2)
+        toolbox.register("select", sel_nsga2)
 
         # register the goal / fitness function
         toolbox.register("evaluate", self.eval_circuit)
@@ -152,133 +235,563 @@ class OptimizerNSGA2:
         handling can be found here:
         TODO: https://METER LINK CONSTRAINT HANDLING
 
+        The penalties and fitnesses are computed for the whole batch at once
+        (see PenaltyEngine). If the evaluation cache is enabled, only the
+        individuals that are not cached are simulated. The individuals
+        rejected by a screening stage only have the results of the stages
+        they were simulated in (see "simulate"). The individuals without
+        results (e.g. their simulations missed every deadline, or the results
+        are incomplete, see "check_results") failed alone: they get the
+        worst-case fitness, and their siblings are evaluated as usual.
+
         Arguments:
             individuals (list): list of individuals to evaluate. The number of
                 individuals in the list is equal to the number of parallel
                 simulations to perform.
 
         Raises:
-            KeyError: If the received response type or format is invalid.
-            TypeError: If the constraints limits are invalid.
+            ValueError: If there's an overflow while computing the penalty.
 
         Returns:
             tuple: individuals' fitness and simulation results.
         """
-        # A list with the variables of all individuals stored in dictionaries
-        variables = []
+        sim_res, misses = self.lookup_results(individuals)
+
+        if misses:
+            # Simulate only the misses, and merge the results in the original
+            # order
+            sim_inds = [individuals[idxs[0]] for idxs in misses.values()]
+            self.merge_results(sim_res, misses, self.simulate(sim_inds))
+
+        # Get the fitnesses (of the whole batch) and simulation results
+        fitnesses, sim_res = self.penalize(sim_res)
+
+        return list(zip(fitnesses, sim_res))
+
+    def penalize(self, sim_res):
+        """Compute the penalized fitnesses of a batch of individuals. The
+        individuals without results (None) failed: they get the worst-case
+        fitness and empty results.
+
+        Arguments:
+            sim_res (list): simulation results of each individual.
+
+        Returns:
+            tuple: fitness and simulation results of each individual.
+        """
+        failed = [res is None for res in sim_res]
+        sim_res = [{} if fail else res for fail, res in zip(failed, sim_res)]
+
+        with self.timer.phase('penalty'):
+            fitnesses = self.penalty.evaluate(sim_res, partial=len(self.stages) > 1,
+                                              failed=failed)
+
+        return fitnesses, sim_res
+
+    def lookup_results(self, individuals):
+        """Look for the simulation results of individuals in the evaluation
+        cache and in the database.
+
+        Arguments:
+            individuals (list): list of individuals.
+
+        Returns:
+            tuple: simulation results of each individual (None if not found),
+                and a dict that maps the key of each individual to simulate to
+                the indexes of the individuals with that key.
+        """
+        # Simulation results of all individuals (None if not available yet)
+        sim_res = [None] * len(individuals)
+
+        # Without cache and database all individuals are simulated
+        if self.quantizer is None:
+            return sim_res, {idx: [idx] for idx in range(len(individuals))}
+
+        # Indexes of the individuals to simulate, grouped by key, so equal
+        # individuals in the same batch are only simulated once
+        misses = {}
+
+        for idx, ind in enumerate(individuals):
+            key = self.quantizer.key(ind)
+
+            if key in misses:
+                misses[key].append(idx)
+                if self.cache is not None:
+                    self.cache.hits += 1
+                continue
+
+            if self.cache is not None:
+                sim_res[idx] = self.cache.get(key)
+
+            if sim_res[idx] is None:
+                misses[key] = [idx]
+
+        # Look for the cache misses in the database before simulating them
+        if misses and self.database is not None:
+            stored = self.database.get(self.quantizer.digest, list(misses.keys()))
+
+            for key, res in stored.items():
+                self.store_result(key, res, misses.pop(key), sim_res)
+
+        return sim_res, misses
+
+    def merge_results(self, sim_res, misses, new_res):
+        """Merge the results of the simulated individuals with the results
+        found in the cache/database. The individuals without results (None)
+        are neither cached nor stored.
+
+        Arguments:
+            sim_res (list): simulation results of each individual (updated).
+            misses (dict): indexes of the simulated individuals, by key.
+            new_res (list): simulation results of each key in "misses".
+        """
+        items = list(zip(misses.keys(), new_res))
+
+        for key, res in items:
+            self.store_result(key, res, misses[key], sim_res)
+
+        # Write the new results to the database in bulk. The results of the
+        # individuals rejected by a screening stage are incomplete, so they
+        # are only cached
+        if self.database is not None:
+            items = [(key, res) for key, res in items if res is not None]
+            if len(self.stages) > 1:
+                items = [(key, res) for key, res in items
+                         if all(name in res for name in self.penalty.result_names)]
+            self.database.put(self.quantizer.digest, items)
+
+    def store_result(self, key, res, idxs, sim_res):
+        """Store the simulation results of a key in the cache, and assign them
+        to the respective individuals.
+
+        Arguments:
+            key (tuple): quantized circuit variables.
+            res (dict or None): simulation results (None if failed).
+            idxs (list): indexes of the individuals with the given key.
+            sim_res (list): simulation results of all individuals.
+        """
+        if res is None:
+            for idx in idxs:
+                sim_res[idx] = None
+            return
+
+        if self.cache is not None:
+            self.cache.put(key, res)
+
+        for idx in idxs:
+            sim_res[idx] = dict(res)
+
+    def simulate(self, individuals):
+        """Simulate individuals in the circuit simulator.
+
+        The individuals are simulated in each screening stage, in order, and
+        only the ones that meet the constraints of the stage go to the next
+        one, and to the full simulation. The results of each stage are merged.
+
+        Arguments:
+            individuals (list): list of individuals to simulate.
+
+        Returns:
+            list: simulation results of each individual (None if failed).
+        """
+        self.eval_counts['simulations'] += len(individuals)
+        variables = self.get_variables(individuals)
+
+        # Run the simulations in the simulation server(s)
+        with self.timer.phase('simulation'):
+            if len(self.stages) == 1:
+                return self.check_results(self.client.evaluate(variables))
+
+            sim_res = [{} for _ in individuals]
+            active = list(range(len(individuals)))
+
+            for stage, engine in self.stages:
+                if not active:
+                    break
+                stage_vars = [variables[idx] for idx in active]
+                if stage is None:
+                    stage_res = self.client.evaluate(stage_vars)
+                else:
+                    stage_res = self.client.evaluate(stage_vars, stage)
+                active = self.screen(stage, engine, active, stage_res, sim_res)
+
+        return sim_res
+
+    def submit_stages(self, individuals):
+        """Submit individuals to the simulation server(s), through all the
+        evaluation stages (see "simulate"), without waiting for the results.
+
+        Arguments:
+            individuals (list): list of individuals to simulate.
+
+        Returns:
+            Future: future with the simulation results of each individual.
+        """
+        self.eval_counts['simulations'] += len(individuals)
+        variables = self.get_variables(individuals)
+
+        future = Future()
+        sim_res = [{} for _ in individuals]
+
+        def run_stage(num, active):
+            """Submit the individuals that passed the previous stages."""
+            stage = self.stages[num][0]
+            stage_vars = [variables[idx] for idx in active]
+            if stage is None:
+                stage_future = self.client.submit(stage_vars)
+            else:
+                stage_future = self.client.submit(stage_vars, stage)
+            stage_future.add_done_callback(lambda done: stage_done(num, active, done))
+
+        def stage_done(num, active, done):
+            """Screen the results of a stage and submit the next one."""
+            try:
+                stage, engine = self.stages[num]
+                active = self.screen(stage, engine, active, done.result(), sim_res)
+                if active and num + 1 < len(self.stages):
+                    run_stage(num + 1, active)
+                else:
+                    future.set_result(sim_res)
+            except Exception as err:  # pylint: disable=broad-except
+                future.set_exception(err)
+
+        run_stage(0, list(range(len(individuals))))
+
+        return future
+
+    def screen(self, stage, engine, active, stage_res, sim_res):
+        """Merge the results of an evaluation stage, and get the individuals
+        that meet its constraints. Missing results (e.g. a failed simulation)
+        don't reject an individual, but the individuals without results of
+        the stage (None) failed, and are not simulated further. The full
+        simulation decides: its incomplete results fail (see "check_results").
+
+        Arguments:
+            stage (str or None): evaluation stage (None for the full
+                simulation).
+            engine (PenaltyEngine or None): constraints of the stage.
+            active (list): indexes of the individuals simulated in the stage.
+            stage_res (list): simulation results of the stage.
+            sim_res (list): simulation results of all individuals (updated).
+
+        Returns:
+            list: indexes of the individuals that go to the next stage.
+        """
+        if engine is None:
+            stage_res = self.check_results(stage_res)
+
+        for idx, res in zip(active, stage_res):
+            if res is None:
+                sim_res[idx] = None
+            else:
+                sim_res[idx].update(res)
+
+        active = [idx for idx in active if sim_res[idx] is not None]
+        stage_res = [res for res in stage_res if res is not None]
+
+        if engine is None:
+            return active
+
+        matrix, missing = engine.partial_matrix(stage_res)
+        passed = engine.penalties(matrix, missing | np.isnan(matrix)) == 0
+
+        rejected = len(active) - int(passed.sum())
+        self.eval_counts['screened_out'] += rejected
+        logger.info("Stage %s: %d of %d individuals rejected", stage, rejected, len(active))
+
+        return [idx for idx, ok in zip(active, passed.tolist()) if ok]
+
+    def check_results(self, sim_res):
+        """Check the results of the full simulation. The individuals with
+        missing or NaN objectives/constraints (e.g. a design that doesn't
+        converge) failed: their results are replaced by None, so they're
+        neither cached nor stored, and don't fail the whole batch.
+
+        Arguments:
+            sim_res (list): simulation results of each individual.
+
+        Returns:
+            list: simulation results of each individual (None if failed).
+        """
+        idxs = [idx for idx, res in enumerate(sim_res) if res is not None]
+        incomplete = self.penalty.incomplete([sim_res[idx] for idx in idxs])
+        failed = [idx for idx, fail in zip(idxs, incomplete) if fail]
+
+        if not failed:
+            return sim_res
+
+        logger.info("%d of %d individuals failed (missing or NaN results)", len(failed),
+                    len(idxs))
+        self.eval_counts['failed'] += len(failed)
+
+        sim_res = list(sim_res)
+        for idx in failed:
+            sim_res[idx] = None
+
+        return sim_res
+
+    def hold_failed(self, individuals, retried=()):
+        """Hold the evaluated individuals that failed (without results), to
+        simulate them again in the next batch, up to "failure_retries" times.
+        The fitness of the held individuals is invalidated.
+
+        Arguments:
+            individuals (list): evaluated individuals.
+            retried (list, optional): individuals simulated again in this
+                batch, and their previous number of failures (default: ()).
+
+        Returns:
+            tuple: the other individuals, and the held individuals with their
+                number of failures.
+        """
+        if not self.failure_retries:
+            return individuals, []
+
+        failures = {id(ind): num for ind, num in retried}
+        kept = []
+        held = []
 
-        # Map the individual variables values to a dictionary with the
-        # respective variable value and name
         for ind in individuals:
-            variables.append({key: ind[idx] for idx, key in enumerate(self.circuit_vars)})
+            num = 0 if ind.result else failures.get(id(ind), 0) + 1
+            if 0 < num <= self.failure_retries:
+                del ind.fitness.values
+                held.append((ind, num))
+            else:
+                kept.append(ind)
 
-        # Send the request to the server
-        req = dict(type='updateAndRun', data=variables)
-        self.client.send_data(req)
-        # Wait for data from server
-        res = self.client.recv_data()
+        self.eval_counts['resimulated'] += len(held)
+
+        return kept, held
+
+    def get_variables(self, individuals):
+        """Map the variables of each individual to a dictionary with the
+        respective variable name and value.
+
+        Arguments:
+            individuals (list): list of individuals.
+
+        Returns:
+            list: circuit variables of each individual.
+        """
+        return [{key: ind[idx] for idx, key in enumerate(self.circuit_vars)}
+                for ind in individuals]
+
+    def log_generation(self, total_time, num_sims, label="generation"):
+        """Log the elapsed time and the evaluation counters of a generation.
+
+        Arguments:
+            total_time (float): generation elapsed time, in seconds.
+            num_sims (int): number of evaluated individuals.
+            label (str, optional): what was finished (default: "generation").
+        """
+        mins, secs = divmod(total_time, 60)
+        hours, mins = divmod(mins, 60)
+        msg = f"Finished {label}. "
+        msg += f"Elapsed time: {hours:02.0f}h{mins:02.0f}m{secs:02.0f}s | "
+        secs = total_time / max(num_sims, 1)
+        mins, secs = divmod(secs, 60)
+        msg += f"avg: {mins:02.0f}m{secs:02.2f}s/ind"
+
+        if self.cache is not None:
+            msg += f" | cache: {self.cache.hits} hits/{self.cache.misses} misses"
+            self.eval_counts['cache_hits'] += self.cache.hits
+            self.eval_counts['cache_misses'] += self.cache.misses
+            self.cache.reset_counters()
+
+        if self.database is not None:
+            msg += f" | database: {self.database.hits} hits"
+            self.eval_counts['database_hits'] += self.database.hits
+            self.database.hits = 0
+
+        # Requests that missed the deadline, and resubmitted/failed simulations
+        stragglers = getattr(getattr(self, 'client', None), 'stragglers', None)
+        if stragglers:
+            if any(stragglers.values()):
+                msg += (f" | timeouts: {stragglers['timeouts']}, retries: "
+                        f"{stragglers['retries']}, failures: {stragglers['failures']}")
+            for key in stragglers:
+                self.eval_counts[key] += stragglers[key]
+                stragglers[key] = 0
+
+        logger.info(msg + "\n")
+
+    def straggler_counts(self):
+        """Get the number of requests that missed the deadline, of
+        resubmitted and failed simulations, and of failed and resimulated
+        individuals, since the beginning of the run.
+
+        Returns:
+            dict: straggler counters.
+        """
+        stragglers = getattr(getattr(self, 'client', None), 'stragglers', None) or {}
+
+        return {key: self.eval_counts[key] + stragglers.get(key, 0)
+                for key in ('timeouts', 'retries', 'failures', 'failed', 'resimulated')}
+
+    def record_metrics(self, **fields):
+        """Record the metrics of a generation (if there's a metrics recorder):
+        the time of each phase and of the communication with the servers, the
+        bytes sent and received and the evaluation counters.
+
+        Arguments:
+            **fields: other fields of the record (e.g. gen, evals).
+        """
+        if self.metrics is None:
+            return
+
+        counters = dict(phases=dict(self.timer.totals), counts=dict(self.eval_counts))
+
+        # Communication counters (if the client measures them)
+        stats = getattr(getattr(self, 'client', None), 'stats', None)
+        if stats is not None:
+            counters['client'], bytes_counts = stats()
+            counters['counts'].update(bytes_counts)
+
+        self.metrics.record(counters, **fields)
+
+    def prescreen(self, candidates, k):
+        """Select the most promising candidate offspring to simulate.
+
+        The simulation results of the candidates not evaluated yet are
+        predicted with the surrogate model. The candidates are then ranked by
+        their (predicted) non-domination rank, and by their (predicted)
+        constraints penalty.
+
+        Arguments:
+            candidates (list): candidate offspring.
+            k (int): number of offspring to select.
+
+        Returns:
+            list: selected offspring.
+        """
+        invalid_inds = [ind for ind in candidates if not ind.fitness.valid]
+        predictions = self.surrogate.predict(invalid_inds) if invalid_inds else []
+        predicted = {id(ind): res for ind, res in zip(invalid_inds, predictions)}
+
+        results = [predicted.get(id(ind), ind.result) for ind in candidates]
 
         try:
-            res_type = res['type']
-            sim_res = res['data']
-        except KeyError as err:
-            logger.error(err)
-
-        if res_type != 'updateAndRun':
-            raise KeyError("Simulation error!!! Check variables defaults, etc.")
-
-        results = []
-
-        # Get the fitnesses and simulation results for all individuals
-        for idx in range(len(individuals)):
-            fitness = []    # Fitnesses of one individual
-            pen = 0         # Fitness Penalty
-
-            sim_res_ind = sim_res[idx]  # Simulation results of one individual
-
-            if self.constraints:
-                for key, val in self.constraints.items():
-                    # Try to compute the penalty (if constraint has two limits)
-                    try:
-                        # Try to convert the values to float
-                        val_0 = float(val[0])
-                        val_1 = float(val[1])
-
-                        # Normalize the simulation result
-                        if val_0 != val_1:
-                            res_norm = (sim_res_ind[key] - val_0) / (val_1 - val_0)
-                            # Check the limits
-                            if res_norm < 0:
-                                pen += self.penalty_delta - res_norm
-                            elif res_norm > 1:
-                                pen += self.penalty_delta + (res_norm - 1)
-                        # If the limits are equal
-                        elif val_0 == val_1 and sim_res_ind[key] != val_0:
-                            pen += self.penalty_delta + math.fabs(sim_res_ind[key] - val_0)
-
-                    # If contraint only has one limit
-                    except ValueError:
-                        # True - defined, false - undefined
-                        limit = [True, True]
-
-                        for lim, value in enumerate(val):
-                            try:
-                                # Get the constraint value and normalize it
-                                res_norm = (sim_res_ind[key] / float(value)) - 1
-                            # If can't convert to float, the limit is not defined
-                            except ValueError:
-                                limit[lim] = False
-
-                        # If founds two limits, it should be handled in the previous 'try'
-                        if limit[0] and limit[1]:
-                            raise TypeError("Both limits exist.. it shouldn't be here!!!")
-
-                        # If constraint has maximum allowed value
-                        if not limit[0] and res_norm > 0:
-                            pen += self.penalty_delta + res_norm
-
-                        # If constraint has minimum allowed value
-                        elif not limit[1] and res_norm < 0:
-                            pen += self.penalty_delta - res_norm
-
-            for key, val in self.objectives.items():
-                try:
-                    # Add the penalty weight to penalty
-                    penalty = pen * self.penalty_weight
-
-                    # Avoid overflow problems
-                    if penalty > 500:
-                        penalty = 500
-
-                    # If the fitness is to maximize, change the penalty signal
-                    if val > 0:
-                        penalty = -penalty
-
-                    tot_penalty = math.exp(self.penalty_weight*penalty)
-
-                    # Get the simulation result
-                    result = sim_res_ind[key]
-
-                    # If the simulation result is negative, invert the penalty
-                    if result < 0:
-                        tot_penalty = 1 / tot_penalty
-
-                    fitness.append(result * tot_penalty)
-                except KeyError as err:
-                    raise KeyError(
-                        f"Eval circuit: there's no key {err} in the simulation results.")
-                except OverflowError as err:
-                    raise ValueError(f"Overflow error while evaluating the circuit: {err}")
-
-            results.append((fitness, sim_res_ind))
-
-            #print("FITNESS:", fitness)
-            #print("SIM RES:", sim_res_ind)
-
-        return results
-
-    def ga_mu_plus_lambda(self, mu, lambda_, checkpoint_load, checkpoint_fname,
-                          checkpoint_freq, sel_best, verbose):
+            matrix = self.penalty.results_matrix(results)
+            penalties = self.penalty.penalties(matrix)
+            fitnesses = self.penalty.fitnesses(matrix, penalties)
+        except (KeyError, ValueError) as err:
+            logger.warning("Surrogate pre-screening: can't score the candidates (%s)", err)
+            return candidates[:k]
+
+        scored = []
+        failed = []
+
+        for idx, ind in enumerate(candidates):
+            # Candidates that can't be scored are the last ones to select
+            if not (np.isfinite(penalties[idx]) and np.isfinite(fitnesses[idx]).all()):
+                failed.append(idx)
+                continue
+
+            fitness = creator.FitnessMulti()
+            if ind.fitness.valid:
+                fitness.values = ind.fitness.values
+            else:
+                fitness.values = fitnesses[idx].tolist()
+
+            scored.append(SimpleNamespace(fitness=fitness, penalty=penalties[idx], idx=idx))
+
+        ranked = []
+        for rank, front in enumerate(sort_nondominated(scored, len(scored))):
+            ranked.extend((rank, item.penalty, item.idx) for item in front)
+
+        order = [idx for _, _, idx in sorted(ranked)] + failed
+        offspring = [candidates[idx] for idx in order[:k]]
+
+        # Simulations saved, i.e. candidates that are not simulated
+        saved = len(invalid_inds) - sum(1 for ind in offspring if not ind.fitness.valid)
+        self.sims_saved += saved
+
+        logger.info("Surrogate pre-screening: %d candidates | simulations saved: %d (total: %d)",
+                    len(candidates), saved, self.sims_saved)
+
+        return offspring
+
+    def train_surrogate(self, individuals):
+        """Add evaluated individuals to the surrogate model and retrain it.
+
+        Arguments:
+            individuals (list): evaluated individuals.
+        """
+        if self.surrogate is not None:
+            with self.timer.phase('surrogate'):
+                self.surrogate.add_samples(individuals)
+                self.surrogate.fit()
+
+    def print_best(self, population, sel_best):
+        """Print the best individuals of a population.
+
+        Arguments:
+            population (list): population.
+            sel_best (int): number of best individuals to print.
+        """
+        print(f"---- Best {sel_best} individuals of this generation ----")
+
+        best_inds = tools.selBest(population, sel_best)
+
+        for i, ind in enumerate(best_inds):
+            print(f"Ind #{i + 1} => ", end='')
+
+            # Circuit variables/parameters
+            formatted_params = [
+                f"{key}: {ind[idx]:0.2g}" for idx, key in enumerate(self.circuit_vars)
+            ]
+            print(' | '.join(formatted_params))
+
+            # Fitness
+            print("\t  Fitness -> ", end='')
+            formatted_fits = [
+                f"{key}: {ind.fitness.values[idx]:0.2g}"
+                for idx, key in enumerate(list(self.objectives.keys()))
+            ]
+            print(' | '.join(formatted_fits))
+
+            # Simulation results
+            print("\t  Results -> ", end='')
+            formatted_res = [
+                f"{key}: {val:0.2g}"
+                for key, val in ind.result.items()
+            ]
+            print(' | '.join(formatted_res))
+        print("")
+
+    @staticmethod
+    def load_archive(cp, archive_dir):
+        """Get the archive of the evolution stored in a checkpoint.
+
+        Arguments:
+            cp (dict): checkpoint.
+            archive_dir (str or None): directory of the archive, used if the
+                checkpoint has a logbook (previous versions) instead.
+
+        Returns:
+            EvolutionArchive: the archive of the evolution.
+        """
+        if 'archive' in cp:
+            return cp['archive']
+
+        return EvolutionArchive.from_logbook(cp['logbook'], archive_dir)
+
+    def warm_up_cache(self, population):
+        """Store the results of an evaluated population in the evaluation cache.
+        The individuals with failed or incomplete results are not stored.
+
+        Arguments:
+            population (list): evaluated population.
+        """
+        if self.cache is not None:
+            incomplete = self.penalty.incomplete([ind.result for ind in population])
+            for ind, skip in zip(population, incomplete):
+                if ind.result and not skip:
+                    self.cache.put(self.quantizer.key(ind), ind.result)
+
+    def ga_mu_plus_lambda(self, mu, lambda_, checkpoint_load, checkpoints,
+                          checkpoint_freq, sel_best, verbose, archive_dir=None,
+                          lambda_bounds=None, early_stop=None, migration=None):
         """The (mu + lambda) evolutionary algorithm.
 
         Adapted from: https://github.com/DEAP/deap/blob/master/deap/algorithms.py
@@ -296,38 +809,82 @@ class OptimizerNSGA2:
         offspring are then evaluated and the next generation population is
         selected from both the offspring and the population. Finally, when
         "max_gen" generations are done, the algorithm returns a tuple with the
-        final population and a "deap.tools.Logbook" of the evolution.
+        final population and the archive of the evolution.
+        The hypervolume of the feasible pareto front is archived at each
+        generation. If "early_stop" is given, the evolution also stops (with
+        a final checkpoint) when the hypervolume converges. If "migration" is
+        given (island model), it's called after the selection of each
+        generation to exchange individuals with the other islands. The failed
+        offspring (see "hold_failed") are not selected, but simulated again
+        with the offspring of the next generation.
         This function expects "toolbox.mate", "toolbox.mutate", "toolbox.select",
         and "toolbox.evaluate" aliases to be registered in the toolbox.
 
         Arguments:
             mu (float): number of individuals to select for the next generation.
             lambda_ (int): number of children to produce at each generation.
-            checkpoint_load (str or None): checkpoint file to load, if provided.
-            checkpoint_fname (str): name of the checkpoint file to save.
+            checkpoint_load (str or None): checkpoint (file or directory) to
+                load, if provided.
+            checkpoints (CheckpointStore): store of the checkpoints to save.
             checkpoint_freq (str): checkpoint saving frequency (relative to gen).
             sel_best (int): number of best individuals to log at each generation.
             verbose (bool): run in verbosity mode.
+            archive_dir (str or None, optional): directory where the archive of
+                the evolution is written. If None, it's kept in memory
+                (default: None).
+            lambda_bounds (tuple or None, optional): min and max number of
+                children per generation. If given, "lambda_" is tuned to the
+                measured simulation throughput (default: None).
+            early_stop (tuple or None, optional): window (generations) and
+                tolerance of the relative improvement of the hypervolume. If
+                given, the evolution stops when the improvement is less than
+                the tolerance (default: None).
+            migration (Migration or None, optional): called with the generation
+                and the selected population, returns the population with the
+                immigrants. A checkpoint is also saved at each migration
+                generation (default: None).
 
         Returns:
-            tuple: final population and the logbook of the evolution.
+            tuple: final population and the archive of the evolution.
         """
-        # Create the statistics
-        stats_pop = tools.Statistics()
-        stats_fit = tools.Statistics(key=lambda ind: ind.fitness.values)
-        stats_res = tools.Statistics(key=lambda ind: ind.result)
-        stats = tools.MultiStatistics(population=stats_pop, fitness=stats_fit, result=stats_res)
-        stats.register("value", copy.deepcopy)
+        # Adaptive number of children per generation
+        if lambda_bounds is not None:
+            controller = BatchSizeController(lambda_, *lambda_bounds)
+            lambda_ = controller.size
+            logger.info("Adaptive lambda in [%d, %d], starting with %d",
+                        controller.low, controller.high, lambda_)
+        else:
+            controller = None
+
+        # Hypervolume of the feasible pareto front, and convergence detection
+        monitor = HypervolumeMonitor(self.penalty, self.objectives, self.constraints,
+                                     *(early_stop or ()))
 
         # If a checkpoint is provided, continue from the given generation
         if checkpoint_load:
             # Load the dictionary from the pickled file
-            cp = file.read_pickle(checkpoint_load)
+            cp = load_checkpoint(checkpoint_load)
             # Load the stored parameters
             population = cp['population']
             start_gen = cp['generation'] + 1
-            logbook = cp['logbook']
+            archive = self.load_archive(cp, archive_dir)
             random.setstate(cp['rnd_state'])
+
+            if controller is not None and cp.get('batch_control') is not None:
+                controller.load_state(cp['batch_control'])
+                lambda_ = controller.size
+
+            if cp.get('hypervolume') is not None:
+                monitor.load_state(cp['hypervolume'])
+
+            self.eval_counts.update(cp.get('stragglers', {}))
+            resimulate = cp.get('resimulate', [])
+
+            # Warm up the evaluation cache and the surrogate model with the
+            # evaluated individuals
+            self.warm_up_cache(population)
+            self.train_surrogate(population)
+
             logger.info("Running from a checkpoint!")
             logger.info("-- Population size: %d", len(population))
             logger.info("-- Current generation: %d\n", start_gen)
@@ -335,10 +892,10 @@ class OptimizerNSGA2:
         else:  # Create the population
             population = self.toolbox.population(n=self.pop_size)
             start_gen = 1
+            resimulate = []
 
-            # Create the logbook
-            logbook = tools.Logbook()
-            logbook.header = 'gen', 'evals', 'population', 'fitness', 'result'
+            # Create the archive of the evolution
+            archive = EvolutionArchive(archive_dir)
 
             # Get the individuals that are not evaluated
             invalid_inds = [ind for ind in population if not ind.fitness.valid]
@@ -353,35 +910,54 @@ class OptimizerNSGA2:
             start_time = time.time()
 
             # Evaluate the individuals with an invalid fitness
-            results = self.toolbox.evaluate(invalid_inds)
+            with self.timer.phase('evaluation'):
+                results = self.toolbox.evaluate(invalid_inds)
 
-            for ind, res_ind in zip(invalid_inds, results):
-                ind.fitness.values = res_ind[0]
-                ind.result = res_ind[1]
+                for ind, res_ind in zip(invalid_inds, results):
+                    ind.fitness.values = res_ind[0]
+                    ind.result = res_ind[1]
 
             # Assign the crowding distance to the individuals (no selection is done)
-            population = self.toolbox.select(population, len(population))
+            with self.timer.phase('selection'):
+                population = self.toolbox.select(population, len(population))
 
-            record = stats.compile(population)
-            logbook.record(gen=0, evals=num_sims, **record)
+            # Train the surrogate model
+            self.train_surrogate(invalid_inds)
+
+            with self.timer.phase('statistics'):
+                volume = monitor.update(population)
+                archive.record(population, gen=0, evals=num_sims, hypervolume=volume)
 
             # Evaluation time
-            total_time = time.time() - start_time
-            mins, secs = divmod(total_time, 60)
-            hours, mins = divmod(mins, 60)
-            msg = f"Finished generation. Elapsed time: {hours:02.0f}h{mins:02.0f}m{secs:02.0f}s"
-            secs = total_time / num_sims
-            mins, secs = divmod(secs, 60)
-            msg += f" | avg: {mins:02.0f}m{secs:02.2f}s/ind\n"
-            logger.info(msg)
+            self.log_generation(time.time() - start_time, num_sims)
+            self.record_metrics(gen=0, evals=num_sims)
 
         print("====================== Starting Optimization ======================\n")
 
         # Begin the generational process
         for gen in range(start_gen, self.max_gen + 1):
-            # Vary the population
-            offspring = algorithms.varOr(population, self.toolbox, lambda_, self.cx_prob,
-                                         self.mut_prob)
+            # The failed offspring of the previous generation are simulated
+            # again, in the place of new offspring (the batch never exceeds
+            # "lambda_", the number of test slots loaded in the simulator)
+            retried, waiting = resimulate[:lambda_], resimulate[lambda_:]
+            num_children = lambda_ - len(retried)
+
+            # Vary the population. If the surrogate model is trained, generate
+            # more candidates and simulate only the most promising ones
+            if self.surrogate is not None and self.surrogate.centers is not None:
+                with self.timer.phase('variation'):
+                    candidates = algorithms.varOr(population, self.toolbox,
+                                                  num_children * self.surrogate_oversample,
+                                                  self.cx_prob, self.mut_prob)
+                with self.timer.phase('prescreen'):
+                    top_k = min(self.surrogate_top_k or num_children, num_children)
+                    offspring = self.prescreen(candidates, top_k)
+            else:
+                with self.timer.phase('variation'):
+                    offspring = algorithms.varOr(population, self.toolbox, num_children,
+                                                 self.cx_prob, self.mut_prob)
+
+            offspring += [ind for ind, _ in retried]
 
             # Evaluate the individuals with an invalid fitness
             invalid_inds = [ind for ind in offspring if not ind.fitness.valid]
@@ -397,89 +973,393 @@ class OptimizerNSGA2:
             start_time = time.time()
 
             # Evaluate the individuals with an invalid fitness
-            results = self.toolbox.evaluate(invalid_inds)
+            with self.timer.phase('evaluation'):
+                results = self.toolbox.evaluate(invalid_inds)
+
+                for ind, res_ind in zip(invalid_inds, results):
+                    ind.fitness.values = res_ind[0]
+                    ind.result = res_ind[1]
+
+                # Hold the failed offspring for the next generation
+                invalid_inds, held = self.hold_failed(invalid_inds, retried)
+                resimulate = waiting + held
+                offspring = [ind for ind in offspring if ind.fitness.valid]
+
+            # Tune the number of children of the next generation to the
+            # measured throughput
+            if controller is not None:
+                lambda_ = controller.update(num_sims, time.time() - start_time)
+
+            # Retrain the surrogate model with the new individuals
+            self.train_surrogate(invalid_inds)
+
+            # Archive the population, with the hypervolume of the front of the
+            # evaluated individuals (parents and offspring)
+            with self.timer.phase('statistics'):
+                volume = monitor.update(population + offspring)
+                archive.record(population, gen=gen, evals=num_sims, hypervolume=volume)
+
+            # Save a checkpoint of the evolution (and at each migration, to
+            # resume the islands from the same generation)
+            if gen % checkpoint_freq == 0 or (migration is not None and migration.due(gen)):
+                with self.timer.phase('checkpoint'):
+                    checkpoints.save(self.generation_checkpoint(gen, population, archive,
+                                                                controller, monitor,
+                                                                resimulate))
+
+            with self.timer.phase('print_best'):
+                # Evaluation time
+                self.log_generation(time.time() - start_time, num_sims)
+
+                # Show the best individuals of each generation
+                self.print_best(population, sel_best)
 
-            for ind, res_ind in zip(invalid_inds, results):
-                ind.fitness.values = res_ind[0]
-                ind.result = res_ind[1]
+            # Select the next generation population
+            with self.timer.phase('selection'):
+                population[:] = self.toolbox.select(population + offspring, mu)
 
-            # Update the statistics with the population
-            record = stats.compile(population)
-            logbook.record(gen=gen, evals=num_sims, **record)
+            # Exchange individuals with the other islands
+            if migration is not None:
+                with self.timer.phase('migration'):
+                    population[:] = migration(gen, population)
 
-            # Save a checkpoint of the evolution
-            if gen % checkpoint_freq == 0:
-                cp = dict(generation=gen, population=population, logbook=logbook,
-                          rnd_state=random.getstate())
-                file.write_pickle(checkpoint_fname, cp)
+            self.record_metrics(gen=gen, evals=num_sims)
 
-            # Evaluation time
-            total_time = time.time() - start_time
-            mins, secs = divmod(total_time, 60)
-            hours, mins = divmod(mins, 60)
-            msg = f"Finished generation. "
-            msg += f"Elapsed time: {hours:02.0f}h{mins:02.0f}m{secs:02.0f}s | "
-            secs = total_time / num_sims
-            mins, secs = divmod(secs, 60)
-            msg += f"avg: {mins:02.0f}m{secs:02.2f}s/ind\n"
-            logger.info(msg)
+            # Stop if the hypervolume converged, with a checkpoint of the
+            # selected population
+            if monitor.converged():
+                logger.info("The hypervolume converged at generation %d (%.6g). "
+                            "Stopping the optimization.", gen, volume)
+                with self.timer.phase('checkpoint'):
+                    checkpoints.save(self.generation_checkpoint(gen, population, archive,
+                                                                controller, monitor,
+                                                                resimulate))
+                break
 
-            # Show the best individuals of each generation
-            print(f"---- Best {sel_best} individuals of this generation ----")
-
-            best_inds = tools.selBest(population, sel_best)
-
-            for i, ind in enumerate(best_inds):
-                print(f"Ind #{i + 1} => ", end='')
-
-                # Circuit variables/parameters
-                formatted_params = [
-                    f"{key}: {ind[idx]:0.2g}" for idx, key in enumerate(self.circuit_vars)
-                ]
-                print(' | '.join(formatted_params))
-
-                # Fitness
-                print("\t  Fitness -> ", end='')
-                formatted_fits = [
-                    f"{key}: {ind.fitness.values[idx]:0.2g}"
-                    for idx, key in enumerate(list(self.objectives.keys()))
-                ]
-                print(' | '.join(formatted_fits))
-
-                # Simulation results
-                print("\t  Results -> ", end='')
-                formatted_res = [
-                    f"{key}: {val:0.2g}"
-                    for key, val in ind.result.items()
-                ]
-                print(' | '.join(formatted_res))
-            print("")
+        archive.flush()
 
-            # Select the next generation population
-            population[:] = self.toolbox.select(population + offspring, mu)
+        return population, archive
+
+    def generation_checkpoint(self, gen, population, archive, controller, monitor,
+                              resimulate):
+        """Create the checkpoint of a generation of the (mu + lambda)
+        algorithm.
+
+        Arguments:
+            gen (int): generation.
+            population (list): population.
+            archive (EvolutionArchive): archive of the evolution.
+            controller (BatchSizeController or None): adaptive lambda.
+            monitor (HypervolumeMonitor): hypervolume of each generation.
+            resimulate (list): failed offspring to simulate again, and their
+                number of failures.
+
+        Returns:
+            dict: checkpoint.
+        """
+        cp = dict(generation=gen, population=population, archive=archive,
+                  rnd_state=random.getstate(), hypervolume=monitor.state(),
+                  stragglers=self.straggler_counts(), resimulate=resimulate)
+        if controller is not None:
+            cp['batch_control'] = controller.state()
+
+        return cp
+
+    def assign_results(self, individuals, sim_res, retried=()):
+        """Set the fitnesses and results of the individuals of a request. The
+        failed individuals are held to be simulated again (see "hold_failed").
+
+        Arguments:
+            individuals (list): simulated individuals.
+            sim_res (list): simulation results of each individual.
+            retried (list, optional): individuals simulated again, and their
+                previous number of failures (default: ()).
+
+        Returns:
+            tuple: the evaluated individuals, and the held individuals with
+                their number of failures.
+        """
+        fitnesses, sim_res = self.penalize(sim_res)
+
+        for ind, fit, sim_res_ind in zip(individuals, fitnesses, sim_res):
+            ind.fitness.values = fit
+            ind.result = sim_res_ind
+
+        return self.hold_failed(individuals, retried)
+
+    def insert_individuals(self, population, individuals, mu):
+        """Insert evaluated individuals in the population, one at a time, with
+        an incremental NSGA-II replacement.
+
+        Selecting "mu" individuals from the population plus the new individual
+        removes the individual of the last front with the lowest crowding
+        distance (which can be the new individual).
+
+        Arguments:
+            population (list): population (updated in place).
+            individuals (list): individuals to insert.
+            mu (int): population size after each insertion.
+        """
+        for ind in individuals:
+            population[:] = self.toolbox.select(population + [ind], mu)
+
+    # pylint: disable=too-many-statements
+    def ga_steady_state(self, mu, lambda_, in_flight, batch_size, checkpoint_load,
+                        checkpoints, checkpoint_freq, sel_best, verbose, archive_dir=None,
+                        early_stop=None):
+        """The asynchronous steady-state (mu + 1) evolutionary algorithm.
+
+        Contrary to "ga_mu_plus_lambda", it never waits for a whole generation.
+        There are always "in_flight" requests of "batch_size" offspring being
+        simulated. As soon as a request finishes, each returned individual is
+        inserted in the population with an incremental NSGA-II replacement,
+        and new offspring are generated and submitted right away. The
+        offspring with cached results are inserted without simulation.
+
+        The archive and the checkpoints work by evaluation count: the
+        population is archived every "lambda_" insertions (simulated or
+        cached), with the hypervolume of its feasible pareto front, and a
+        checkpoint is saved every "checkpoint_freq" records. The optimization
+        ends after "max_gen * lambda_" evaluations, like the generational
+        algorithm, or when the hypervolume converges if "early_stop" is given.
+        The individuals being simulated when a checkpoint is saved are not
+        stored. The failed offspring are submitted again in the next request,
+        and only count as evaluations when they're inserted.
 
-        return population, logbook
+        Arguments:
+            mu (int): population size.
+            lambda_ (int): number of evaluations between two records.
+            in_flight (int): number of requests being simulated.
+            batch_size (int): number of offspring per request.
+            checkpoint_load (str or None): checkpoint (file or directory) to
+                load, if provided.
+            checkpoints (CheckpointStore): store of the checkpoints to save.
+            checkpoint_freq (str): checkpoint saving frequency (relative to the
+                number of records).
+            sel_best (int): number of best individuals to log at each record.
+            verbose (bool): run in verbosity mode.
+            archive_dir (str or None, optional): directory where the archive of
+                the evolution is written. If None, it's kept in memory
+                (default: None).
+            early_stop (tuple or None, optional): window (records) and
+                tolerance of the relative improvement of the hypervolume. If
+                given, the evolution stops when the improvement is less than
+                the tolerance (default: None).
+
+        Returns:
+            tuple: final population and the archive of the evolution.
+        """
+        # Hypervolume of the feasible pareto front, and convergence detection
+        monitor = HypervolumeMonitor(self.penalty, self.objectives, self.constraints,
+                                     *(early_stop or ()))
 
-    def run_ga(self, checkpoint_fname, mu=None, lambda_=None, checkpoint_load=None,
-               checkpoint_freq=1, sel_best=5, verbose=True):
-        """Wrapper for the "ga_mu_plus_lambda" function.
+        # If a checkpoint is provided, continue from the given evaluation
+        if checkpoint_load:
+            cp = load_checkpoint(checkpoint_load)
+            population = cp['population']
+            # A generational checkpoint is converted to evaluations
+            if 'evaluations' in cp:
+                evals = cp['evaluations']
+            else:
+                evals = cp['generation'] * lambda_
+            archive = self.load_archive(cp, archive_dir)
+            random.setstate(cp['rnd_state'])
+            if cp.get('hypervolume') is not None:
+                monitor.load_state(cp['hypervolume'])
+            self.eval_counts.update(cp.get('stragglers', {}))
+            resimulate = cp.get('resimulate', [])
+            evaluated = cp.get('evaluated', [])
+
+            # Warm up the evaluation cache with the evaluated individuals
+            self.warm_up_cache(population)
+
+            logger.info("Running from a checkpoint!")
+            logger.info("-- Population size: %d", len(population))
+            logger.info("-- Current evaluation: %d\n", evals)
+
+        else:  # Create the population
+            population = self.toolbox.population(n=self.pop_size)
+            evals = 0
+            resimulate = []
+            evaluated = []
+
+            # Create the archive of the evolution
+            archive = EvolutionArchive(archive_dir)
+
+            logger.info("Starting the initial evaluation | evaluations: %d", len(population))
+            start_time = time.time()
+
+            # Evaluate the initial population
+            with self.timer.phase('evaluation'):
+                results = self.toolbox.evaluate(population)
+
+                for ind, res_ind in zip(population, results):
+                    ind.fitness.values = res_ind[0]
+                    ind.result = res_ind[1]
+
+            # Assign the crowding distance to the individuals (no selection is done)
+            with self.timer.phase('selection'):
+                population = self.toolbox.select(population, len(population))
+
+            with self.timer.phase('statistics'):
+                volume = monitor.update(population)
+                archive.record(population, evals=evals, hypervolume=volume)
+
+            self.log_generation(time.time() - start_time, len(population))
+            self.record_metrics(evals=evals)
+
+        print("============= Starting Optimization (steady-state mode) ===========\n")
+
+        max_evals = self.max_gen * lambda_
+        # Submitted requests: future -> (individuals, results, misses, retried)
+        pending = {}
+        # Submitted evaluations, including the evaluated individuals not
+        # inserted yet
+        submitted = evals + len(evaluated)
+        # Number of evaluations of the next record
+        next_record = (evals // lambda_ + 1) * lambda_
+        start_time = time.time()
+        start_evals = evals
+        converged = False
+
+        while (evals < max_evals or pending) and not converged:
+            # Keep "in_flight" requests in the simulation servers. The cached
+            # offspring are inserted before generating more
+            while len(pending) < in_flight and submitted < max_evals and not evaluated:
+                # The failed offspring are submitted first
+                size = min(batch_size, max_evals - submitted)
+                retried, resimulate = resimulate[:size], resimulate[size:]
+                with self.timer.phase('variation'):
+                    offspring = algorithms.varOr(population, self.toolbox, size - len(retried),
+                                                 self.cx_prob, self.mut_prob)
+                # Offspring reproduced without variation are not evaluated
+                invalid_inds = [ind for ind, _ in retried]
+                invalid_inds += [ind for ind in offspring if not ind.fitness.valid]
+                submitted += len(invalid_inds)
+
+                with self.timer.phase('evaluation'):
+                    sim_res, misses = self.lookup_results(invalid_inds)
+
+                    if misses:
+                        sim_inds = [invalid_inds[idxs[0]] for idxs in misses.values()]
+                        future = self.submit_stages(sim_inds)
+                        pending[future] = (invalid_inds, sim_res, misses, retried)
+                    else:  # All results are cached
+                        inds, held = self.assign_results(invalid_inds, sim_res, retried)
+                        evaluated += inds
+                        submitted -= len(held)
+                        resimulate += held
+
+            # Wait for (at least) one request, unless there are cached
+            # individuals to insert
+            if pending and not evaluated:
+                with self.timer.phase('simulation'):
+                    done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    invalid_inds, sim_res, misses, retried = pending.pop(future)
+                    with self.timer.phase('evaluation'):
+                        self.merge_results(sim_res, misses, future.result())
+                        inds, held = self.assign_results(invalid_inds, sim_res, retried)
+                    evaluated += inds
+                    submitted -= len(held)
+                    resimulate += held
+
+            # Insert the evaluated individuals, with a record every "lambda_"
+            # insertions
+            while evaluated and not converged:
+                num = min(len(evaluated), next_record - evals)
+                with self.timer.phase('selection'):
+                    self.insert_individuals(population, evaluated[:num], mu)
+                evaluated = evaluated[num:]
+                evals += num
+
+                if evals < next_record:
+                    break
+
+                # Archive the population
+                with self.timer.phase('statistics'):
+                    volume = monitor.update(population)
+                    archive.record(population, evals=evals, hypervolume=volume)
+                converged = monitor.converged()
+
+                # Save a checkpoint of the evolution (and of the converged one)
+                if (next_record // lambda_) % checkpoint_freq == 0 or converged:
+                    with self.timer.phase('checkpoint'):
+                        cp = dict(evaluations=evals, population=population, archive=archive,
+                                  rnd_state=random.getstate(), hypervolume=monitor.state(),
+                                  stragglers=self.straggler_counts(), resimulate=resimulate,
+                                  evaluated=evaluated)
+                        checkpoints.save(cp)
+
+                with self.timer.phase('print_best'):
+                    self.log_generation(time.time() - start_time, evals - start_evals,
+                                        f"{evals}/{max_evals} evaluations")
+                    self.print_best(population, sel_best)
+
+                self.record_metrics(evals=evals)
+
+                if converged:
+                    logger.info("The hypervolume converged at %d evaluations (%.6g). "
+                                "Stopping the optimization.", evals, volume)
+
+                next_record = evals + lambda_
+                start_time = time.time()
+                start_evals = evals
+
+        # The requests still being simulated when the hypervolume converged
+        # are discarded
+        if pending:
+            with self.timer.phase('simulation'):
+                wait(list(pending))
+
+        archive.flush()
+
+        return population, archive
+
+    def run_ga(self, checkpoints, mu=None, lambda_=None, checkpoint_load=None,
+               checkpoint_freq=1, sel_best=5, verbose=True, steady_state=False,
+               in_flight=None, batch_size=1, archive_dir=None, lambda_bounds=None,
+               early_stop=None, migration=None):
+        """Wrapper for the "ga_mu_plus_lambda" and "ga_steady_state" functions.
 
         Arguments:
-            checkpoint_fname (str): name of the checkpoint file to save
+            checkpoints (CheckpointStore): store of the checkpoints to save.
             mu (int or None, optional): number of individuals to select for the
                 next gen (default: None).
             lambda_ (int or None, optional): number of children to produce at
                 each gen (default: None).
-            checkpoint_load (str or None, optional): -ame of the checkpoint
-                file to load, if provided (default: None).
+            checkpoint_load (str or None, optional): checkpoint (file or
+                directory) to load, if provided (default: None).
             checkpoint_freq (int, optional): checkpoint saving frequency (gen
                 per checkpoint) (default: 1).
             sel_best (int, optional): number of best individuals to log at each
                 generation (default: 5).
             verbose (bool, optional): run in verbosity mode (default: True).
+            steady_state (bool, optional): run the asynchronous steady-state
+                algorithm instead of the generational one (default: False).
+            in_flight (int or None, optional): number of requests being
+                simulated in steady-state mode. If None, two per simulation
+                server (default: None).
+            batch_size (int, optional): number of offspring per request in
+                steady-state mode (default: 1).
+            archive_dir (str or None, optional): directory where the archive of
+                the evolution is written. If None, it's kept in memory
+                (default: None).
+            lambda_bounds (tuple or None, optional): min and max number of
+                children per generation, tuned to the measured simulation
+                throughput. Only used by the generational algorithm. If None,
+                "lambda_" is fixed (default: None).
+            early_stop (tuple or None, optional): window (generations, or
+                records in steady-state mode) and tolerance of the relative
+                improvement of the hypervolume, to stop the optimization when
+                it converges. If None, all generations are run (default: None).
+            migration (Migration or None, optional): exchange of individuals
+                with the other islands, after the selection of each generation
+                of the generational algorithm (default: None).
 
         Returns:
-            tuple: pareto fronts and the logbook of the evolution.
+            tuple: pareto fronts and the archive of the evolution.
         """
         # Evaluate mu and lambda_
         if mu is None:
@@ -489,14 +1369,40 @@ class OptimizerNSGA2:
 
         start_time = time.time()
 
-        result, logbook = self.ga_mu_plus_lambda(
-            mu=mu,
-            lambda_=lambda_,
-            checkpoint_load=checkpoint_load,
-            checkpoint_fname=checkpoint_fname,
-            checkpoint_freq=checkpoint_freq,
-            sel_best=sel_best,
-            verbose=verbose)
+        if steady_state:
+            if in_flight is None:
+                in_flight = 2 * len(self.client)
+
+            if lambda_bounds is not None:
+                logger.warning("The adaptive lambda is not used in steady-state mode")
+            if migration is not None:
+                logger.warning("The migration is not used in steady-state mode")
+
+            result, archive = self.ga_steady_state(
+                mu=mu,
+                lambda_=lambda_,
+                in_flight=in_flight,
+                batch_size=batch_size,
+                checkpoint_load=checkpoint_load,
+                checkpoints=checkpoints,
+                checkpoint_freq=checkpoint_freq,
+                sel_best=sel_best,
+                verbose=verbose,
+                archive_dir=archive_dir,
+                early_stop=early_stop)
+        else:
+            result, archive = self.ga_mu_plus_lambda(
+                mu=mu,
+                lambda_=lambda_,
+                checkpoint_load=checkpoint_load,
+                checkpoints=checkpoints,
+                checkpoint_freq=checkpoint_freq,
+                sel_best=sel_best,
+                verbose=verbose,
+                archive_dir=archive_dir,
+                lambda_bounds=lambda_bounds,
+                early_stop=early_stop,
+                migration=migration)
 
         # Get current date and time
         current_time = time.strftime("%H:%M:%S, %d of %B %Y", time.localtime())
@@ -510,6 +1416,6 @@ class OptimizerNSGA2:
         logger.info(msg)
 
         # Get the pareto fronts from the optimization results
-        fronts = tools.emo.sortLogNondominated(result, len(result))
+        fronts = sort_nondominated(result, len(result))
 
-        return fronts, logbook
+        return fronts, archive
@@ -0,0 +1,313 @@
+# This file is part of SMOC
+# Copyright (C) 2018  Miguel Fernandes
+#
+# SMOC is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SMOC is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""Hypervolume of the pareto front, and convergence of the optimization."""
+
+import logging
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+
+from .penalty import to_float
+from .selection import dominance, ranks_2d, ranks_nd
+
+logger = logging.getLogger('smoc.hypervolume')
+
+# Max number of points whose dominance is computed by comparing all pairs
+SMALL_SET = 256
+
+
+def nondominated(points):
+    """Get the non-dominated points (minimization), without duplicates.
+
+    Arguments:
+        points (ndarray): points (one row per point).
+
+    Returns:
+        ndarray: non-dominated points.
+    """
+    points = np.unique(points, axis=0)
+    if len(points) < 2:
+        return points
+
+    # The dominance is computed with maximized (negated) values. Small sets
+    # (e.g. in the WFG recursion) compare all pairs at once
+    if len(points) <= SMALL_SET:
+        return points[~dominance(-points, -points).any(axis=0)]
+
+    ranks = ranks_2d(-points) if points.shape[1] == 2 else ranks_nd(-points)
+
+    return points[ranks == 0]
+
+
+def hypervolume_2d(points, ref):
+    """Compute the hypervolume of points with two objectives (minimization),
+    with a sweep in O(N log N).
+
+    Arguments:
+        points (ndarray): points better than the reference.
+        ref (ndarray): reference point.
+
+    Returns:
+        float: hypervolume.
+    """
+    # Sorted by the 1st objective, the non-dominated points improve the 2nd
+    points = points[np.lexsort((points[:, 1], points[:, 0]))]
+    best = np.minimum.accumulate(points[:, 1])
+    front = np.concatenate(([True], best[1:] < best[:-1]))
+    points = points[front]
+
+    heights = np.concatenate(([ref[1]], points[:-1, 1])) - points[:, 1]
+
+    return float(((ref[0] - points[:, 0]) * heights).sum())
+
+
+def hypervolume_3d(points, ref):
+    """Compute the hypervolume of points with three objectives (minimization),
+    with a sweep in O(N log N): the points are added by the 3rd objective, and
+    the area dominated in the first two is updated.
+
+    Arguments:
+        points (ndarray): points better than the reference.
+        ref (ndarray): reference point.
+
+    Returns:
+        float: hypervolume.
+    """
+    ref_x, ref_y, ref_z = (float(val) for val in ref)
+    points = points[np.argsort(points[:, 2], kind='stable')].tolist()
+    # 2D front of the added points (x increasing, y decreasing), and its area
+    xs = []
+    ys = []
+    area = 0.0
+    volume = 0.0
+
+    for idx, (x, y, z) in enumerate(points):
+        pos = bisect_right(xs, x)
+        if not (pos and ys[pos - 1] <= y):
+            # Area dominated by the point and not by the front, between the
+            # front points it dominates (removed)
+            start = end = bisect_left(xs, x)
+            level = ys[start - 1] if start else ref_y
+            last_x = x
+            while end < len(xs) and ys[end] >= y:
+                area += (xs[end] - last_x) * (level - y)
+                last_x, level = xs[end], ys[end]
+                end += 1
+            area += ((xs[end] if end < len(xs) else ref_x) - last_x) * (level - y)
+
+            xs[start:end] = [x]
+            ys[start:end] = [y]
+
+        next_z = points[idx + 1][2] if idx + 1 < len(points) else ref_z
+        volume += area * (next_z - z)
+
+    return volume
+
+
+def hypervolume_wfg(points, ref):
+    """Compute the hypervolume of non-dominated points with four or more
+    objectives (minimization) with the WFG algorithm: the sum of the exclusive
+    hypervolume of each point, i.e. its box minus the hypervolume of the next
+    points limited to it. The three objectives case is solved by the sweep.
+
+    Arguments:
+        points (ndarray): non-dominated points, better than the reference.
+        ref (ndarray): reference point.
+
+    Returns:
+        float: hypervolume.
+    """
+    if len(points) == 0:
+        return 0.0
+    if points.shape[1] == 3:
+        return hypervolume_3d(points, ref)
+
+    # The points sorted by the last objective (worst first) make the limited
+    # sets smaller
+    points = points[np.argsort(-points[:, -1])]
+    volume = 0.0
+
+    for idx, point in enumerate(points):
+        box = float(np.prod(ref - point))
+        limited = np.maximum(points[idx + 1:], point)
+        volume += box - hypervolume_wfg(nondominated(limited), ref) if len(limited) else box
+
+    return volume
+
+
+def hypervolume(points, ref):
+    """Compute the hypervolume dominated by a set of points (minimization)
+    and bounded by a reference point. Only the points better than the
+    reference point in every objective count.
+
+    Arguments:
+        points (ndarray): points (one row per point).
+        ref (ndarray): reference point.
+
+    Returns:
+        float: hypervolume.
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, len(ref))
+    ref = np.asarray(ref, dtype=float)
+    points = points[(points < ref).all(axis=1)]
+
+    if len(points) == 0:
+        return 0.0
+    if len(ref) == 1:
+        return float(ref[0] - points[:, 0].min())
+    if len(ref) == 2:
+        return hypervolume_2d(points, ref)
+    if len(ref) == 3:
+        return hypervolume_3d(points, ref)
+
+    return hypervolume_wfg(nondominated(points), ref)
+
+
+class HypervolumeMonitor:
+    """Track the hypervolume of the feasible pareto front of each generation,
+    and detect the convergence of the optimization.
+
+    The hypervolume is computed with the simulation results of the objectives
+    (not the penalized fitnesses) of the individuals that meet all
+    constraints. The reference point is the constraint limit of each
+    objective on its worst side (e.g. the lower limit of an objective to
+    maximize). Objectives without that limit use the worst value of the first
+    feasible front, plus a margin of 10% of its range.
+
+    The optimization converged when the relative improvement of the
+    hypervolume over the last "window" generations is less than "tolerance".
+
+    Arguments:
+        penalty (PenaltyEngine): constraints handling of the optimizer.
+        objectives (dict): optimization objectives and respective weights.
+        constraints (dict): optimization constraints and respective limits.
+        window (int, optional): number of generations of the improvement. The
+            convergence is not checked if 0 (default: 0).
+        tolerance (float, optional): min relative improvement (default: 1e-3).
+    """
+
+    def __init__(self, penalty, objectives, constraints, window=0, tolerance=1e-3):
+        """Create the monitor."""
+        self.penalty = penalty
+        self.names = list(objectives.keys())
+        self.window = window
+        self.tolerance = tolerance
+
+        # The objectives are minimized: the results to maximize are negated
+        self.signs = np.array([-1.0 if weight > 0 else 1.0 for weight in objectives.values()])
+
+        # Reference point from the constraints (NaN if undefined or infinite)
+        ref = []
+        for key, weight in objectives.items():
+            limits = constraints.get(key, [None, None])
+            limit = to_float(limits[0] if weight > 0 else limits[1])
+            ref.append(np.nan if limit is None or not np.isfinite(limit) else limit)
+        self.ref = np.array(ref) * self.signs
+
+        # Hypervolume of each generation
+        self.history = []
+
+    def feasible_objectives(self, individuals):
+        """Get the objectives (minimized) of the feasible individuals.
+
+        Arguments:
+            individuals (list): evaluated individuals.
+
+        Returns:
+            ndarray: objectives of each feasible individual.
+        """
+        names = self.penalty.result_names
+        results = [ind.result for ind in individuals
+                   if all(key in ind.result for key in names)]
+        if not results:
+            return np.empty((0, len(self.names)))
+
+        matrix = self.penalty.results_matrix(results)
+        points = matrix[:, self.penalty.obj_cols] * self.signs
+        feasible = (self.penalty.penalties(matrix) == 0) & np.isfinite(points).all(axis=1)
+
+        return points[feasible]
+
+    def update(self, individuals):
+        """Compute the hypervolume of the feasible pareto front of the
+        evaluated individuals.
+
+        Arguments:
+            individuals (list): evaluated individuals.
+
+        Returns:
+            float: hypervolume.
+        """
+        points = self.feasible_objectives(individuals)
+
+        # Set the undefined coordinates of the reference point with the first
+        # feasible front
+        undefined = np.isnan(self.ref)
+        if undefined.any() and len(points):
+            front = nondominated(points)
+            worst = front.max(axis=0)
+            margin = 0.1 * (worst - front.min(axis=0))
+            margin = np.where(margin > 0, margin, np.where(worst != 0, 0.1 * np.abs(worst), 1.0))
+            self.ref = np.where(undefined, worst + margin, self.ref)
+            logger.info("Hypervolume reference point: %s",
+                        dict(zip(self.names, (self.ref * self.signs).tolist())))
+
+        if np.isnan(self.ref).any():
+            volume = 0.0
+        else:
+            volume = hypervolume(points, self.ref)
+
+        self.history.append(volume)
+
+        return volume
+
+    def converged(self):
+        """Check if the optimization converged, i.e. the relative improvement
+        of the hypervolume over the last "window" generations is less than
+        the tolerance.
+
+        Returns:
+            bool: True if the optimization converged.
+        """
+        if not self.window or len(self.history) <= self.window:
+            return False
+
+        previous = self.history[-self.window - 1]
+        if previous <= 0:
+            return False
+
+        improvement = (self.history[-1] - previous) / previous
+        logger.info("Hypervolume improvement in the last %d generations: %.3g%%",
+                    self.window, 100 * improvement)
+
+        return improvement < self.tolerance
+
+    def state(self):
+        """Get the monitor state, to be stored in a checkpoint.
+
+        Returns:
+            dict: monitor state.
+        """
+        return dict(ref=self.ref.tolist(), history=list(self.history))
+
+    def load_state(self, state):
+        """Restore the monitor state from a checkpoint.
+
+        Arguments:
+            state (dict): monitor state.
+        """
+        self.ref = np.array(state['ref'], dtype=float)
+        self.history = list(state['history'])
@@ -0,0 +1,490 @@
+# This file is part of SMOC
+# Copyright (C) 2018  Miguel Fernandes
+#
+# SMOC is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SMOC is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""Island model: one NSGA-II population per simulation server, each evolved
+in its own process, that exchange their best individuals."""
+
+import copy
+import logging
+import multiprocessing
+import os
+import queue
+import random
+import time
+
+from ..simulator import ServerPool, check_simulator
+from ..util.checkpoint import CheckpointStore, load_checkpoint
+from ..util.metrics import MetricsRecorder
+from .database import ResultsDatabase
+from .ga import OptimizerNSGA2
+from .selection import sort_nondominated
+
+logger = logging.getLogger('smoc.islands')
+
+# Migration topologies: each island sends its emigrants to the next one
+# (ring), or to all the others (all-to-all)
+TOPOLOGIES = ('ring', 'all')
+
+
+def migration_targets(island, num_islands, topology):
+    """Get the islands that receive the emigrants of an island.
+
+    Arguments:
+        island (int): index of the island.
+        num_islands (int): number of islands.
+        topology (str): migration topology ('ring' or 'all').
+
+    Raises:
+        ValueError: if the topology is unknown.
+
+    Returns:
+        list: indexes of the target islands.
+    """
+    if topology == 'ring':
+        return [(island + 1) % num_islands] if num_islands > 1 else []
+    if topology == 'all':
+        return [idx for idx in range(num_islands) if idx != island]
+
+    raise ValueError(f"Unknown migration topology '{topology}' (expected one of {TOPOLOGIES})")
+
+
+def island_files(fname, island):
+    """Get the file name of an island, with the island index before the extension.
+
+    Arguments:
+        fname (str or None): file name of the optimization.
+        island (int): index of the island.
+
+    Returns:
+        str or None: file name of the island.
+    """
+    if not fname:
+        return fname
+
+    root, ext = os.path.splitext(fname)
+
+    return f"{root}_island{island}{ext}"
+
+
+class Migration:
+    """Migration hook of an island, called by "ga_mu_plus_lambda" after the
+    selection of each generation.
+
+    Every "freq" generations, the best non-dominated individuals of the island
+    (at most "size", the most spread ones) are sent to the coordinator, with
+    the checkpoint of the island at that generation. The immigrants received
+    meanwhile are selected with the population, so they only replace worse
+    individuals. The islands never wait for each other.
+
+    Arguments:
+        island (int): index of the island.
+        freq (int): number of generations between migrations.
+        size (int): max number of emigrants per migration.
+        select (function): NSGA-II selection operator.
+        checkpoints (CheckpointStore): checkpoints of the island.
+        inbox (Queue): messages to the coordinator.
+        outbox (Queue): immigrants sent by the coordinator.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, island, freq, size, select, checkpoints, inbox, outbox):
+        """Create the migration hook."""
+        self.island = island
+        self.freq = max(freq, 1)
+        self.size = size
+        self.select = select
+        self.checkpoints = checkpoints
+        self.inbox = inbox
+        self.outbox = outbox
+
+    def due(self, gen):
+        """Check if there's a migration at a generation, so the island saves
+        a checkpoint of it.
+
+        Arguments:
+            gen (int): generation.
+
+        Returns:
+            bool: True if the island migrates at that generation.
+        """
+        return gen % self.freq == 0
+
+    def __call__(self, gen, population):
+        """Exchange individuals with the other islands.
+
+        Arguments:
+            gen (int): generation.
+            population (list): selected population.
+
+        Returns:
+            list: population with the selected immigrants.
+        """
+        if not self.due(gen):
+            return population
+
+        front = sort_nondominated(population, len(population), first_front_only=True)[0]
+        if len(front) > self.size:
+            front = self.select(front, self.size)
+        # The queue pickles the individuals in the background: send copies
+        emigrants = [copy.deepcopy(ind) for ind in front]
+        self.inbox.put(('migrants', self.island, gen, self.checkpoints.last_file, emigrants))
+
+        immigrants = []
+        while True:
+            try:
+                immigrants.extend(self.outbox.get_nowait())
+            except queue.Empty:
+                break
+
+        if not immigrants:
+            return population
+
+        logger.info("Island %d: %d emigrants, %d immigrants at generation %d",
+                    self.island, len(emigrants), len(immigrants), gen)
+
+        return self.select(population + immigrants, len(population))
+
+
+def run_island(island, model, checkpoint_dir, checkpoint_load, archive_dir, inbox, outbox):
+    """Run an island (worker process): connect to its server, evolve its
+    population, and send the final pareto front and archive to the coordinator.
+
+    Arguments:
+        island (int): index of the island.
+        model (IslandModel): island model.
+        checkpoint_dir (str): checkpoints directory of the island.
+        checkpoint_load (str or None): checkpoint of the island to load.
+        archive_dir (str or None): archive directory of the island.
+        inbox (Queue): messages to the coordinator.
+        outbox (Queue): immigrants sent by the coordinator.
+    """
+    client = None
+    database = None
+
+    try:
+        server = model.servers[island]
+        logger.info("Island %d: connecting to %s:%s...", island, server['host'], server['port'])
+        client = ServerPool([server], **model.client_args)
+        client.connect()
+
+        circuit_vars = model.optimizer_args['circuit_vars']
+        res_vars, sim_info = client.load_simulator(model.max_batch, list(circuit_vars.keys()))
+        check_simulator(res_vars, sim_info, circuit_vars, model.optimizer_args.get('stages'))
+
+        if model.database_file and 'template_hash' in sim_info:
+            database = ResultsDatabase(model.database_file, sim_info['template_hash'])
+
+        metrics = None
+        if model.metrics_files is not None:
+            metrics = MetricsRecorder(*(island_files(fname, island)
+                                        for fname in model.metrics_files))
+
+        optimizer = OptimizerNSGA2(client=client, database=database, metrics=metrics,
+                                   **model.optimizer_args)
+        # The forked islands share the random state: each one needs its own
+        # (fixed in debug mode)
+        random.seed(16384 + island if model.optimizer_args.get('debug') else None)
+
+        checkpoints = CheckpointStore(checkpoint_dir, *model.checkpoint_args)
+        migration = Migration(island, model.migration_freq, model.migration_size,
+                              optimizer.toolbox.select, checkpoints, inbox, outbox)
+
+        fronts, archive = optimizer.run_ga(checkpoints, checkpoint_load=checkpoint_load,
+                                           archive_dir=archive_dir, migration=migration,
+                                           **model.ga_args)
+
+        client.send_exit()
+        inbox.put(('done', island, fronts[0], archive, checkpoints.last_file))
+
+    except Exception as err:  # pylint: disable=broad-except
+        logger.error("Island %d - %s", island, err)
+        inbox.put(('error', island, err))
+
+    finally:
+        if client is not None:
+            client.close()
+        if database is not None:
+            database.close()
+
+
+class IslandModel:
+    """Island model of the NSGA-II optimizer: one population (island) per
+    simulation server, each evolved in its own process with the generational
+    algorithm, so the islands don't wait for each other's generations.
+
+    Every "migration_freq" generations, each island saves a checkpoint and
+    sends its best non-dominated individuals to the coordinator, that forwards
+    them to the target islands of the migration topology. The coordinator
+    keeps the checkpoint and emigrants of each island at each migration, and
+    saves a unified checkpoint when all islands reached a new migration: the
+    checkpoint of each island at that same generation (in the island
+    directories of the coordinator directory) and the merged pareto front of
+    their emigrants. Loading it resumes all the islands from that generation.
+    At the end, the final pareto fronts of the islands are merged, and the
+    final unified checkpoint has the last checkpoint of each island.
+
+    Arguments:
+        servers (list): configuration parameters of each server (island).
+        optimizer_args (dict): keyword arguments of "OptimizerNSGA2" (except
+            the client, database and metrics, created by each island).
+        ga_args (dict): keyword arguments of "run_ga" (except the
+            checkpoints, checkpoint to load and archive directory).
+        max_batch (int): max number of simulations per batch.
+        migration_freq (int, optional): number of generations between
+            migrations (default: 5).
+        migration_size (int, optional): max number of emigrants per migration
+            (default: 5).
+        topology (str, optional): migration topology, 'ring' or 'all'
+            (default: 'ring').
+        client_args (dict or None, optional): keyword arguments of the
+            "ServerPool" of each island, e.g. the chunk size and the deadlines
+            (default: None).
+        database_file (str or None, optional): results database, shared by
+            the islands (default: None).
+        metrics_files (tuple or None, optional): metrics files (JSON lines and
+            Prometheus), one per island. If None, the metrics are not
+            recorded (default: None).
+        checkpoint_args (tuple, optional): "keep", "snapshot_freq" and
+            "compress" of the checkpoints of each island (default: ()).
+    """
+
+    # pylint: disable=too-many-instance-attributes,too-many-arguments
+    def __init__(self, servers, optimizer_args, ga_args, max_batch, migration_freq=5,
+                 migration_size=5, topology='ring', client_args=None, database_file=None,
+                 metrics_files=None, checkpoint_args=()):
+        """Create the island model."""
+        # Check the topology
+        migration_targets(0, len(servers), topology)
+
+        self.servers = servers
+        self.optimizer_args = optimizer_args
+        self.ga_args = ga_args
+        self.max_batch = max_batch
+        self.migration_freq = migration_freq
+        self.migration_size = migration_size
+        self.topology = topology
+        self.client_args = client_args or {}
+        self.database_file = database_file
+        self.metrics_files = metrics_files
+        self.checkpoint_args = checkpoint_args
+
+        # The optimizer of the coordinator creates the individual classes, to
+        # receive the individuals of the islands
+        self.optimizer = OptimizerNSGA2(**optimizer_args)
+
+    def __len__(self):
+        """Number of islands."""
+        return len(self.servers)
+
+    def __getstate__(self):
+        """Get the state sent to the islands (without the optimizer)."""
+        state = self.__dict__.copy()
+        state['optimizer'] = None
+
+        return state
+
+    def merge_fronts(self, fronts):
+        """Merge the pareto fronts of the islands. The migrants that are in
+        several islands are merged once.
+
+        Arguments:
+            fronts (list): individuals of each island.
+
+        Returns:
+            list: pareto fronts of the merged individuals.
+        """
+        unique = {tuple(ind): ind for front in fronts for ind in front}
+        individuals = list(unique.values())
+
+        return sort_nondominated(individuals, len(individuals))
+
+    # pylint: disable=too-many-arguments
+    def save_migration(self, checkpoints, checkpoint_dirs, migrations, gen, saved_gen):
+        """Save the unified checkpoint of a migration reached by all islands,
+        with the checkpoint and emigrants of each island at that generation.
+
+        Arguments:
+            checkpoints (CheckpointStore): store of the unified checkpoints.
+            checkpoint_dirs (list): checkpoints directory of each island.
+            migrations (list): checkpoint and emigrants of each island at each
+                migration generation. The older migrations are removed.
+            gen (int): last migration generation reached by all islands.
+            saved_gen (int): generation of the last unified checkpoint.
+
+        Returns:
+            int: generation of the last unified checkpoint.
+        """
+        # Newest migration of each island up to the generation: the same one,
+        # unless the islands were resumed from different generations
+        gens = [max((island_gen for island_gen in island_migrations if island_gen <= gen),
+                    default=None) for island_migrations in migrations]
+        if None in gens:
+            return saved_gen
+
+        for island_migrations, island_gen in zip(migrations, gens):
+            for old_gen in [old_gen for old_gen in island_migrations if old_gen < island_gen]:
+                del island_migrations[old_gen]
+
+        states = [island_migrations[island_gen]
+                  for island_migrations, island_gen in zip(migrations, gens)]
+        checkpoints.save(dict(generation=gen, islands=checkpoint_dirs,
+                              checkpoints=[fname for fname, _ in states],
+                              front=self.merge_fronts([inds for _, inds in states])[0]))
+
+        return gen
+
+    def island_loads(self, checkpoint_load):
+        """Get the checkpoint of each island from a unified checkpoint.
+
+        Arguments:
+            checkpoint_load (str or None): unified checkpoint to load.
+
+        Raises:
+            ValueError: if it's not a checkpoint of the same number of islands.
+
+        Returns:
+            list: checkpoint (file, directory or None) of each island.
+        """
+        if not checkpoint_load:
+            return [None] * len(self)
+
+        cp = load_checkpoint(checkpoint_load)
+        if len(cp.get('islands', [])) != len(self):
+            raise ValueError(f"The checkpoint {checkpoint_load} is not of an island model "
+                             f"with {len(self)} islands")
+
+        loads = []
+        files = cp.get('checkpoints') or [None] * len(self)
+        for island, (directory, fname) in enumerate(zip(cp['islands'], files)):
+            if fname and os.path.exists(fname):
+                loads.append(fname)
+            elif CheckpointStore.list_files(directory):
+                # Removed by the pruning of the island checkpoints
+                logger.warning("Island %d has no checkpoint at generation %d. Resuming it "
+                               "from its newest checkpoint.", island, cp['generation'])
+                loads.append(directory)
+            else:
+                logger.warning("Island %d has no checkpoint. Starting a new population.", island)
+                loads.append(None)
+
+        return loads
+
+    def run(self, checkpoints, checkpoint_load=None, archive_dir=None):
+        """Run the islands until all of them finish, forwarding the migrants.
+
+        Arguments:
+            checkpoints (CheckpointStore): store of the unified checkpoints.
+            checkpoint_load (str or None, optional): unified checkpoint to
+                load, if provided (default: None).
+            archive_dir (str or None, optional): directory where the archive
+                of each island is written. If None, they're kept in memory
+                (default: None).
+
+        Raises:
+            ConnectionError: if an island ended without its results.
+
+        Returns:
+            tuple: merged pareto fronts and the archive of each island.
+        """
+        loads = self.island_loads(checkpoint_load)
+        checkpoint_dirs = [os.path.join(checkpoints.directory, f"island_{island}")
+                           for island in range(len(self))]
+
+        context = multiprocessing.get_context()
+        inbox = context.Queue()
+        outboxes = [context.Queue() for _ in self.servers]
+        workers = [context.Process(target=run_island, name=f"island-{island}",
+                                   args=(island, self, checkpoint_dirs[island], loads[island],
+                                         archive_dir and os.path.join(archive_dir,
+                                                                      f"island_{island}"),
+                                         inbox, outboxes[island]))
+                   for island in range(len(self))]
+
+        logger.info("Starting %d islands (migration of %d individuals every %d generations, "
+                    "%s topology)...", len(self), self.migration_size, self.migration_freq,
+                    self.topology)
+        start_time = time.time()
+
+        for worker in workers:
+            worker.start()
+
+        # Checkpoint and emigrants of each island at each migration (until
+        # all islands reach it), and last migration generation of each island
+        migrations = [{} for _ in workers]
+        generations = [0] * len(workers)
+        saved_gen = 0
+        results = {}
+
+        try:
+            while len(results) < len(workers):
+                # An island that ended before the "get" already sent all its
+                # messages
+                alive = [worker.is_alive() for worker in workers]
+                try:
+                    kind, island, *payload = inbox.get(timeout=1)
+                except queue.Empty:
+                    lost = [island for island, is_alive in enumerate(alive)
+                            if not is_alive and island not in results]
+                    if lost:
+                        raise ConnectionError(f"The island {lost[0]} ended unexpectedly")
+                    continue
+
+                if kind == 'error':
+                    raise payload[0]
+
+                if kind == 'done':
+                    results[island] = payload
+                    logger.info("Island %d finished (%d/%d)", island, len(results), len(workers))
+                    continue
+
+                gen, checkpoint_file, individuals = payload
+                migrations[island][gen] = checkpoint_file, individuals
+                generations[island] = gen
+                for target in migration_targets(island, len(workers), self.topology):
+                    if target not in results:
+                        outboxes[target].put(individuals)
+
+                # Unified checkpoint when all islands reached a new migration
+                if min(generations) > saved_gen:
+                    saved_gen = self.save_migration(checkpoints, checkpoint_dirs, migrations,
+                                                    min(generations), saved_gen)
+
+            for worker in workers:
+                worker.join()
+
+        finally:
+            for worker in workers:
+                if worker.is_alive():
+                    worker.terminate()
+            # The immigrants not received by the islands are discarded
+            for outbox in outboxes:
+                outbox.cancel_join_thread()
+
+        secs = time.time() - start_time
+        mins, secs = divmod(secs, 60)
+        hours, mins = divmod(mins, 60)
+        logger.info("Islands total time: %02.0fh%02.0fm%02.0fs", hours, mins, secs)
+
+        fronts = self.merge_fronts([results[island][0] for island in range(len(workers))])
+        archives = [results[island][1] for island in range(len(workers))]
+
+        checkpoints.save(dict(generation=max(generations), islands=checkpoint_dirs,
+                              checkpoints=[results[island][2] for island in range(len(workers))],
+                              front=fronts[0]))
+
+        # Show the best individuals of the merged front
+        self.optimizer.print_best(fronts[0], self.ga_args.get('sel_best', 5))
+
+        return fronts, archives
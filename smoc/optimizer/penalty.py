@@ -0,0 +1,376 @@
+# This file is part of SMOC
+# Copyright (C) 2018  Miguel Fernandes
+#
+# SMOC is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SMOC is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""Constraint handling: penalties and penalized fitnesses."""
+
+import math
+import sys
+from operator import itemgetter
+
+import numpy as np
+
+# Max penalty (multiplied by the penalty weight), to avoid overflows. It's
+# also the default penalty of the failed individuals
+MAX_PENALTY = 500
+
+# Max exponent of the penalty, above which "math.exp" overflows
+MAX_EXPONENT = math.log(sys.float_info.max)
+
+
+def to_float(value):
+    """Convert a constraint limit to float.
+
+    Arguments:
+        value (any): constraint limit.
+
+    Returns:
+        float or None: the limit, or None if it's not defined (not a number).
+    """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class PenaltyEngine:
+    """Compute the constraints penalty and the penalized fitness of a batch of
+    individuals.
+
+    The constraints and objectives are compiled once into arrays of limits
+    and masks, and the penalties/fitnesses are computed with array operations
+    over a matrix with the simulation results of all individuals.
+
+    Constraints can have:
+        - Two different limits: the result is normalized to the limits range.
+          The penalty is "delta + distance" to the violated limit.
+        - Two equal limits: the penalty is "delta + |result - limit|".
+        - One limit (the other is not a number): the result is normalized to
+          the limit (result / limit - 1), and the penalty is "delta + distance"
+          to the limit.
+
+    The fitness of each objective is "result * exp(weight * penalty * weight)"
+    (at most exp(weight * 500)), where the penalty sign makes the fitness worse
+    (i.e. negative for objectives to maximize), inverted for negative results.
+
+    Arguments:
+        objectives (dict): optimization objectives and respective weights.
+        constraints (dict): optimization constraints and respective limits.
+        penalty_delta (float, optional): constant value of penalization for an
+            invalid individual (default: 2).
+        penalty_weight (float, optional): multiplication factor of an invalid
+            individual penalty (default: 1).
+        failure_penalty (float, optional): penalty of the failed individuals,
+            at most MAX_PENALTY (default: MAX_PENALTY).
+    """
+
+    def __init__(self, objectives, constraints, penalty_delta=2, penalty_weight=1,
+                 failure_penalty=MAX_PENALTY):
+        """Compile the objectives and constraints."""
+        self.penalty_delta = penalty_delta
+        self.penalty_weight = penalty_weight
+        self.failure_penalty = min(failure_penalty, MAX_PENALTY)
+
+        # Columns of the results matrix: objectives first, then the remaining
+        # constraints
+        self.result_names = list(objectives.keys())
+        self.result_names += [key for key in constraints.keys() if key not in objectives]
+        self.getter = itemgetter(*self.result_names)
+        column = {key: idx for idx, key in enumerate(self.result_names)}
+
+        # Objectives: columns and direction (True if the fitness is to maximize)
+        self.obj_cols = np.array([column[key] for key in objectives.keys()], dtype=int)
+        self.obj_max = np.array([val > 0 for val in objectives.values()], dtype=bool)
+
+        # Constraints, in the configuration order: column, lower and upper
+        # limits (NaN if undefined)
+        cols = []
+        low = []
+        up = []
+
+        for key, val in constraints.items():
+            val_0 = to_float(val[0])
+            val_1 = to_float(val[1])
+
+            # A constraint without limits is not a constraint
+            if val_0 is None and val_1 is None:
+                continue
+
+            cols.append(column[key])
+            low.append(np.nan if val_0 is None else val_0)
+            up.append(np.nan if val_1 is None else val_1)
+
+        self.con_cols = np.array(cols, dtype=int)
+        self.con_low = np.array(low, dtype=float)
+        self.con_up = np.array(up, dtype=float)
+
+        has_low = ~np.isnan(self.con_low)
+        has_up = ~np.isnan(self.con_up)
+        # Masks of each constraint type
+        self.two_limits = has_low & has_up & (self.con_low != self.con_up)
+        self.equal_limits = has_low & has_up & (self.con_low == self.con_up)
+        self.only_low = has_low & ~has_up
+        self.only_up = ~has_low & has_up
+
+        # Worst result of each objective evaluated so far (NaN if none)
+        self.worst = np.full(len(self.obj_cols), np.nan)
+
+    def results_matrix(self, sim_res):
+        """Build the matrix with the simulation results of a batch.
+
+        Arguments:
+            sim_res (list): simulation results of each individual (dicts).
+
+        Raises:
+            KeyError: If an objective or constraint is not in the results.
+
+        Returns:
+            ndarray: results matrix (one row per individual, one column per
+                objective/constraint).
+        """
+        try:
+            rows = [self.getter(res) for res in sim_res]
+        except KeyError as err:
+            raise KeyError(f"Eval circuit: there's no key {err} in the simulation results.")
+
+        matrix = np.array(rows, dtype=float)
+
+        return matrix.reshape(len(sim_res), len(self.result_names))
+
+    def penalties(self, matrix, missing=None):
+        """Compute the constraints penalty of each individual.
+
+        Arguments:
+            matrix (ndarray): results matrix.
+            missing (ndarray or None, optional): mask of the missing results
+                (same shape of the matrix), which are not penalized
+                (default: None).
+
+        Returns:
+            ndarray: penalty of each individual.
+        """
+        res = matrix[:, self.con_cols]
+        contrib = np.zeros_like(res)
+        delta = self.penalty_delta
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # Two different limits
+            idx = self.two_limits
+            norm = (res[:, idx] - self.con_low[idx]) / (self.con_up[idx] - self.con_low[idx])
+            contrib[:, idx] = np.where(norm < 0, delta - norm,
+                                       np.where(norm > 1, delta + (norm - 1), 0.0))
+
+            # Two equal limits
+            idx = self.equal_limits
+            diff = res[:, idx] - self.con_low[idx]
+            contrib[:, idx] = np.where(res[:, idx] != self.con_low[idx],
+                                       delta + np.abs(diff), 0.0)
+
+            # Only the minimum allowed value
+            idx = self.only_low
+            norm = (res[:, idx] / self.con_low[idx]) - 1
+            contrib[:, idx] = np.where(norm < 0, delta - norm, 0.0)
+
+            # Only the maximum allowed value
+            idx = self.only_up
+            norm = (res[:, idx] / self.con_up[idx]) - 1
+            contrib[:, idx] = np.where(norm > 0, delta + norm, 0.0)
+
+        if missing is not None:
+            contrib[missing[:, self.con_cols]] = 0.0
+
+        # Sum the contributions in the constraints order, to get exactly the
+        # same rounding of a sequential sum
+        pen = np.zeros(len(matrix))
+        for col in range(contrib.shape[1]):
+            pen += contrib[:, col]
+
+        return pen
+
+    def fitnesses(self, matrix, pen=None, failed=None):
+        """Compute the penalized fitness of each individual.
+
+        The penalty is multiplied by the penalty weight (up to MAX_PENALTY),
+        and the exponent of the penalty is the weighted penalty multiplied by
+        the weight again. The exponent is limited to MAX_EXPONENT (i.e. with a
+        weight above 1), so it doesn't overflow.
+
+        Arguments:
+            matrix (ndarray): results matrix.
+            pen (ndarray or None, optional): penalty of each individual. If
+                None, it's computed from the results (default: None).
+            failed (ndarray or None, optional): mask of the failed individuals,
+                which get the failure penalty (default: None).
+
+        Raises:
+            ValueError: If there's an overflow while computing the penalty.
+
+        Returns:
+            ndarray: fitnesses (one row per individual).
+        """
+        if pen is None:
+            pen = self.penalties(matrix)
+
+        # Add the penalty weight to penalty, and avoid overflow problems
+        penalty = pen * self.penalty_weight
+        penalty = np.where(penalty > MAX_PENALTY, MAX_PENALTY, penalty)
+        if failed is not None:
+            penalty = np.where(failed, self.failure_penalty, penalty)
+
+        # "math.exp" is used (instead of "np.exp") to get exactly the same
+        # values, and it's only evaluated once per individual and direction
+        exp_arg = np.minimum(self.penalty_weight * penalty, MAX_EXPONENT).tolist()
+        try:
+            exp_min = np.array([math.exp(val) for val in exp_arg])
+            # If the fitness is to maximize, the penalty signal is changed
+            exp_max = np.array([math.exp(-val) for val in exp_arg])
+        except OverflowError as err:
+            raise ValueError(f"Overflow error while evaluating the circuit: {err}")
+
+        tot_penalty = np.where(self.obj_max, exp_max[:, None], exp_min[:, None])
+        tot_penalty = tot_penalty.reshape(len(matrix), len(self.obj_cols))
+
+        result = matrix[:, self.obj_cols]
+
+        # If the simulation result is negative, invert the penalty
+        with np.errstate(divide='ignore'):
+            tot_penalty = np.where(result < 0, 1 / tot_penalty, tot_penalty)
+
+        return result * tot_penalty
+
+    def update_worst(self, matrix, missing=None):
+        """Get the worst result of each objective in a batch, and update the
+        worst results evaluated so far.
+
+        Arguments:
+            matrix (ndarray): results matrix.
+            missing (ndarray or None, optional): mask of the missing results
+                (default: None).
+
+        Returns:
+            ndarray: worst result of each objective in the batch (NaN if
+                there's none).
+        """
+        values = matrix[:, self.obj_cols]
+        valid = np.isfinite(values)
+        if missing is not None:
+            valid &= ~missing[:, self.obj_cols]
+
+        low = np.where(valid, values, np.inf).min(axis=0, initial=np.inf)
+        high = np.where(valid, values, -np.inf).max(axis=0, initial=-np.inf)
+        batch = np.where(valid.any(axis=0), np.where(self.obj_max, low, high), np.nan)
+
+        self.worst = np.where(self.obj_max, np.fmin(self.worst, batch),
+                              np.fmax(self.worst, batch))
+
+        return batch
+
+    def partial_matrix(self, sim_res):
+        """Build the results matrix of a batch where the individuals can miss
+        results (e.g. rejected by a screening stage).
+
+        Arguments:
+            sim_res (list): simulation results of each individual (dicts).
+
+        Returns:
+            tuple: results matrix (NaN if missing), and mask of the missing
+                results.
+        """
+        nan = float('nan')
+        matrix = np.array([[res.get(key, nan) for key in self.result_names] for res in sim_res],
+                          dtype=float)
+        missing = np.array([[key not in res for key in self.result_names] for res in sim_res],
+                           dtype=bool)
+        shape = (len(sim_res), len(self.result_names))
+
+        return matrix.reshape(shape), missing.reshape(shape)
+
+    def incomplete(self, sim_res):
+        """Find the individuals whose results miss an objective or a
+        constraint, or have a NaN value (e.g. a simulation that didn't
+        converge).
+
+        Arguments:
+            sim_res (list): simulation results of each individual (dicts).
+
+        Returns:
+            list: if the results of each individual are incomplete.
+        """
+        if not sim_res:
+            return []
+
+        # Usually no key is missing
+        try:
+            matrix = self.results_matrix(sim_res)
+        except KeyError:
+            matrix, missing = self.partial_matrix(sim_res)
+            matrix[missing] = np.nan
+
+        return np.isnan(matrix).any(axis=1).tolist()
+
+    def evaluate(self, sim_res, partial=False, failed=None):
+        """Compute the penalized fitness of a batch of individuals.
+
+        If partial, the individuals rejected by a screening stage can miss
+        results: the missing constraints are not penalized, and a missing
+        objective takes the worst result of that objective in the batch (or
+        evaluated so far if there's none, infinite if there's never been). So
+        the fitness of the rejected individuals is the worst of the batch,
+        penalized by the constraints they violate.
+
+        The failed individuals (e.g. without results after missing every
+        deadline, or with incomplete results) get the worst-case fitness: the
+        worst results evaluated so far (infinite if there's none yet) with
+        the failure penalty.
+
+        Arguments:
+            sim_res (list): simulation results of each individual (dicts).
+            partial (bool, optional): the individuals can miss results
+                (default: False).
+            failed (list or None, optional): if each individual failed. The
+                results of the failed individuals are ignored, so they are
+                evaluated as partial (default: None).
+
+        Returns:
+            list: fitness of each individual.
+        """
+        if not sim_res:
+            return []
+
+        if failed is not None:
+            failed = np.array(failed, dtype=bool)
+            if not failed.any():
+                failed = None
+            else:
+                sim_res = [{} if fail else res for fail, res in zip(failed.tolist(), sim_res)]
+                partial = True
+
+        if not partial:
+            matrix = self.results_matrix(sim_res)
+            self.update_worst(matrix)
+            return self.fitnesses(matrix).tolist()
+
+        matrix, missing = self.partial_matrix(sim_res)
+        batch = self.update_worst(matrix, missing)
+        # Before any valid result, the worst is infinite (negative if maximized)
+        worst = np.where(np.isnan(self.worst), np.where(self.obj_max, -np.inf, np.inf),
+                         self.worst)
+        batch = np.where(np.isnan(batch), worst, batch)
+
+        for idx, col in enumerate(self.obj_cols.tolist()):
+            matrix[missing[:, col], col] = batch[idx]
+            if failed is not None:
+                matrix[failed, col] = worst[idx]
+
+        return self.fitnesses(matrix, self.penalties(matrix, missing), failed).tolist()
@@ -0,0 +1,285 @@
+# This file is part of SMOC
+# Copyright (C) 2018  Miguel Fernandes
+#
+# SMOC is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SMOC is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""NSGA-II selection with NumPy, for large populations.
+
+Drop-in replacements of "deap.tools.selNSGA2" and "deap.tools.sortNondominated",
+that return exactly the same individuals, in the same order, with the same
+crowding distances.
+
+The non-domination ranks are computed with an O(N log N) sweep for two
+objectives, and with the efficient non-dominated sort with binary search
+(ENS-BS) for other numbers of objectives, instead of the O(M N^2) comparison
+of all pairs. The order of the individuals in each front, which decides the
+ties of the crowding distance sort, is then reconstructed as in DEAP.
+
+Fitnesses with non-finite values (e.g. failed simulations) are handled by
+DEAP, because the dominance is not transitive when NaNs are ignored.
+"""
+
+from bisect import bisect_right
+from itertools import chain
+
+import numpy as np
+from deap import tools
+
+# Max number of dominance comparisons per block (bounds the memory)
+BLOCK_SIZE = 1 << 22
+
+
+def dominance(dominating, dominated):
+    """Check which points dominate which (in the DEAP sense: not worse in
+    every objective, and better in at least one, with weighted values).
+
+    Arguments:
+        dominating (ndarray): weighted fitnesses of the dominating points.
+        dominated (ndarray): weighted fitnesses of the dominated points.
+
+    Returns:
+        ndarray: matrix where (i, j) is True if dominating[i] dominates
+            dominated[j].
+    """
+    better = dominating[:, None, :] > dominated[None, :, :]
+    worse = dominating[:, None, :] < dominated[None, :, :]
+
+    return better.any(axis=2) & ~worse.any(axis=2)
+
+
+def ranks_2d(wvalues):
+    """Non-domination rank of distinct points with two objectives, with a
+    sweep in O(N log N).
+
+    Arguments:
+        wvalues (ndarray): weighted fitnesses (distinct rows).
+
+    Returns:
+        ndarray: rank of each point (0 is the first front).
+    """
+    # Sort by the first objective, then by the second (best first). A point
+    # can only be dominated by the points before it
+    order = np.lexsort((-wvalues[:, 1], -wvalues[:, 0]))
+    ranks = np.empty(len(wvalues), dtype=int)
+
+    # Best (negated) value of the 2nd objective in each front, which only
+    # increases with the front
+    front_best = []
+
+    for idx, val in zip(order.tolist(), (-wvalues[order, 1]).tolist()):
+        # The first front without a point that is better (or equal) in the
+        # 2nd objective
+        rank = bisect_right(front_best, val)
+        if rank == len(front_best):
+            front_best.append(val)
+        else:
+            front_best[rank] = val
+        ranks[idx] = rank
+
+    return ranks
+
+
+def ranks_nd(wvalues):
+    """Non-domination rank of distinct points with any number of objectives,
+    with the efficient non-dominated sort with binary search (ENS-BS).
+
+    Arguments:
+        wvalues (ndarray): weighted fitnesses (distinct rows).
+
+    Returns:
+        ndarray: rank of each point (0 is the first front).
+    """
+    num, nobj = wvalues.shape
+    # Lexicographic order (best first): a point can only be dominated by the
+    # points before it, so it's dominated if any is better or equal
+    order = np.lexsort(tuple(-wvalues[:, col] for col in reversed(range(nobj))))
+    ranks = np.empty(num, dtype=int)
+
+    # Points of each front (preallocated buffers) and their number
+    fronts = []
+    sizes = []
+
+    for idx in order.tolist():
+        point = wvalues[idx]
+
+        # If a front dominates the point, all the previous fronts do too
+        low, high = 0, len(fronts)
+        while low < high:
+            mid = (low + high) // 2
+            if (fronts[mid][:sizes[mid]] >= point).all(axis=1).any():
+                low = mid + 1
+            else:
+                high = mid
+
+        if low == len(fronts):
+            fronts.append(np.empty((16, nobj)))
+            sizes.append(0)
+        elif sizes[low] == len(fronts[low]):
+            fronts[low] = np.concatenate((fronts[low], np.empty_like(fronts[low])))
+
+        fronts[low][sizes[low]] = point
+        sizes[low] += 1
+        ranks[idx] = low
+
+    return ranks
+
+
+def front_order(prev_wvalues, wvalues, idxs):
+    """Order the points of a front as DEAP does: by the position of their
+    last dominator in the previous front, then by their index.
+
+    Arguments:
+        prev_wvalues (ndarray): weighted fitnesses of the previous front (in
+            order).
+        wvalues (ndarray): weighted fitnesses of all points.
+        idxs (ndarray): indexes of the points of the front.
+
+    Returns:
+        ndarray: indexes of the points of the front, in order.
+    """
+    last = np.empty(len(idxs), dtype=int)
+    step = max(BLOCK_SIZE // max(len(prev_wvalues) * wvalues.shape[1], 1), 1)
+
+    for start in range(0, len(idxs), step):
+        block = idxs[start:start + step]
+        dom = dominance(prev_wvalues, wvalues[block])
+        # Position of the last dominator of each point
+        last[start:start + len(block)] = len(prev_wvalues) - 1 - dom[::-1].argmax(axis=0)
+
+    return idxs[np.lexsort((idxs, last))]
+
+
+def crowding_distances(values):
+    """Compute the crowding distance of the individuals of a front, as
+    "deap.tools.assignCrowdingDist".
+
+    Arguments:
+        values (ndarray): fitnesses of the individuals, in the front order.
+
+    Returns:
+        ndarray: crowding distance of each individual.
+    """
+    num, nobj = values.shape
+    distances = np.zeros(num)
+    # The order of each objective starts from the order of the previous one
+    # (stable sort), like DEAP, so the ties are broken the same way
+    order = np.arange(num)
+
+    for obj in range(nobj):
+        order = order[np.argsort(values[order, obj], kind='stable')]
+        col = values[order, obj]
+
+        distances[order[0]] = float('inf')
+        distances[order[-1]] = float('inf')
+        if col[-1] == col[0]:
+            continue
+
+        norm = nobj * float(col[-1] - col[0])
+        distances[order[1:-1]] += (col[2:] - col[:-2]) / norm
+
+    return distances
+
+
+def sort_nondominated(individuals, k, first_front_only=False):
+    """Sort the individuals into non-domination fronts, as
+    "deap.tools.sortNondominated", until at least "k" are sorted.
+
+    Arguments:
+        individuals (list): individuals to sort.
+        k (int): number of individuals to sort.
+        first_front_only (bool, optional): sort only the first front
+            (default: False).
+
+    Returns:
+        list: fronts (lists of individuals), the first is non-dominated.
+    """
+    if k == 0:
+        return []
+
+    if not individuals:
+        return [[]]
+
+    # Group the individuals with equal fitness, in the order they show up
+    groups = {}
+    for ind in individuals:
+        groups.setdefault(ind.fitness.wvalues, []).append(ind)
+
+    wvalues = np.array(list(groups.keys()), dtype=float).reshape(len(groups), -1)
+
+    if not np.isfinite(wvalues).all():
+        return tools.sortNondominated(individuals, k, first_front_only)
+
+    ranks = ranks_2d(wvalues) if wvalues.shape[1] == 2 else ranks_nd(wvalues)
+    group_list = list(groups.values())
+    sizes = np.array([len(group) for group in group_list])
+
+    num = min(len(individuals), k)
+    front = np.flatnonzero(ranks == 0)
+    fronts = [front]
+    sorted_inds = sizes[front].sum()
+
+    if not first_front_only:
+        rank = 0
+        while sorted_inds < num:
+            rank += 1
+            front = front_order(wvalues[front], wvalues, np.flatnonzero(ranks == rank))
+            fronts.append(front)
+            sorted_inds += sizes[front].sum()
+
+    return [list(chain.from_iterable(group_list[idx] for idx in front.tolist()))
+            for front in fronts]
+
+
+def sel_nsga2(individuals, k):
+    """Select "k" individuals with the NSGA-II operator, as
+    "deap.tools.selNSGA2" (with the standard non-dominated sort).
+
+    Arguments:
+        individuals (list): individuals to select from.
+        k (int): number of individuals to select.
+
+    Returns:
+        list: selected individuals.
+    """
+    pareto_fronts = sort_nondominated(individuals, k)
+
+    values = []
+    for front in pareto_fronts:
+        if not front:
+            values.append(None)
+            continue
+
+        front_values = np.array([ind.fitness.values for ind in front], dtype=float)
+        if not np.isfinite(front_values).all():
+            return tools.selNSGA2(individuals, k)
+        values.append(front_values.reshape(len(front), -1))
+
+    distances = []
+    for front, front_values in zip(pareto_fronts, values):
+        if not front:
+            distances.append(None)
+            continue
+
+        front_dist = crowding_distances(front_values)
+        for ind, dist in zip(front, front_dist.tolist()):
+            ind.fitness.crowding_dist = dist
+        distances.append(front_dist)
+
+    chosen = list(chain(*pareto_fronts[:-1]))
+    k = k - len(chosen)
+    if k > 0:
+        # Decreasing crowding distance, keeping the front order on ties
+        order = np.argsort(-distances[-1], kind='stable')
+        chosen.extend(pareto_fronts[-1][idx] for idx in order[:k].tolist())
+
+    return chosen
@@ -0,0 +1,166 @@
+# This file is part of SMOC
+# Copyright (C) 2018  Miguel Fernandes
+#
+# SMOC is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SMOC is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""Surrogate models of the circuit simulation results."""
+
+import math
+
+import numpy as np
+
+
+class RBFSurrogate:
+    """A radial basis function (RBF) regression model of the simulation results.
+
+    Uses a cubic kernel with a linear polynomial tail, fitted on the circuit
+    variables normalized to [0, 1]. Each simulation result is an output of the
+    model. The model is trained with the most recent "max_samples" evaluated
+    individuals, and can be retrained every time new samples are added.
+
+    Arguments:
+        bound_low (list): lower bounds of the circuit variables.
+        bound_up (list): upper bounds of the circuit variables.
+        result_names (list): names of the simulation results to model.
+        max_samples (int, optional): max number of training samples
+            (default: 1000).
+        smoothing (float, optional): smoothing (ridge) factor, which also
+            makes the model robust to duplicated samples (default: 1e-9).
+    """
+
+    def __init__(self, bound_low, bound_up, result_names, max_samples=1000, smoothing=1e-9):
+        """Create the model."""
+        self.low = np.array(bound_low, dtype=float)
+        self.range = np.array(bound_up, dtype=float) - self.low
+        self.range[self.range <= 0] = 1.0
+        self.result_names = list(result_names)
+        self.max_samples = max_samples
+        self.smoothing = smoothing
+
+        # Training samples (normalized variables and results)
+        self.x = np.empty((0, len(bound_low)))
+        self.y = np.empty((0, len(result_names)))
+
+        # Model parameters (None if not trained)
+        self.centers = None
+        self.weights = None
+        self.poly = None
+        self.y_mean = None
+        self.y_std = None
+
+    def normalize(self, individuals):
+        """Normalize the circuit variables of individuals to [0, 1].
+
+        Arguments:
+            individuals (list): list of individuals.
+
+        Returns:
+            ndarray: normalized circuit variables (one row per individual).
+        """
+        x = np.array([list(ind) for ind in individuals], dtype=float).reshape(
+            len(individuals), len(self.low))
+
+        return (x - self.low) / self.range
+
+    def add_samples(self, individuals):
+        """Add evaluated individuals to the training samples.
+
+        Individuals with missing or non-finite results are ignored.
+
+        Arguments:
+            individuals (list): evaluated individuals (with "result").
+        """
+        rows = []
+        inds = []
+
+        for ind in individuals:
+            try:
+                row = [float(ind.result[key]) for key in self.result_names]
+            except (KeyError, TypeError, ValueError):
+                continue
+
+            if all(math.isfinite(val) for val in row):
+                rows.append(row)
+                inds.append(ind)
+
+        if not rows:
+            return
+
+        self.x = np.vstack((self.x, self.normalize(inds)))[-self.max_samples:]
+        self.y = np.vstack((self.y, np.array(rows)))[-self.max_samples:]
+
+    def ready(self):
+        """Check if there are enough samples to train the model.
+
+        Returns:
+            bool: True if the model can be trained.
+        """
+        # The linear tail needs (at least) one sample per variable plus one
+        return len(self.x) > self.x.shape[1] + 1
+
+    @staticmethod
+    def kernel(dist):
+        """Cubic radial basis function."""
+        return dist ** 3
+
+    def fit(self):
+        """(Re)train the model with the current training samples."""
+        if not self.ready():
+            return
+
+        x = self.x
+        num = len(x)
+
+        # Normalize the outputs to improve the conditioning
+        self.y_mean = self.y.mean(axis=0)
+        self.y_std = self.y.std(axis=0)
+        self.y_std[self.y_std == 0] = 1.0
+        y = (self.y - self.y_mean) / self.y_std
+
+        dist = np.sqrt(((x[:, None, :] - x[None, :, :]) ** 2).sum(axis=2))
+        poly = np.hstack((np.ones((num, 1)), x))
+
+        # Augmented system: [[K + s*I, P], [P^T, 0]] [w; c] = [y; 0]
+        size = num + poly.shape[1]
+        mat = np.zeros((size, size))
+        mat[:num, :num] = self.kernel(dist) + self.smoothing * np.eye(num)
+        mat[:num, num:] = poly
+        mat[num:, :num] = poly.T
+        rhs = np.vstack((y, np.zeros((poly.shape[1], y.shape[1]))))
+
+        try:
+            coefs = np.linalg.solve(mat, rhs)
+        except np.linalg.LinAlgError:
+            coefs = np.linalg.lstsq(mat, rhs, rcond=None)[0]
+
+        self.centers = x.copy()
+        self.weights = coefs[:num]
+        self.poly = coefs[num:]
+
+    def predict(self, individuals):
+        """Predict the simulation results of individuals.
+
+        Arguments:
+            individuals (list): list of individuals.
+
+        Returns:
+            list: predicted simulation results of each individual (dicts).
+        """
+        x = self.normalize(individuals)
+
+        dist = np.sqrt(((x[:, None, :] - self.centers[None, :, :]) ** 2).sum(axis=2))
+        y = self.kernel(dist) @ self.weights
+        y += np.hstack((np.ones((len(x), 1)), x)) @ self.poly
+        y = y * self.y_std + self.y_mean
+
+        return [dict(zip(self.result_names, row)) for row in y.tolist()]
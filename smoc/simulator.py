@@ -0,0 +1,830 @@
+# This file is part of SMOC
+# Copyright (C) 2018  Miguel Fernandes
+#
+# SMOC is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SMOC is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""Communication with the simulation servers."""
+
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from .interface.client import Client
+
+logger = logging.getLogger('smoc.simulator')
+
+# Binary format of the "updateAndRun" batches (little-endian float64 matrices)
+BINARY_FORMAT = 'f64'
+# Max time between two reconnection attempts, in seconds
+MAX_RECONNECT_DELAY = 60.0
+
+
+def load_simulator(client, pop_size, variables=None, template_hash=None, run_timeout=None):
+    """Load the Cadence simulator before starting the optimization.
+
+    This task is performed once per run (contrary to the Cadence ADE) that
+    loads the simulator everytime we run a simulation, which is very
+    inefficient. The server keeps the simulator loaded across clients, and
+    only loads it again if the simulation template changed.
+
+    If the names of the circuit variables are given, and the client supports
+    it, the binary format of the batches is offered to the server.
+
+    Arguments:
+        client (handler): client that communicates with the simulator.
+        pop_size (int): population size.
+        variables (list or None, optional): names of the circuit variables to
+            send in each batch (default: None).
+        template_hash (str or None, optional): hash of the simulation
+            template expected by the client (e.g. when reconnecting). If the
+            loaded simulator has another template, it's loaded again
+            (default: None).
+        run_timeout (float or None, optional): max duration of each
+            simulation job, in seconds. The simulator kills the jobs that run
+            longer (e.g. a hung simulation), which then have no results. If
+            None, the jobs are never killed (default: None).
+
+    Raises:
+        KeyError: if the response format is invalid.
+        TypeError: if the server response is not from the expected type.
+
+    Returns:
+        tuple: circuit design variables, simulator information (e.g. the
+            simulation template hash), if provided by the server, and the
+            schema of the binary batches (None if the batches are in JSON).
+    """
+    req = dict(type='loadSimulator', data=pop_size)
+    if template_hash is not None:
+        req['template_hash'] = template_hash
+    if run_timeout is not None:
+        req['run_timeout'] = run_timeout
+    if variables is not None and hasattr(client, 'send_matrix'):
+        req['schema'] = dict(formats=[BINARY_FORMAT], variables=list(variables))
+    client.send_data(req)
+    res = client.recv_data()
+
+    try:
+        res_type = res['type']
+        data = res['data']
+    except KeyError as err:  # if the key does not exist
+        raise KeyError(err)
+
+    if res_type != 'loadSimulator':
+        raise TypeError('The response type should be "loadSimulator"!!!')
+
+    schema = res.get('schema')
+    if schema is not None and schema.get('format') != BINARY_FORMAT:
+        schema = None
+
+    return data, res.get('info', {}), schema
+
+
+def check_simulator(res_vars, sim_info, circuit_vars, stages=None):
+    """Check that the loaded simulator matches the configuration.
+
+    Arguments:
+        res_vars (dict): circuit design variables of the simulator.
+        sim_info (dict): simulator information.
+        circuit_vars (dict): circuit design variables of the configuration.
+        stages (list or None, optional): screening stages of the
+            configuration (default: None).
+
+    Raises:
+        ValueError: if the circuit variables don't match, or if the server
+            has no test set of a stage.
+    """
+    diff = set(circuit_vars.keys()) - set(res_vars.keys())
+
+    if diff:  # If it's not empty (i.e. bool(diff) is True)
+        err = "The circuit variables don't match with the variables provided in the file"
+        raise ValueError(err)
+
+    for stage in stages or []:
+        if stage['name'] not in sim_info.get('stages', []):
+            raise ValueError(f"The server has no test set of the stage '{stage['name']}'")
+
+
+def send_batch(client, variables, schema=None, more=False, stage=None):
+    """Send a batch of circuit variables to simulate ("updateAndRun" request),
+    without waiting for the results.
+
+    Arguments:
+        client (handler): client that communicates with the simulator.
+        variables (list): circuit variables of each simulation.
+        schema (dict or None, optional): schema of the binary batches,
+            negotiated with "load_simulator". If None, the batch is sent in
+            JSON (default: None).
+        more (bool, optional): another batch is sent right after this one, so
+            the server can prepare it while this one is simulated
+            (default: False).
+        stage (str or None, optional): evaluation stage (test set) to simulate.
+            If None, the full simulation is run (default: None).
+    """
+    if schema is None:
+        req = dict(type='updateAndRun', data=variables)
+    else:
+        # The variable names are only sent once (in the schema)
+        req = dict(type='updateAndRun', format=BINARY_FORMAT, rows=len(variables))
+
+    if more:
+        req['more'] = True
+    if stage is not None:
+        req['stage'] = stage
+
+    if schema is None:
+        client.send_data(req)
+    else:
+        with client.timer.phase('serialization'):
+            matrix = [[var[key] for key in schema['variables']] for var in variables]
+        client.send_data(req)
+        client.send_matrix(matrix)
+
+
+def request_timeout(num_sims, batch_timeout=None, sim_timeout=None):
+    """Get the time allowed for the response of a request.
+
+    Arguments:
+        num_sims (int): number of simulations of the request.
+        batch_timeout (float or None, optional): time allowed for each
+            request (default: None).
+        sim_timeout (float or None, optional): time allowed for each
+            simulation of a request (default: None).
+
+    Returns:
+        float or None: timeout, in seconds (None if there's no deadline).
+    """
+    if batch_timeout is None and sim_timeout is None:
+        return None
+
+    return (batch_timeout or 0.0) + (sim_timeout or 0.0) * num_sims
+
+
+def discard_late(client, deadline=None):
+    """Receive and discard the responses of the abandoned requests of a
+    client (that missed their deadline).
+
+    Arguments:
+        client (handler): client that communicates with the simulator.
+        deadline (float or None, optional): deadline of the responses
+            (default: None).
+
+    Raises:
+        TimeoutError: if a response doesn't arrive before the deadline.
+    """
+    while client.late:
+        res = client.recv_data(deadline)
+        if res.get('format') == BINARY_FORMAT:
+            client.recv_matrix(res['rows'])
+        client.late -= 1
+        logger.info("Discarded a late response of the server")
+
+
+def recv_results(client, schema=None, deadline=None):
+    """Receive the simulation results of a batch ("updateAndRun" response).
+
+    Arguments:
+        client (handler): client that communicates with the simulator.
+        schema (dict or None, optional): schema of the binary batches. The
+            names of the results are updated when the server sends them
+            (default: None).
+        deadline (float or None, optional): deadline of the response (time in
+            seconds since the epoch). If None, it waits indefinitely
+            (default: None).
+
+    Raises:
+        KeyError: if the response type or format is invalid.
+        TimeoutError: if the response doesn't arrive before the deadline.
+
+    Returns:
+        list: simulation results of each simulation.
+    """
+    if getattr(client, 'late', 0):
+        discard_late(client, deadline)
+
+    res = client.recv_data() if deadline is None else client.recv_data(deadline)
+
+    try:
+        res_type = res['type']
+        if res.get('format') == BINARY_FORMAT:
+            matrix = client.recv_matrix(res['rows'])
+            schema['results'] = res.get('results', schema.get('results'))
+            with client.timer.phase('parsing'):
+                sim_res = [dict(zip(schema['results'], row)) for row in matrix.tolist()]
+        else:
+            sim_res = res['data']
+    except KeyError as err:
+        raise KeyError(err)
+
+    if res_type != 'updateAndRun':
+        raise KeyError("Simulation error!!! Check variables defaults, etc.")
+
+    # Simulations with missing results (NaN), e.g. failed simulations
+    if res.get('failed'):
+        logger.warning("%d simulation(s) with missing results: %s", len(res['failed']),
+                       res['failed'])
+
+    # Lines of the variables file written and skipped (already applied), if
+    # reported by the server
+    if 'vars_lines' in res:
+        logger.debug("Variables file: %d lines written, %d skipped", *res['vars_lines'])
+
+    return sim_res
+
+
+def update_and_run(client, variables, schema=None, chunk_size=None, stage=None,
+                   batch_timeout=None, sim_timeout=None):
+    """Update the circuit variables and run the simulations.
+
+    If a chunk size is given, the batch is split in chunks (e.g. of the
+    number of parallel jobs of the simulator), which are pipelined: the chunk
+    k + 1 is sent, and prepared by the server, while the chunk k is
+    simulated. The results are gathered back in order.
+
+    If a timeout is given, the response of each request (chunk) is awaited
+    up to a deadline. When a deadline is missed, the requests sent are
+    abandoned (see "discard_late"), the remaining chunks are not sent, and
+    the simulations without results are returned as None.
+
+    Arguments:
+        client (handler): client that communicates with the simulator.
+        variables (list): circuit variables of each simulation.
+        schema (dict or None, optional): schema of the binary batches,
+            negotiated with "load_simulator". The names of the results are
+            updated when the server sends them. If None, the batches are sent
+            in JSON (default: None).
+        chunk_size (int or None, optional): max number of simulations per
+            request. If None, the whole batch is sent in one request
+            (default: None).
+        stage (str or None, optional): evaluation stage (test set) to simulate.
+            If None, the full simulation is run (default: None).
+        batch_timeout (float or None, optional): time allowed for the
+            response of each request (default: None).
+        sim_timeout (float or None, optional): time allowed for each
+            simulation of a request, added to "batch_timeout"
+            (default: None).
+
+    Raises:
+        KeyError: if the response type or format is invalid.
+
+    Returns:
+        list: simulation results of each simulation (None if missing).
+    """
+    if not chunk_size or len(variables) <= chunk_size:
+        chunks = [variables]
+    else:
+        chunks = [variables[idx:idx + chunk_size]
+                  for idx in range(0, len(variables), chunk_size)]
+
+    # At most two chunks in flight: the one being simulated and the next
+    send_batch(client, chunks[0], schema, more=len(chunks) > 1, stage=stage)
+    sent = 1
+
+    sim_res = []
+    for idx, chunk in enumerate(chunks):
+        if idx + 1 < len(chunks):
+            send_batch(client, chunks[idx + 1], schema, more=idx + 2 < len(chunks), stage=stage)
+            sent += 1
+
+        timeout = request_timeout(len(chunk), batch_timeout, sim_timeout)
+        if timeout is None:
+            sim_res.extend(recv_results(client, schema))
+            continue
+
+        try:
+            sim_res.extend(recv_results(client, schema, time.time() + timeout))
+        except TimeoutError:
+            # The chunks sent and not received are abandoned
+            client.late += sent - idx
+            logger.warning("No response in %.1fs: %d of %d simulations without results",
+                           timeout, len(variables) - len(sim_res), len(variables))
+            return sim_res + [None] * (len(variables) - len(sim_res))
+
+    return sim_res
+
+
+class ServerPool:
+    """A pool of simulation servers.
+
+    Each batch of simulations is split across all servers, proportionally to
+    the throughput (simulations per second) measured for each server, and the
+    results are gathered back in order.
+
+    The batch of each server can be split in chunks, sized to its parallel
+    simulation jobs, which are pipelined (see "update_and_run").
+
+    The batches can be simulated in an evaluation stage (e.g. a cheap DC
+    screening) instead of the full simulation. The throughput is only
+    measured with the full simulations.
+
+    If a timeout is given, each request must be answered before a deadline
+    (see "update_and_run"), and the simulator kills the simulation jobs that
+    run longer than the time allowed for a request of one simulation (e.g. a
+    hung simulation), so they don't keep the server busy. The batches are then
+    split in chunks of the parallel jobs of each server (unless a chunk size
+    is given), so the results of the completed chunks are kept when a chunk
+    misses its deadline. The simulations of a request that missed its
+    deadline are resubmitted, up to "retries" times, only to the servers
+    without abandoned requests (e.g. a hung simulation): if every server still
+    has late responses, the simulations fail right away. The simulations that
+    missed every deadline are returned as None. The timeouts (requests),
+    retries and failures (simulations) are counted in "stragglers".
+
+    If the connection with a server drops, the client reconnects (up to
+    "reconnects" times, with an exponential backoff) and runs the batch
+    again. The server keeps the loaded simulator, so it's not loaded again.
+
+    Arguments:
+        servers (list): servers configuration (dicts with "host" and "port").
+        smoothing (float, optional): weight of the last measurement in the
+            servers throughput moving average (default: 0.5).
+        chunk_size (int, str or None, optional): max number of simulations per
+            request. If 'auto', the number of parallel jobs reported by each
+            server is used. If None, each batch is sent in one request, unless
+            a timeout is given ('auto') (default: None).
+        batch_timeout (float or None, optional): time allowed for the
+            response of each request, in seconds (default: None).
+        sim_timeout (float or None, optional): time allowed for each
+            simulation of a request, added to "batch_timeout" (default: None).
+        retries (int, optional): max number of times that the simulations of
+            a request that missed its deadline are resubmitted (default: 0).
+        reconnects (int, optional): max number of attempts to reconnect to a
+            server whose connection dropped (default: 0).
+        reconnect_delay (float, optional): time before the first attempt to
+            reconnect, in seconds, doubled after each attempt (default: 1).
+        keep_simulator (bool, optional): at the end, the servers keep the
+            simulator loaded for the next client, instead of exiting Cadence
+            (default: False).
+    """
+
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, servers, smoothing=0.5, chunk_size=None, batch_timeout=None,
+                 sim_timeout=None, retries=0, reconnects=0, reconnect_delay=1.0,
+                 keep_simulator=False):
+        """Create a client for each server."""
+        self.servers = servers
+        self.smoothing = smoothing
+        self.batch_timeout = batch_timeout
+        self.sim_timeout = sim_timeout
+        # With a deadline, the results are kept per chunk
+        if chunk_size is None and (batch_timeout is not None or sim_timeout is not None):
+            chunk_size = 'auto'
+        self.chunk_size = chunk_size
+        # Max duration of each simulation job, the time allowed for a request
+        # of one simulation (None if unlimited)
+        self.run_timeout = request_timeout(1, batch_timeout, sim_timeout)
+        self.retries = retries
+        self.reconnects = reconnects
+        self.reconnect_delay = reconnect_delay
+        self.keep_simulator = keep_simulator
+        self.clients = [Client() for _ in servers]
+        # Measured throughput of each server (None if not measured yet)
+        self.throughput = [None] * len(servers)
+        # Number of requests waiting for a response in each server
+        self.pending = [0] * len(servers)
+        # Guards the pending requests and the late responses of the servers,
+        # since the requests are also resubmitted from the executor threads
+        self.lock = threading.RLock()
+        # One thread per server, so the requests to a server are serialized
+        self.executors = [ThreadPoolExecutor(max_workers=1) for _ in servers]
+        # Schema of the binary batches of each server (None if JSON)
+        self.schemas = [None] * len(servers)
+        # Chunk size of each server (None to send whole batches)
+        self.chunk_sizes = [None if chunk_size == 'auto' else chunk_size] * len(servers)
+        # Requests that missed the deadline, resubmitted simulations and
+        # simulations without results after all retries
+        self.stragglers = dict(timeouts=0, retries=0, failures=0)
+        # Arguments of "load_simulator" and template hash of each server, to
+        # load the simulator again after reconnecting
+        self.load_args = None
+        self.template_hashes = [None] * len(servers)
+
+    def __len__(self):
+        return len(self.clients)
+
+    def connect(self):
+        """Connect to all servers.
+
+        Raises:
+            ConnectionError: if there's a communication problem.
+
+        Returns:
+            list: address of each server.
+        """
+        addrs = []
+
+        for client, server in zip(self.clients, self.servers):
+            addr = client.run(server['host'], server['port'])
+            logger.info("Connected to server with the address %s:%s", addr[0], addr[1])
+            addrs.append(addr)
+
+        return addrs
+
+    def load_simulator(self, pop_size, variables=None):
+        """Load the simulator in all servers.
+
+        Arguments:
+            pop_size (int): max number of simulations per batch.
+            variables (list or None, optional): names of the circuit variables
+                to send in each batch, used to negotiate the binary batches
+                (default: None).
+
+        Returns:
+            tuple: circuit design variables and simulator information of the
+                first server.
+        """
+        futures = [executor.submit(load_simulator, client, pop_size, variables,
+                                   run_timeout=self.run_timeout)
+                   for client, executor in zip(self.clients, self.executors)]
+        responses = [future.result() for future in futures]
+
+        res_vars, sim_info, _ = responses[0]
+        self.load_args = (pop_size, variables)
+
+        for idx, (_, info, schema) in enumerate(responses):
+            self.schemas[idx] = schema
+            self.template_hashes[idx] = info.get('template_hash')
+            logger.info("Server %d batches format: %s", idx,
+                        schema['format'] if schema is not None else 'json')
+
+            if self.chunk_size == 'auto':
+                self.chunk_sizes[idx] = info.get('job_slots')
+                if self.chunk_sizes[idx] is None:
+                    logger.warning("Server %d doesn't report its job slots, so the batches "
+                                   "are not split in chunks", idx)
+            logger.info("Server %d chunk size: %s", idx, self.chunk_sizes[idx] or 'whole batch')
+
+            if info.get('template_hash') != sim_info.get('template_hash'):
+                logger.warning("Server %d has a different simulation template than server 0",
+                               idx)
+
+        return res_vars, sim_info
+
+    def weights(self):
+        """Get the weight of each server, i.e. its measured throughput.
+
+        Returns:
+            list: weight of each server.
+        """
+        measured = [tp for tp in self.throughput if tp]
+        # Servers not measured yet are assumed to be as fast as the average
+        default = sum(measured) / len(measured) if measured else 1.0
+
+        return [tp if tp else default for tp in self.throughput]
+
+    def responsive(self):
+        """Get the servers without abandoned requests. The late responses
+        that already arrived are discarded (only from the servers without
+        pending requests, whose connection isn't being used).
+
+        Returns:
+            list: indexes of the servers (empty if every server has late
+                responses).
+        """
+        with self.lock:
+            for idx, client in enumerate(self.clients):
+                if client.late and not self.pending[idx]:
+                    try:
+                        discard_late(client, time.time())
+                    except TimeoutError:
+                        pass
+                    except ConnectionError as err:
+                        self.reconnect(idx, err)
+
+            return [idx for idx, client in enumerate(self.clients) if not client.late]
+
+    def split(self, num_sims, servers=None):
+        """Split a batch of simulations across the servers, proportionally to
+        their throughput (largest remainder method).
+
+        Arguments:
+            num_sims (int): number of simulations.
+            servers (list or None, optional): indexes of the servers to use. If
+                None, all servers are used (default: None).
+
+        Returns:
+            list: number of simulations of each server (0 if not used).
+        """
+        weights = self.weights()
+        if servers is not None:
+            weights = [w if idx in servers else 0.0 for idx, w in enumerate(weights)]
+
+        # Every server gets at least one simulation (if possible), so its
+        # throughput keeps being measured
+        used = sum(1 for w in weights if w)
+        counts = [1 if w and num_sims >= used else 0 for w in weights]
+        remaining = num_sims - sum(counts)
+
+        shares = [remaining * w / sum(weights) for w in weights]
+        counts = [cnt + int(share) for cnt, share in zip(counts, shares)]
+
+        # Distribute the remaining simulations by the largest remainders
+        order = sorted((i for i in range(len(shares)) if weights[i]),
+                       key=lambda i: shares[i] - int(shares[i]), reverse=True)
+        for idx in order[:num_sims - sum(counts)]:
+            counts[idx] += 1
+
+        return counts
+
+    def run_on_server(self, idx, variables, stage=None):
+        """Run a batch of simulations in one server and measure its throughput.
+
+        Arguments:
+            idx (int): server index.
+            variables (list): circuit variables of each simulation.
+            stage (str or None, optional): evaluation stage. If None, the full
+                simulation is run (default: None).
+
+        Returns:
+            list: simulation results of each simulation (None if it missed
+                the deadline).
+        """
+        start_time = time.time()
+        attempt = 0
+        while True:
+            try:
+                sim_res = update_and_run(self.clients[idx], variables, self.schemas[idx],
+                                         self.chunk_sizes[idx], stage, self.batch_timeout,
+                                         self.sim_timeout)
+                break
+            except ConnectionError as err:
+                # The batch is run again after reconnecting
+                attempt += 1
+                if attempt > self.reconnects:
+                    raise
+                self.reconnect(idx, err)
+        elapsed = max(time.time() - start_time, 1e-9)
+
+        # Only the completed simulations count for the throughput
+        completed = len(variables)
+        if None in sim_res:
+            self.stragglers['timeouts'] += 1
+            completed -= sim_res.count(None)
+
+        if stage is not None:
+            return sim_res
+
+        throughput = completed / elapsed
+        if self.throughput[idx] is None:
+            self.throughput[idx] = throughput
+        else:
+            self.throughput[idx] = (self.smoothing * throughput +
+                                    (1 - self.smoothing) * self.throughput[idx])
+
+        return sim_res
+
+    def reconnect(self, idx, err):
+        """Reconnect to a server whose connection dropped, and load the
+        simulator again (the server reuses the loaded simulator, if it has the
+        same template). The time between attempts is doubled after each one.
+
+        Arguments:
+            idx (int): server index.
+            err (Exception): error of the dropped connection.
+
+        Raises:
+            ConnectionError: if all the attempts failed.
+        """
+        server = self.servers[idx]
+        delay = self.reconnect_delay
+
+        for attempt in range(1, self.reconnects + 1):
+            logger.warning("Connection with the server %d dropped (%s). Reconnecting in "
+                           "%.1fs (attempt %d/%d)", idx, err, delay, attempt, self.reconnects)
+            time.sleep(delay)
+            delay = min(2 * delay, MAX_RECONNECT_DELAY)
+
+            try:
+                self.clients[idx].reconnect(server['host'], server['port'])
+                if self.load_args is not None:
+                    _, info, self.schemas[idx] = load_simulator(self.clients[idx],
+                                                                *self.load_args,
+                                                                self.template_hashes[idx],
+                                                                self.run_timeout)
+                    if info.get('template_hash') != self.template_hashes[idx]:
+                        logger.warning("Server %d loaded a different simulation template", idx)
+            except ConnectionError as error:
+                err = error
+                continue
+
+            logger.info("Reconnected to server %d", idx)
+            return
+
+        raise ConnectionError(f"Couldn't reconnect to the server {idx}: {err}")
+
+    def run_batch(self, variables, stage=None):
+        """Simulate a batch of circuit variables across the responsive
+        servers (all the servers, if none is) (one attempt).
+
+        Arguments:
+            variables (list): circuit variables of each simulation.
+            stage (str or None, optional): evaluation stage. If None, the full
+                simulation is run (default: None).
+
+        Returns:
+            list: simulation results of each simulation, in the original order
+                (None if it missed the deadline).
+        """
+        futures = []
+        start = 0
+
+        servers = self.responsive() or list(range(len(self.clients)))
+        for idx, count in enumerate(self.split(len(variables), servers)):
+            if count:
+                chunk = variables[start:start + count]
+                futures.append(self.executors[idx].submit(self.run_on_server, idx, chunk,
+                                                          stage))
+            start += count
+
+        sim_res = []
+        for future in futures:
+            sim_res.extend(future.result())
+
+        return sim_res
+
+    def missing(self, sim_res, attempt):
+        """Get the simulations without results that are resubmitted. They
+        fail (are not resubmitted) after the last retry, or if every server
+        has late responses, so they would wait behind an abandoned request.
+
+        Arguments:
+            sim_res (list): simulation results of each simulation (None if
+                missing).
+            attempt (int): number of attempts done.
+
+        Returns:
+            list: indexes of the simulations to resubmit.
+        """
+        missing = [idx for idx, res in enumerate(sim_res) if res is None]
+        if not missing:
+            return missing
+
+        if attempt > self.retries:
+            self.stragglers['failures'] += len(missing)
+            logger.warning("%d simulation(s) without results after %d retries", len(missing),
+                           self.retries)
+            return []
+
+        if not self.responsive():
+            self.stragglers['failures'] += len(missing)
+            logger.warning("%d simulation(s) without results: every server is still "
+                           "running an abandoned request", len(missing))
+            return []
+
+        self.stragglers['retries'] += len(missing)
+        logger.warning("Resubmitting %d simulation(s) (retry %d/%d)", len(missing), attempt,
+                       self.retries)
+
+        return missing
+
+    def evaluate(self, variables, stage=None):
+        """Simulate a batch of circuit variables across all servers. The
+        simulations that miss the deadline are resubmitted (see "retries").
+
+        Arguments:
+            variables (list): circuit variables of each simulation.
+            stage (str or None, optional): evaluation stage. If None, the full
+                simulation is run (default: None).
+
+        Returns:
+            list: simulation results of each simulation, in the original order
+                (None if it missed every deadline).
+        """
+        sim_res = self.run_batch(variables, stage)
+
+        attempt = 1
+        missing = self.missing(sim_res, attempt)
+        while missing:
+            retry_res = self.run_batch([variables[idx] for idx in missing], stage)
+            for idx, res in zip(missing, retry_res):
+                sim_res[idx] = res
+            attempt += 1
+            missing = self.missing(sim_res, attempt)
+
+        logger.debug("Servers throughput (sims/s): %s", self.throughput)
+
+        return sim_res
+
+    def submit_request(self, variables, stage=None):
+        """Submit a batch of simulations to the least loaded responsive
+        server (of all the servers, if none is), without waiting for the
+        results.
+
+        Arguments:
+            variables (list): circuit variables of each simulation.
+            stage (str or None, optional): evaluation stage. If None, the full
+                simulation is run (default: None).
+
+        Returns:
+            Future: future with the simulation results.
+        """
+        # The server is chosen and its request marked as pending at once, so
+        # the requests submitted by other threads (e.g. resubmissions) see it
+        with self.lock:
+            weights = self.weights()
+            servers = self.responsive() or list(range(len(self.clients)))
+            idx = min(servers, key=lambda i: (self.pending[i] + 1) / weights[i])
+
+            self.pending[idx] += 1
+            future = self.executors[idx].submit(self.run_on_server, idx, variables, stage)
+
+        future.add_done_callback(lambda _: self.release(idx))
+
+        return future
+
+    def submit(self, variables, stage=None):
+        """Submit a batch of simulations to the least loaded server, without
+        waiting for the results. The simulations that miss the deadline are
+        resubmitted (see "retries").
+
+        Arguments:
+            variables (list): circuit variables of each simulation.
+            stage (str or None, optional): evaluation stage. If None, the full
+                simulation is run (default: None).
+
+        Returns:
+            Future: future with the simulation results (None if missed every
+                deadline).
+        """
+        if self.batch_timeout is None and self.sim_timeout is None:
+            return self.submit_request(variables, stage)
+
+        future = Future()
+        sim_res = [None] * len(variables)
+
+        def run_attempt(attempt, missing):
+            """Submit the simulations without results."""
+            request = self.submit_request([variables[idx] for idx in missing], stage)
+            request.add_done_callback(lambda done: attempt_done(attempt, missing, done))
+
+        def attempt_done(attempt, missing, done):
+            """Merge the results of an attempt, and resubmit the missing ones."""
+            try:
+                for idx, res in zip(missing, done.result()):
+                    sim_res[idx] = res
+                missing = self.missing(sim_res, attempt)
+                if missing:
+                    run_attempt(attempt + 1, missing)
+                else:
+                    future.set_result(sim_res)
+            except Exception as err:  # pylint: disable=broad-except
+                future.set_exception(err)
+
+        run_attempt(1, list(range(len(variables))))
+
+        return future
+
+    def release(self, idx):
+        """Mark a request of a server as finished.
+
+        Arguments:
+            idx (int): server index.
+        """
+        with self.lock:
+            self.pending[idx] -= 1
+
+    def stats(self):
+        """Get the communication counters, summed over all servers.
+
+        Returns:
+            tuple: time of each communication step (request serialization,
+                waiting on the server, result parsing), and number of bytes
+                sent and received.
+        """
+        times = {}
+        for client in self.clients:
+            for key, val in client.timer.totals.items():
+                times[key] = times.get(key, 0.0) + val
+
+        counts = dict(bytes_sent=sum(client.bytes_sent for client in self.clients),
+                      bytes_received=sum(client.bytes_recv for client in self.clients))
+
+        return times, counts
+
+    def send_exit(self):
+        """Tell all servers to end the connection, and Cadence (unless the
+        servers keep the simulator loaded for the next client). A server that
+        is still simulating an abandoned request (see "batch_timeout") can
+        miss the message, and then waits for the next client.
+        """
+        req = dict(type='info', data='disconnect' if self.keep_simulator else 'exit')
+        for client in self.clients:
+            client.send_data(req)
+
+    def close(self):
+        """Close the connection with all servers."""
+        for client in self.clients:
+            client.close()
+
+        for executor in self.executors:
+            executor.shutdown(wait=False)
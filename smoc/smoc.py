@@ -19,46 +19,17 @@ import logging
 import os
 import time
 
-from socad import Client
+from .optimizer.database import ResultsDatabase
 from .optimizer.ga import OptimizerNSGA2
+from .optimizer.islands import IslandModel, island_files
+from .optimizer.penalty import MAX_PENALTY
+from .simulator import ServerPool, check_simulator
 from .util import file
+from .util.checkpoint import CheckpointStore
+from .util.metrics import MetricsRecorder
 from .util import plot as plt
 
 
-def load_simulator(client, pop_size):
-    """Load the Cadence simulator before starting the optimization.
-
-    This task is performed once per run (contrary to the Cadence ADE) that
-    loads the simulator everytime we run a simulation, which is very
-    inefficient.
-
-    Arguments:
-        client (handler): client that communicates with the simulator.
-        pop_size (int): population size.
-
-    Raises:
-        KeyError: if the response format is invalid.
-        TypeError: if the server response is not from the expected type.
-
-    Returns:
-        dict: circuit design variables.
-    """
-    req = dict(type='loadSimulator', data=pop_size)
-    client.send_data(req)
-    res = client.recv_data()
-
-    try:
-        res_type = res['type']
-        data = res['data']
-    except KeyError as err:  # if the key does not exist
-        raise KeyError(err)
-
-    if res_type != 'loadSimulator':
-        raise TypeError('The response type should be "loadSimulator"!!!')
-
-    return data
-
-
 def print_summary(log_file, current_time, project_cfg, optimizer_cfg, server_cfg,
                   objectives, constraints, circuit_vars, checkpoint_load, debug):
     """Print a summary with the project, circuit, and optimizer configurations.
@@ -68,15 +39,18 @@ def print_summary(log_file, current_time, project_cfg, optimizer_cfg, server_cfg
         current_time (str): current date and time.
         project_cfg (dict): project configuration parameters.
         optimizer_cfg (dict): optimizer configuration parameters.
-        server_cfg (dict): server configuration parameters.
+        server_cfg (list): configuration parameters of each server.
         objectives (dict): optimization objectives.
         constraints (dict): optimization constraints.
         circuit_vars (dict): circuit design variables.
-        checkpoint_load (str or None): checkpoint file to load, if provided.
+        checkpoint_load (str or None): checkpoint (file or directory) to load,
+            if provided.
         debug (bool): running mode (debug mode if True).
     """
     running_mode = "debug" if debug else "normal"
-    checkpoint_fname = checkpoint_load.split('/')[-1].split('.')[0] if checkpoint_load else "no"
+    checkpoint_fname = "no"
+    if checkpoint_load:
+        checkpoint_fname = os.path.basename(os.path.normpath(checkpoint_load)).split('.')[0]
 
     summary = f"""
 ********************************************************************************
@@ -98,6 +72,15 @@ def print_summary(log_file, current_time, project_cfg, optimizer_cfg, server_cfg
 * Crossover crowding degree: {optimizer_cfg['cx_eta']}
 * Fitness penalty delta: {optimizer_cfg['penalty_delta']}
 * Fitness penalty weight: {optimizer_cfg['penalty_weight']}
+* Evaluation cache size: {optimizer_cfg['cache_size']}
+* Steady-state mode: {optimizer_cfg['steady_state']}
+* Surrogate oversampling: {optimizer_cfg['surrogate_oversample']}
+* Early stopping window: {optimizer_cfg['early_stop_window']}
+* Island model: {optimizer_cfg['island_model']}
+* Request timeout (batch/sim): {optimizer_cfg['batch_timeout']}/{optimizer_cfg['sim_timeout']}
+* Failed individual retries: {optimizer_cfg['failure_retries']}
+* Failed individual penalty: {optimizer_cfg['failure_penalty']}
+* Keep the simulator loaded: {optimizer_cfg['keep_simulator']}
 **************************** Optimization objectives ***************************\n"""
     for key, val in objectives.items():
         summary += f"* {key}: {val[0]} [{val[1]}]\n"
@@ -108,8 +91,8 @@ def print_summary(log_file, current_time, project_cfg, optimizer_cfg, server_cfg
     for key, val in circuit_vars.items():
         summary += f"* {key}: min = {val[0][0]}, max = {val[0][1]} [{val[1]}]\n"
     summary += "******************************* Server parameters ******************************\n"
-    summary += f"* Host: {server_cfg['host']}\n"
-    summary += f"* Port: {server_cfg['port']}\n"
+    for server in server_cfg:
+        summary += f"* Host: {server['host']} | Port: {server['port']}\n"
     summary += "********************************************************************************\n"
 
     print(summary)
@@ -168,12 +151,34 @@ def create_logger(verbose, fname):
     return logger
 
 
+def complete_fronts(fronts, penalty):
+    """Remove from the pareto fronts the individuals with incomplete results
+    (e.g. rejected by a screening stage or failed), which can't be plotted.
+
+    Arguments:
+        fronts (list): pareto fronts (lists of individuals).
+        penalty (PenaltyEngine): penalty engine of the optimizer.
+
+    Returns:
+        list: pareto fronts of the individuals with complete results.
+    """
+    complete = []
+    for front in fronts:
+        incomplete = penalty.incomplete([ind.result for ind in front])
+        front = [ind for ind, skip in zip(front, incomplete) if not skip]
+        if front:
+            complete.append(front)
+
+    return complete
+
+
 def run_smoc(config_file, checkpoint_load, debug):
     """Run SMOC.
 
     Arguments:
         config_file (str): path of configuration file.
-        checkpoint_load (str or None): checkpoint file to load, if provided.
+        checkpoint_load (str or None): checkpoint (file or directory) to load,
+            if provided.
         debug (boolean): running mode (debug mode if True).
 
     Raises:
@@ -197,6 +202,12 @@ def run_smoc(config_file, checkpoint_load, debug):
     objectives = smoc_cfg['objectives']
     constraints = smoc_cfg['constraints']
     server_cfg = smoc_cfg['server_cfg']
+    # Screening stages (optional), simulated before the full simulation
+    stages = smoc_cfg.get('stages') or []
+
+    # The server configuration can be a single server or a list of servers
+    if not isinstance(server_cfg, list):
+        server_cfg = [server_cfg]
 
     # Get current date and time
     current_time = time.strftime("%Y%m%d_%H-%M", time.localtime())
@@ -204,11 +215,13 @@ def run_smoc(config_file, checkpoint_load, debug):
     # Define the checkpoint/logbook/plot file names
     project_dir = f"{project_cfg['project_path']}/{project_cfg['project_name']}"
     checkpoint_dir = project_dir + f"/{project_cfg['checkpoint_path']}"
-    checkpoint_fname = checkpoint_dir + f"/cp_{current_time}.pickle"
+    checkpoint_fname = checkpoint_dir + f"/cp_{current_time}"
     logbook_dir = project_dir + f"/{project_cfg['logbook_path']}"
     logbook_fname = logbook_dir + f"/lb_{current_time}.pickle"
+    archive_dir = logbook_dir + f"/archive_{current_time}"
     plot_dir = project_dir + f"/{project_cfg['plot_path']}"
     plot_fname = plot_dir + f"/plt_{current_time}.html"
+    metrics_fname = project_dir + f"/metrics_{current_time}.jsonl"
 
     # Get the verbosity
     verbose = project_cfg['verbose']
@@ -218,20 +231,35 @@ def run_smoc(config_file, checkpoint_load, debug):
 
     logger = create_logger(verbose, log_file)
 
-    try:
-        logger.info("Starting client...")
-        client = Client()
-    except OSError as err:
-        logger.error("SOCKET - %s", err)
-        print("\n**** Ending program... Bye! ****")
-        return 2
+    # In the island model, each island (process) connects to its own server
+    island_model = optimizer_cfg.get('island_model', False)
+    client = None
+
+    # Chunks and deadlines of the requests to the server(s), and reconnection
+    # if a connection drops
+    client_args = dict(chunk_size=optimizer_cfg.get('chunk_size'),
+                       batch_timeout=optimizer_cfg.get('batch_timeout'),
+                       sim_timeout=optimizer_cfg.get('sim_timeout'),
+                       retries=optimizer_cfg.get('max_retries', 2),
+                       reconnects=optimizer_cfg.get('reconnect_attempts', 5),
+                       reconnect_delay=optimizer_cfg.get('reconnect_delay', 1.0),
+                       keep_simulator=optimizer_cfg.get('keep_simulator', False))
+
+    if not island_model:
+        try:
+            logger.info("Starting client...")
+            client = ServerPool(server_cfg, **client_args)
+        except OSError as err:
+            logger.error("SOCKET - %s", err)
+            print("\n**** Ending program... Bye! ****")
+            return 2
 
     return_code = 0
 
     try:
-        logger.info("Connecting to server...")
-        addr = client.run(server_cfg['host'], server_cfg['port'])
-        logger.info("Connected to server with the address %s:%s", addr[0], addr[1])
+        if client is not None:
+            logger.info("Connecting to %d server(s)...", len(server_cfg))
+            client.connect()
 
         # Get the population size
         pop_size = optimizer_cfg['pop_size']
@@ -243,16 +271,59 @@ def run_smoc(config_file, checkpoint_load, debug):
         if not 'lambda' in optimizer_cfg:
             optimizer_cfg['lambda'] = pop_size
 
-        # Load the simulator
-        logger.info("Loading simulator...")
-        res_vars = load_simulator(client, pop_size)
+        # Optional optimizer parameters and their default values
+        optional_cfg = dict(cache_size=0, cache_resolution=1e-6, steady_state=False,
+                            in_flight=None, batch_size=1, surrogate_oversample=1,
+                            surrogate_top_k=None, surrogate_samples=1000, checkpoint_keep=3,
+                            checkpoint_snapshot_freq=10, checkpoint_compress=True,
+                            lambda_min=None, lambda_max=None, early_stop_window=0,
+                            early_stop_tol=1e-3, island_model=False, migration_freq=5,
+                            migration_size=5, migration_topology='ring', batch_timeout=None,
+                            sim_timeout=None, max_retries=2, failure_retries=1,
+                            failure_penalty=MAX_PENALTY, reconnect_attempts=5,
+                            reconnect_delay=1.0, keep_simulator=False)
+        for key, val in optional_cfg.items():
+            if not key in optimizer_cfg:
+                optimizer_cfg[key] = val
+
+        # Adaptive lambda, tuned to the simulation throughput, if both bounds
+        # are defined
+        if optimizer_cfg['lambda_min'] is not None and optimizer_cfg['lambda_max'] is not None:
+            lambda_bounds = (optimizer_cfg['lambda_min'], optimizer_cfg['lambda_max'])
+        else:
+            lambda_bounds = None
 
+        # Stop when the hypervolume of the pareto front converges (if the
+        # window of generations is defined)
+        if optimizer_cfg['early_stop_window']:
+            early_stop = (optimizer_cfg['early_stop_window'], optimizer_cfg['early_stop_tol'])
+        else:
+            early_stop = None
+
+        # The pre-screened offspring are simulated in the test slots of lambda
+        top_k = optimizer_cfg['surrogate_top_k']
+        if top_k is not None and top_k > optimizer_cfg['lambda']:
+            logger.warning("surrogate_top_k (%d) is limited to lambda (%d)", top_k,
+                           optimizer_cfg['lambda'])
+
+        # Each screening stage must decide defined constraints (and have a test
+        # set in the server)
+        for stage in stages:
+            unknown = set(stage['constraints']) - set(constraints.keys())
+            if unknown:
+                raise ValueError(f"The constraints {sorted(unknown)} of the stage "
+                                 f"'{stage['name']}' are not defined")
+            logger.info("Screening stage '%s': %s", stage['name'], ', '.join(stage['constraints']))
+
+        # Load the simulator. Each server must be able to run a whole batch
+        # (the simulator enables only the test slots of each batch). The
+        # islands load the simulator of their own server
         circuit_vars = smoc_cfg['circuit_vars']
-        diff = set(circuit_vars.keys()) - set(res_vars.keys())
-
-        if diff:  # If it's not empty (i.e. bool(diff) is True)
-            err = "The circuit variables don't match with the variables provided in the file"
-            raise ValueError(err)
+        max_batch = max(pop_size, optimizer_cfg['lambda'], optimizer_cfg['lambda_max'] or 0)
+        if client is not None:
+            logger.info("Loading simulator...")
+            res_vars, sim_info = client.load_simulator(max_batch, list(circuit_vars.keys()))
+            check_simulator(res_vars, sim_info, circuit_vars, stages)
 
         # Create the required directories, if they do not exist
         if not os.path.exists(project_dir):
@@ -268,40 +339,118 @@ def run_smoc(config_file, checkpoint_load, debug):
         print_summary(log_file, current_time, project_cfg, optimizer_cfg, server_cfg,
                       objectives, constraints, circuit_vars, checkpoint_load, debug)
 
+        # Open the simulation results database, if defined. The results are only
+        # reused for the same simulation template
+        database = None
+        if project_cfg.get('database_file') and client is not None:
+            if 'template_hash' in sim_info:
+                database = ResultsDatabase(f"{project_dir}/{project_cfg['database_file']}",
+                                           sim_info['template_hash'])
+            else:
+                logger.warning("The server didn't send the simulation template hash. "
+                               "The results database is disabled.")
+
+        # Record the metrics of each generation, if enabled (JSON lines, and
+        # optionally a Prometheus text-format file)
+        metrics_files = None
+        if project_cfg.get('metrics', True):
+            prom_fname = project_cfg.get('prometheus_file')
+            if prom_fname:
+                prom_fname = os.path.join(project_dir, prom_fname)
+            metrics_files = (metrics_fname, prom_fname)
+
         # Remove the units from the "circuit_vars", "objectives" and "constraints"
         circuit_vars_tmp = {key: val[0] for key, val in circuit_vars.items()}
         objectives_tmp = {key: val[0] for key, val in objectives.items()}
         constraints_tmp = {key: val[0] for key, val in constraints.items()}
 
-        # Load the optimizer
-        smoc_ga = OptimizerNSGA2(objectives_tmp, constraints_tmp, circuit_vars_tmp,
-                                 pop_size, optimizer_cfg['max_gen'], client,
-                                 optimizer_cfg['mut_prob'], optimizer_cfg['cx_prob'],
-                                 optimizer_cfg['mut_eta'], optimizer_cfg['cx_eta'],
-                                 optimizer_cfg['penalty_delta'], optimizer_cfg['penalty_weight'],
-                                 debug)
-
-        # Run the GA
-        fronts, logbook = smoc_ga.run_ga(checkpoint_fname,
-                                         optimizer_cfg['mu'],
-                                         optimizer_cfg['lambda'],
-                                         checkpoint_load,
-                                         optimizer_cfg['checkpoint_freq'],
-                                         optimizer_cfg['sel_best'],
-                                         verbose)
-
-        # End the connection with the server
-        logger.info("Ending connection with the server...")
-        req = dict(type='info', data='exit')
-        client.send_data(req)
-        client.close()  # Close the client socket
-
-        # Save logbook pickled to file
-        file.write_pickle(logbook_fname, logbook)
-
-        # Print statistics
-        logger.info("Plotting the pareto fronts...")
-        plt.plot_pareto_fronts(fronts, circuit_vars, objectives, constraints, plot_fname=plot_fname)
+        # Optimizer parameters
+        optimizer_args = dict(objectives=objectives_tmp, constraints=constraints_tmp,
+                              circuit_vars=circuit_vars_tmp, pop_size=pop_size,
+                              max_gen=optimizer_cfg['max_gen'],
+                              mut_prob=optimizer_cfg['mut_prob'], cx_prob=optimizer_cfg['cx_prob'],
+                              mut_eta=optimizer_cfg['mut_eta'], cx_eta=optimizer_cfg['cx_eta'],
+                              penalty_delta=optimizer_cfg['penalty_delta'],
+                              penalty_weight=optimizer_cfg['penalty_weight'], debug=debug,
+                              cache_size=optimizer_cfg['cache_size'],
+                              cache_resolution=optimizer_cfg['cache_resolution'],
+                              surrogate_oversample=optimizer_cfg['surrogate_oversample'],
+                              surrogate_top_k=optimizer_cfg['surrogate_top_k'],
+                              surrogate_samples=optimizer_cfg['surrogate_samples'],
+                              stages=stages, failure_retries=optimizer_cfg['failure_retries'],
+                              failure_penalty=optimizer_cfg['failure_penalty'])
+
+        # Incremental checkpoints of the optimization
+        checkpoint_args = (optimizer_cfg['checkpoint_keep'],
+                           optimizer_cfg['checkpoint_snapshot_freq'],
+                           optimizer_cfg['checkpoint_compress'])
+        checkpoints = CheckpointStore(checkpoint_fname, *checkpoint_args)
+
+        if island_model:
+            # Run one island per server, with the generational algorithm
+            if optimizer_cfg['steady_state']:
+                logger.warning("The steady-state mode is not used by the island model")
+            ga_args = dict(mu=optimizer_cfg['mu'], lambda_=optimizer_cfg['lambda'],
+                           checkpoint_freq=optimizer_cfg['checkpoint_freq'],
+                           sel_best=optimizer_cfg['sel_best'], verbose=verbose,
+                           lambda_bounds=lambda_bounds, early_stop=early_stop)
+            database_file = None
+            if project_cfg.get('database_file'):
+                database_file = f"{project_dir}/{project_cfg['database_file']}"
+
+            islands = IslandModel(server_cfg, optimizer_args, ga_args, max_batch,
+                                  optimizer_cfg['migration_freq'],
+                                  optimizer_cfg['migration_size'],
+                                  optimizer_cfg['migration_topology'],
+                                  client_args, database_file, metrics_files,
+                                  checkpoint_args)
+            fronts, archives = islands.run(checkpoints, checkpoint_load, archive_dir)
+
+            # Save the logbook of each island
+            for idx, archive in enumerate(archives):
+                file.write_pickle(island_files(logbook_fname, idx), archive.to_logbook())
+
+            logger.info("Plotting the pareto fronts...")
+            plt.plot_pareto_fronts(complete_fronts(fronts, islands.optimizer.penalty),
+                                   circuit_vars, objectives, constraints, plot_fname=plot_fname)
+
+        else:
+            metrics = MetricsRecorder(*metrics_files) if metrics_files is not None else None
+
+            # Load the optimizer
+            smoc_ga = OptimizerNSGA2(client=client, database=database, metrics=metrics,
+                                     **optimizer_args)
+
+            # Run the GA
+            fronts, archive = smoc_ga.run_ga(checkpoints,
+                                             optimizer_cfg['mu'],
+                                             optimizer_cfg['lambda'],
+                                             checkpoint_load,
+                                             optimizer_cfg['checkpoint_freq'],
+                                             optimizer_cfg['sel_best'],
+                                             verbose,
+                                             optimizer_cfg['steady_state'],
+                                             optimizer_cfg['in_flight'],
+                                             optimizer_cfg['batch_size'],
+                                             archive_dir,
+                                             lambda_bounds,
+                                             early_stop)
+
+            # End the connection with the server(s)
+            logger.info("Ending connection with the server(s)...")
+            client.send_exit()
+            client.close()  # Close the client sockets
+
+            if database is not None:
+                database.close()
+
+            # Save the logbook (reconstructed from the archive) pickled to file
+            file.write_pickle(logbook_fname, archive.to_logbook())
+
+            # Print statistics
+            logger.info("Plotting the pareto fronts...")
+            plt.plot_pareto_fronts(complete_fronts(fronts, smoc_ga.penalty), circuit_vars,
+                                   objectives, constraints, plot_fname=plot_fname)
 
     except ConnectionError as err:
         logger.error("CONNECTION - %s", err)
@@ -314,7 +463,7 @@ def run_smoc(config_file, checkpoint_load, debug):
         return_code = 5
 
     # If there was an exception (return_code != 0) it's necessary to close the socket
-    if return_code:
+    if return_code and client is not None:
         client.close()
 
     logger.info("Closing socket and exiting program... Bye!")
@@ -0,0 +1,234 @@
+# This file is part of SMOC
+# Copyright (C) 2018  Miguel Fernandes
+#
+# SMOC is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SMOC is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""Incremental checkpoints of the optimization."""
+
+import logging
+import os
+import pickle
+import re
+import zlib
+
+from . import file
+
+logger = logging.getLogger('smoc.checkpoint')
+
+# Errors raised when reading a corrupted (e.g. half written) checkpoint
+READ_ERRORS = (OSError, EOFError, ValueError, pickle.UnpicklingError, zlib.error)
+
+
+class CheckpointStore:
+    """A directory of incremental checkpoints.
+
+    Each checkpoint is either a full snapshot of the optimization state, or a
+    delta with the state changes since the previous checkpoint: the new
+    population, the random state and the records appended to the archive of
+    the evolution. A snapshot is written every "snapshot_freq" checkpoints,
+    and only the last "keep" snapshots (and the deltas after them) are kept.
+
+    The files are written to a temporary file that is then renamed, so a crash
+    never corrupts a previous checkpoint.
+
+    Arguments:
+        directory (str): checkpoints directory.
+        keep (int, optional): number of snapshots to keep (default: 3).
+        snapshot_freq (int, optional): number of checkpoints between two
+            snapshots (default: 10).
+        compress (bool, optional): compress the files with gzip (default: True).
+    """
+
+    SNAPSHOT = 'snapshot'
+    DELTA = 'delta'
+    FILE_PATTERN = re.compile(r'^(snapshot|delta)_(\d+)\.pickle(\.gz)?$')
+
+    def __init__(self, directory, keep=3, snapshot_freq=10, compress=True):
+        """Create the checkpoints directory."""
+        self.directory = directory
+        self.keep = max(keep, 1)
+        self.snapshot_freq = max(snapshot_freq, 1)
+        self.compress = compress
+
+        # Sequence number of the last checkpoint and of the last snapshot
+        self.seq = 0
+        self.snapshot_seq = 0
+        # Number of archived records at the last checkpoint
+        self.archive_len = 0
+        # Path of the last checkpoint
+        self.last_file = None
+
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+    def file_name(self, kind, seq):
+        """Get the path of a checkpoint file."""
+        ext = '.pickle.gz' if self.compress else '.pickle'
+        return os.path.join(self.directory, f"{kind}_{seq:06d}{ext}")
+
+    def save(self, cp):
+        """Save a checkpoint.
+
+        Arguments:
+            cp (dict): optimization state. The archive of the evolution, if
+                any, is stored in the "archive" key.
+        """
+        self.seq += 1
+        archive = cp.get('archive')
+
+        if self.snapshot_seq == 0 or self.seq - self.snapshot_seq >= self.snapshot_freq:
+            kind = self.SNAPSHOT
+            state = cp
+        else:
+            kind = self.DELTA
+            state = {key: val for key, val in cp.items() if key != 'archive'}
+            if archive is not None:
+                state['archive_records'] = archive.export(self.archive_len)
+
+        self.last_file = self.file_name(kind, self.seq)
+        file.write_pickle(self.last_file, dict(seq=self.seq, state=state), self.compress)
+
+        if archive is not None:
+            self.archive_len = len(archive)
+
+        if kind == self.SNAPSHOT:
+            self.snapshot_seq = self.seq
+            self.prune()
+
+    def prune(self):
+        """Remove the old snapshots, and the deltas before the oldest snapshot."""
+        files = self.list_files(self.directory)
+        snapshots = [seq for seq, kind, _ in files if kind == self.SNAPSHOT]
+
+        if len(snapshots) <= self.keep:
+            return
+
+        oldest = snapshots[-self.keep]
+        for seq, _, fname in files:
+            if seq < oldest:
+                os.remove(fname)
+
+    @classmethod
+    def list_files(cls, directory):
+        """List the checkpoint files of a directory.
+
+        Arguments:
+            directory (str): checkpoints directory.
+
+        Returns:
+            list: sequence number, type and path of each file, sorted by
+                sequence number.
+        """
+        files = []
+
+        for fname in os.listdir(directory):
+            match = cls.FILE_PATTERN.match(fname)
+            if match:
+                files.append((int(match.group(2)), match.group(1),
+                              os.path.join(directory, fname)))
+
+        return sorted(files)
+
+    @classmethod
+    def read(cls, fname, seq):
+        """Read a checkpoint file.
+
+        Raises:
+            ValueError: If the file is not the expected checkpoint.
+
+        Returns:
+            dict: stored state.
+        """
+        data = file.read_pickle(fname)
+
+        if not isinstance(data, dict) or data.get('seq') != seq:
+            raise ValueError(f"Unexpected content in {fname}")
+
+        return data['state']
+
+    @classmethod
+    def load(cls, directory, last=None):
+        """Load the newest consistent state of a checkpoints directory: the
+        newest readable snapshot plus the consecutive deltas after it.
+
+        Arguments:
+            directory (str): checkpoints directory.
+            last (int or None, optional): sequence number of the checkpoint to
+                load. If None, the newest one is loaded (default: None).
+
+        Raises:
+            ValueError: If there's no readable snapshot, or the given
+                checkpoint can't be loaded.
+
+        Returns:
+            dict: optimization state.
+        """
+        files = [(seq, kind, fname) for seq, kind, fname in cls.list_files(directory)
+                 if last is None or seq <= last]
+        deltas = {seq: fname for seq, kind, fname in files if kind == cls.DELTA}
+        snapshots = [(seq, fname) for seq, kind, fname in files if kind == cls.SNAPSHOT]
+
+        for snapshot_seq, fname in reversed(snapshots):
+            try:
+                state = cls.read(fname, snapshot_seq)
+            except READ_ERRORS as err:
+                logger.warning("Skipping the corrupted checkpoint %s (%s)", fname, err)
+                continue
+
+            seq = snapshot_seq
+            while seq + 1 in deltas:
+                try:
+                    delta = cls.read(deltas[seq + 1], seq + 1)
+                except READ_ERRORS as err:
+                    logger.warning("Skipping the corrupted checkpoint %s (%s)",
+                                   deltas[seq + 1], err)
+                    break
+
+                archive_records = delta.pop('archive_records', None)
+                state.update(delta)
+                # Rebuilt in memory: loading never writes to the archive directory
+                if archive_records is not None and state.get('archive') is not None:
+                    state['archive'].extend(archive_records, flush=False)
+                seq += 1
+
+            # The deltas before the given checkpoint can't be skipped
+            if last is not None and seq != last:
+                raise ValueError(f"Can't load the checkpoint {last} of {directory}")
+
+            logger.info("Loaded checkpoint %d (snapshot %d + %d deltas)", seq, snapshot_seq,
+                        seq - snapshot_seq)
+
+            return state
+
+        raise ValueError(f"There's no valid checkpoint in {directory}")
+
+
+def load_checkpoint(path):
+    """Load a checkpoint, either from a checkpoints directory (the newest
+    one), a file of a checkpoints directory (the state at that checkpoint), or
+    a single checkpoint file (previous versions).
+
+    Arguments:
+        path (str): checkpoints directory or checkpoint file.
+
+    Returns:
+        dict: optimization state.
+    """
+    if os.path.isdir(path):
+        return CheckpointStore.load(path)
+
+    match = CheckpointStore.FILE_PATTERN.match(os.path.basename(path))
+    if match:
+        return CheckpointStore.load(os.path.dirname(path) or '.', int(match.group(2)))
+
+    return file.read_pickle(path)
@@ -15,9 +15,16 @@
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 """Handling of files."""
 
+import gzip
+import os
 import pickle
+import tempfile
+
 import yaml
 
+# First bytes of a gzip file
+GZIP_MAGIC = b'\x1f\x8b'
+
 
 def read_yaml(fname):
     """Read the given file using YAML.
@@ -37,7 +44,8 @@ def read_yaml(fname):
 
 
 def read_pickle(fname):
-    """Read a pickle file and load the content to a variable.
+    """Read a pickle file (compressed or not) and load the content to a
+    variable.
 
     Arguments:
         fname (str): name of the file to read from.
@@ -46,16 +54,37 @@ def read_pickle(fname):
         obj: file content.
     """
     with open(fname, 'rb') as f:
+        compressed = f.read(2) == GZIP_MAGIC
+
+    with (gzip.open(fname, 'rb') if compressed else open(fname, 'rb')) as f:
         obj = pickle.load(f)
     return obj
 
 
-def write_pickle(fname, obj):
+def write_pickle(fname, obj, compress=False):
     """Write a pickled representation of an object to a file.
 
+    The object is written to a temporary file that then replaces the given
+    file, so the file is never left half written.
+
     Arguments:
         fname (str): name of the file to write to.
         obj (obj): object to write.
+        compress (bool, optional): compress the file with gzip (default: False).
     """
-    with open(fname, 'wb') as f:
-        pickle.dump(obj, f)
+    fd, tmp_fname = tempfile.mkstemp(prefix='.tmp_', dir=os.path.dirname(fname) or '.')
+
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            if compress:
+                with gzip.GzipFile(fileobj=f, mode='wb', compresslevel=6) as gz_f:
+                    pickle.dump(obj, gz_f)
+            else:
+                pickle.dump(obj, f)
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(tmp_fname, fname)
+    except BaseException:
+        os.remove(tmp_fname)
+        raise
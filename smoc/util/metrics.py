@@ -0,0 +1,178 @@
+# This file is part of SMOC
+# Copyright (C) 2018  Miguel Fernandes
+#
+# SMOC is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SMOC is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""Per-generation metrics of the optimization."""
+
+import json
+import os
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+
+def peak_rss():
+    """Get the peak resident set size (RSS) of the process.
+
+    Returns:
+        int or None: peak RSS, in bytes, or None if it's not available.
+    """
+    if resource is None:
+        return None
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # The RSS is in bytes on macOS, and in kilobytes on Linux
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def delta(current, previous):
+    """Get the difference between two dicts of counters.
+
+    Arguments:
+        current (dict): current counters.
+        previous (dict): previous counters.
+
+    Returns:
+        dict: difference of each counter.
+    """
+    return {key: val - previous.get(key, 0) for key, val in current.items()}
+
+
+class MetricsRecorder:
+    """Record the metrics of each generation (or record, in steady-state
+    mode) as JSON lines, and optionally as a Prometheus text-format file.
+
+    Each line has the generation wall time, the wall time of each phase of the
+    optimization (e.g. variation, evaluation, penalty, selection, statistics,
+    checkpoint) and of the communication with the servers (request
+    serialization, waiting on the server, result parsing), the bytes sent and
+    received, the peak RSS, and the evaluation counters (simulations, cache
+    and database hits).
+
+    The times of the communication are summed over all servers, so with
+    several servers they can add up to more than the generation wall time.
+
+    The Prometheus file has the counters since the beginning of the run and
+    the metrics of the last generation. It's rewritten (atomically) after
+    each generation, e.g. to be exported by the node exporter textfile
+    collector.
+
+    Arguments:
+        fname (str): JSON lines file (appended).
+        prom_fname (str or None, optional): Prometheus text-format file. If
+            None, it's not written (default: None).
+    """
+
+    def __init__(self, fname, prom_fname=None):
+        """Create the recorder."""
+        self.fname = fname
+        self.prom_fname = prom_fname
+
+        # Counters at the previous record, and since the beginning of the run
+        self.previous = {}
+        self.totals = {}
+        self.last_time = time.time()
+
+    def record(self, counters, **fields):
+        """Record the metrics of a generation.
+
+        Arguments:
+            counters (dict): cumulative counters of the run, i.e. the time of
+                each phase ("phases"), of the communication ("client"), and
+                the numbers of bytes and evaluations ("counts").
+            **fields: other fields of the record (e.g. gen, evals).
+
+        Returns:
+            dict: recorded metrics.
+        """
+        now = time.time()
+        metrics = dict(fields)
+        metrics['timestamp'] = now
+        metrics['wall_time'] = now - self.last_time
+        self.last_time = now
+
+        for group, values in counters.items():
+            metrics[group] = delta(values, self.previous.get(group, {}))
+            self.previous[group] = dict(values)
+
+        metrics['peak_rss'] = peak_rss()
+        self.totals = counters
+
+        with open(self.fname, 'a') as f:
+            f.write(json.dumps(metrics) + '\n')
+
+        if self.prom_fname is not None:
+            self.write_prometheus(metrics)
+
+        return metrics
+
+    def write_prometheus(self, metrics):
+        """Write the Prometheus text-format file.
+
+        Arguments:
+            metrics (dict): metrics of the last generation.
+        """
+        lines = []
+
+        def add(name, kind, help_text, samples):
+            lines.append(f"# HELP smoc_{name} {help_text}")
+            lines.append(f"# TYPE smoc_{name} {kind}")
+            for labels, val in samples:
+                if val is None:
+                    continue
+                label_str = ','.join(f'{key}="{lbl}"' for key, lbl in labels.items())
+                label_str = f"{{{label_str}}}" if label_str else ''
+                lines.append(f"smoc_{name}{label_str} {float(val)!r}")
+
+        for key in ('gen', 'evals'):
+            if key in metrics:
+                add(key, 'gauge', f"Current {key} of the optimization", [({}, metrics[key])])
+
+        add('generation_seconds', 'gauge', "Wall time of the last generation",
+            [({}, metrics['wall_time'])])
+        add('phase_seconds', 'gauge', "Wall time of each phase in the last generation",
+            [({'phase': key}, val) for key, val in metrics.get('phases', {}).items()])
+        add('phase_seconds_total', 'counter', "Wall time of each phase",
+            [({'phase': key}, val) for key, val in self.totals.get('phases', {}).items()])
+        add('client_seconds', 'gauge',
+            "Time of the communication with the servers in the last generation",
+            [({'step': key}, val) for key, val in metrics.get('client', {}).items()])
+        add('client_seconds_total', 'counter', "Time of the communication with the servers",
+            [({'step': key}, val) for key, val in self.totals.get('client', {}).items()])
+
+        for key, val in self.totals.get('counts', {}).items():
+            add(f"{key}_total", 'counter', f"Number of {key.replace('_', ' ')}", [({}, val)])
+
+        # Server latency: time waiting on the servers per simulation
+        sims = metrics.get('counts', {}).get('simulations', 0)
+        if sims:
+            add('wait_seconds_per_simulation', 'gauge',
+                "Time waiting on the servers per simulation in the last generation",
+                [({}, metrics.get('client', {}).get('wait', 0.0) / sims)])
+
+        add('peak_rss_bytes', 'gauge', "Peak resident set size", [({}, metrics['peak_rss'])])
+
+        # Write to a temporary file and rename it, so the file is never read
+        # half written
+        directory = os.path.dirname(os.path.abspath(self.prom_fname))
+        fd, tmp_name = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp_name, self.prom_fname)
@@ -109,9 +109,11 @@ def plot_pareto_fronts(fronts, circuit_vars, objectives, constraints, plot_fname
         for j, fit in enumerate(fit_names_raw):
             source.update({f"{fit}_fit": [f"{eng_string(f[j])}" for f in fits]})
 
-        # Add the simulation results to the tooltips
+        # Add the simulation results to the tooltips (blank if missing, e.g.
+        # a failed simulation)
         for j, res in enumerate(sim_res_names):
-            source.update({res: [f"{eng_string(r[res])}{sim_res_units[j]}" for r in sim_res]})
+            source.update({res: [f"{eng_string(r[res])}{sim_res_units[j]}" if res in r else ""
+                                 for r in sim_res]})
 
         # Add the circuit variables to the tooltips
         # ind[j] é a variável 'j' do individuo
@@ -125,7 +127,7 @@ def plot_pareto_fronts(fronts, circuit_vars, objectives, constraints, plot_fname
             for pos, val in enumerate(fit_names_raw):
                 fit = fits[ind]
                 res = sim_res[ind]
-                if fit[pos] != res[val]:
+                if fit[pos] != res.get(val):
                     valid[ind] = 'red'
 
         source.update({'valid': [val for val in valid]})
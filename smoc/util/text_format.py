@@ -37,6 +37,8 @@ def eng_string(x, sig_figs=3, si=True):
         str: the formatted value.
     """
     x = float(x)
+    if not math.isfinite(x):  # e.g. the fitness of a failed simulation
+        return str(x)
     sign = ''
     if x < 0:
         x = -x
@@ -0,0 +1,84 @@
+# This file is part of SMOC
+# Copyright (C) 2018  Miguel Fernandes
+#
+# SMOC is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SMOC is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""Time measurement of the optimization phases."""
+
+import time
+from contextlib import contextmanager
+
+
+class PhaseTimer:
+    """Accumulate the wall time spent in each phase of the optimization
+    (e.g. variation, evaluation, selection).
+
+    Phases can be nested. The time of a phase excludes the time of the
+    phases nested in it, so the phase times add up to the measured time.
+    """
+
+    def __init__(self):
+        """Create a timer without measurements."""
+        self.totals = {}
+        self.counts = {}
+        self.stack = []
+        self.mark = None
+
+    @contextmanager
+    def phase(self, name):
+        """Measure the time of a phase.
+
+        Arguments:
+            name (str): phase name.
+        """
+        self.start(name)
+        try:
+            yield
+        finally:
+            self.stop()
+
+    def start(self, name):
+        """Start a phase, pausing the current one (if any).
+
+        Arguments:
+            name (str): phase name.
+        """
+        now = time.perf_counter()
+
+        if self.stack:
+            self.add(self.stack[-1], now - self.mark)
+
+        self.stack.append(name)
+        self.counts[name] = self.counts.get(name, 0) + 1
+        self.mark = now
+
+    def stop(self):
+        """Stop the current phase, resuming the previous one (if any)."""
+        now = time.perf_counter()
+
+        self.add(self.stack.pop(), now - self.mark)
+        self.mark = now
+
+    def add(self, name, secs):
+        """Add time to a phase.
+
+        Arguments:
+            name (str): phase name.
+            secs (float): time, in seconds.
+        """
+        self.totals[name] = self.totals.get(name, 0.0) + secs
+
+    def reset(self):
+        """Clear the measurements."""
+        self.totals = {}
+        self.counts = {}
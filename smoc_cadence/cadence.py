@@ -15,22 +15,19 @@
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 """This module handles the communication between Cadence and the server."""
 
+import json
+import math
 import os
 import sys
 
 import util
 
-# Try to import 'Server' from the global package 'socad'
 try:
-    from socad import Server
+    from interface.server import Server
 except ImportError as err:
-    # If can't import from the global package
-    try:  # Try to import from interface.server
-        from interface.server import Server
-    except ImportError as err:
-        # If can't import the package, quit the program
-        print("[ERROR] {0}. Exiting...".format(err))
-        sys.exit('1')
+    # If can't import the package, quit the program
+    print("[ERROR] {0}. Exiting...".format(err))
+    sys.exit('1')
 
 # Simulator files
 SIM_FILE = os.environ.get('SMOC_LOAD_FILE')
@@ -38,24 +35,54 @@ SET_SIM_FILE = os.environ.get('SMOC_SET_SIM_FILE')
 TEMPLATE_FILE = os.environ.get('SMOC_TEMPLATE_FILE')
 RUN_FILE = os.environ.get('SMOC_RUN_FILE')
 VAR_FILE = os.environ.get('SMOC_VARS_FILE')
+# Variables file of the pipelined batches (written while the previous batch,
+# with the variables in VAR_FILE, is simulated)
+NEXT_VAR_FILE = '{0}_next{1}'.format(*os.path.splitext(VAR_FILE or ''))
 ROOT_DIR = os.environ.get('SMOC_ROOT_DIR')
 OUT_FILE = os.environ.get('SMOC_RESULTS_FILE')
+# Evaluation stages (e.g. a cheap DC screening): simulations template and run
+# file of each stage, whose test set is simulated instead of the full one
+STAGES = json.loads(os.environ.get('SMOC_STAGES') or '{}')
+# Prefix of the test names of the full simulation
+TEST_PREFIX = 'test'
 # Client config
 HOST = os.environ.get('SMOC_CLIENT_ADDR')
 PORT = int(os.environ.get('SMOC_CLIENT_PORT'))
+# Socket options (0 to use the defaults)
+RECV_SIZE = int(os.environ.get('SMOC_RECV_SIZE', 0))
+BUFFER_SIZE = int(os.environ.get('SMOC_BUFFER_SIZE', 0))
+# Binary format of the "updateAndRun" batches (little-endian float64 matrices)
+BINARY_FORMAT = 'f64'
+# Header of the messages with simulation results streamed by Cadence (see
+# "sendResults" in "cadence.il")
+RESULTS_HEADER = 'SMOC_RESULTS\n'
 
 
-def process_skill_request(req):
+def process_skill_request(req, var_file=VAR_FILE, applied=None, session=None):
     """Process a skill request from the optimizer.
 
     Based on the given request object, returns the skill expression to be
-    evaluated by Cadence.
+    evaluated by Cadence. The number of lines of the variables file written
+    and skipped (already applied) are stored in the request ("vars_lines").
+    An "updateAndRun" request with a "stage" runs the test set of that
+    evaluation stage. The "exit" and "disconnect" messages, and a
+    "loadSimulator" request of the simulator already loaded (see
+    "is_loaded"), return the expressions 'exit', 'disconnect' and 'loaded',
+    which are not evaluated by Cadence.
 
     Arguments:
         req (dict): request object.
+        var_file (str, optional): file where the circuit variables are stored
+            (default: VAR_FILE).
+        applied (dict or None, optional): variables already applied to each
+            test, updated with the stored variables. If None, all variables
+            are stored (default: None).
+        session (dict or None, optional): simulator loaded in Cadence (see
+            "is_loaded") (default: None).
 
     Raises:
-        KeyError: if the input request format is invalid.
+        KeyError: if the input request format (or stage) is invalid, or if a
+            batch has more simulations than the loaded test slots.
         TypeError: if the type parameter of the received object is invalid.
 
     Returns:
@@ -67,36 +94,65 @@ def process_skill_request(req):
     except KeyError as err:  # if the key does not exist
         raise KeyError(err)
 
-    if type_ == 'info' and data.lower() == 'exit':
-        res = 'exit'
+    if type_ == 'info' and data.lower() in ('exit', 'disconnect'):
+        res = data.lower()
+
+    elif type_ == 'loadSimulator' and is_loaded(req, session):
+        res = 'loaded'
 
     elif type_ == 'loadSimulator':
         pop_size = data
         util.generate_simulations_file(TEMPLATE_FILE, SET_SIM_FILE, pop_size)
-        res = 'loadSimulator("{0}" "{1}" "{2}")'.format(ROOT_DIR, SIM_FILE, pop_size)
+        # One test set per evaluation stage, disabled until it's simulated
+        for stage in sorted(STAGES.keys()):
+            util.generate_simulations_file(STAGES[stage]['template'], SET_SIM_FILE, pop_size,
+                                           stage, append=True, enabled=False)
+        res = 'loadSimulator("{0}" "{1}" "{2}" "{3}")'.format(ROOT_DIR, SIM_FILE, pop_size,
+                                                             run_timeout(req))
 
     elif type_ == 'updateAndRun':
+        stage = req.get('stage')
+        if stage is None:
+            run_file, prefix = RUN_FILE, TEST_PREFIX
+        elif stage in STAGES:
+            run_file, prefix = STAGES[stage]['run'], stage
+        else:
+            raise KeyError("Unknown evaluation stage: {0}".format(stage))
+
+        # Each simulation runs in one of the test slots of the simulator
+        if session is not None and len(data) > session['pop_size']:
+            raise KeyError("Batch of {0} simulations exceeds the {1} test slots of the "
+                           "simulator".format(len(data), session['pop_size']))
+
         # Store circuit variables in file
-        util.store_vars_in_file(data, VAR_FILE)
-        res = 'updateAndRun("{0}" "{1}" "SMOC_RESULTS_FILE={2}" {3})'.format(
-            RUN_FILE, VAR_FILE, OUT_FILE, len(data))
+        req['vars_lines'] = util.store_vars_in_file(data, var_file, applied, prefix)
+        res = 'updateAndRun("{0}" "{1}" "SMOC_RESULTS_FILE={2}" {3} "{4}")'.format(
+            run_file, var_file, OUT_FILE, len(data), prefix)
     else:
         raise TypeError("Invalid object received from the client.")
 
     return res
 
 
-def process_skill_response(msg):
+def process_skill_response(msg, num_sims=0, results=None):
     """Process the skill response from Cadence.
 
     Arguments:
         msg (str): cadence response.
+        num_sims (int, optional): number of simulations of the request
+            (default: 0).
+        results (list or None, optional): simulation results streamed by
+            Cadence (messages without the header). If None, the results are
+            read from the results file (default: None).
 
     Raises:
         TypeError: if the input message format is invalid.
 
     Returns:
-        tuple: response type (type_) and response object (obj).
+        tuple: response type (type_) and response object (obj). The object of
+            the "updateAndRun" response is the results matrix: names of the
+            results, values (row by row) and indexes of the failed
+            simulations.
     """
     if "loadSimulator_OK" in msg:
         type_ = 'loadSimulator'
@@ -107,8 +163,15 @@ def process_skill_response(msg):
 
     elif "updateAndRun_OK" in msg:
         type_ = 'updateAndRun'
-        # Get the results from file
-        obj = util.get_results_from_file(OUT_FILE)
+        # Get the results from the stream, if any, or from file
+        if results:
+            lines = '\n'.join(results).encode().splitlines()
+            obj = util.parse_results(lines, num_sims)
+        else:
+            obj = None
+
+        if obj is None:
+            obj = util.read_results(OUT_FILE, num_sims)
 
     else:
         raise TypeError("Invalid message received from Cadence.")
@@ -116,56 +179,361 @@ def process_skill_response(msg):
     return type_, obj
 
 
-def main():
-    """Module main function."""
-    try:
-        # Start the server
-        server = Server(sys)
-    except OSError as err:
-        server.send_warn("[SOCKET ERROR] {0}".format(err))
-        return 1
+def recv_skill_response(server):
+    """Receive the response from Cadence, and the simulation results streamed
+    before it.
 
-    try:
-        addr = server.run(HOST, PORT)
+    Arguments:
+        server (Server): server that communicates with Cadence.
+
+    Returns:
+        tuple: Cadence response and streamed results (list of messages).
+    """
+    results = []
 
-        # Log the connectivity to Cadence
-        log = "Connected to client with address {0}:{1}".format(addr[0], addr[1])
-        server.send_skill(log)
+    while True:
+        msg = server.recv_skill()
 
-    except IOError as err:  # NOTE: "ConnectionError" don't exist in Python 2 -_-
-        server.send_warn("[CONNECTION ERROR] {0}".format(err))
-        return 1
+        if not msg.startswith(RESULTS_HEADER):
+            return msg, results
+
+        results.append(msg[len(RESULTS_HEADER):])
+
+
+def template_hashes():
+    """Get the hash of the simulations template, and of the template of each
+    evaluation stage.
+
+    Returns:
+        list: template hashes.
+    """
+    hashes = [util.get_file_hash(TEMPLATE_FILE)]
+    for stage in sorted(STAGES.keys()):
+        hashes.append(util.get_file_hash(STAGES[stage]['template']))
+
+    return hashes
+
+
+def is_loaded(req, session):
+    """Check if the simulator of a "loadSimulator" request is already loaded
+    in Cadence (e.g. by a previous client), so it's not loaded again: the
+    templates didn't change, there are enough test slots and the simulation
+    jobs have the same run timeout. The client can present the template hash
+    of the simulator it expects.
+
+    Arguments:
+        req (dict): "loadSimulator" request.
+        session (dict or None): simulator loaded in Cadence: the number of
+            test slots ("pop_size"), the template hashes ("hashes"), the run
+            timeout of the simulation jobs ("run_timeout") and the
+            "loadSimulator" response data ("data").
+
+    Returns:
+        bool: True if the simulator is loaded.
+    """
+    if not session or req['data'] > session['pop_size']:
+        return False
+
+    if req.get('template_hash') not in (None, session['hashes'][0]):
+        return False
+
+    if run_timeout(req) != session.get('run_timeout'):
+        return False
+
+    return template_hashes() == session['hashes']
+
+
+def run_timeout(req):
+    """Get the run timeout of the simulation jobs of a "loadSimulator"
+    request, i.e. the max duration of a job (in seconds) before ADE-XL kills
+    it, so a hung simulation doesn't keep the simulator busy.
+
+    Arguments:
+        req (dict): "loadSimulator" request.
+
+    Returns:
+        int: run timeout in seconds (-1 if the jobs are never killed).
+    """
+    timeout = req.get('run_timeout')
+    if timeout is None:
+        return -1
+
+    return max(int(math.ceil(timeout)), 1)
+
+
+def get_simulator_info():
+    """Get information about the loaded simulator, sent to the client with
+    the "loadSimulator" response.
+
+    Returns:
+        dict: simulator information.
+    """
+    info = dict(template_hash=util.get_file_hash(TEMPLATE_FILE))
+
+    # Parallel simulation jobs, used by the client to size its chunks
+    max_jobs = util.get_max_jobs(SIM_FILE)
+    if max_jobs is not None:
+        info['job_slots'] = max_jobs
+
+    # Evaluation stages, checked by the client against its configuration
+    if STAGES:
+        info['stages'] = sorted(STAGES.keys())
+
+    return info
+
+
+def negotiate_schema(server, req):
+    """Negotiate the format of the "updateAndRun" batches with the client,
+    based on the schema sent with the "loadSimulator" request.
+
+    Arguments:
+        server (Server): server that communicates with the client.
+        req (dict): "loadSimulator" request.
+
+    Returns:
+        dict or None: batches format and names of the circuit variables (the
+            matrix columns), or None if the batches are sent in JSON.
+    """
+    schema = req.get('schema')
+
+    # The client or the server (e.g. an older version) don't support it
+    if not isinstance(schema, dict) or not hasattr(server, 'recv_matrix'):
+        return None
+
+    if BINARY_FORMAT not in schema.get('formats', []):
+        return None
+
+    return dict(format=BINARY_FORMAT, variables=list(schema['variables']))
+
+
+def recv_request(server, schema, var_file, applied=None, session=None):
+    """Receive a request from the client and get the skill expression to be
+    evaluated by Cadence.
+
+    Arguments:
+        server (Server): server that communicates with the client.
+        schema (dict or None): batches format negotiated with the client
+            (None if JSON).
+        var_file (str): file where the circuit variables are stored.
+        applied (dict or None, optional): variables already applied to each
+            test (see "process_skill_request") (default: None).
+        session (dict or None, optional): simulator loaded in Cadence (see
+            "is_loaded") (default: None).
+
+    Returns:
+        tuple: request, whether the batch is binary, and skill expression.
+    """
+    req = server.recv_data()
+
+    # Binary batches: the circuit variables come in a matrix after the request
+    binary = schema is not None and req.get('format') == schema['format']
+    if binary:
+        req['data'] = matrix_to_dicts(server.recv_matrix(), schema['variables'])
+
+    return req, binary, process_skill_request(req, var_file, applied, session)
+
+
+def matrix_to_dicts(values, names, num_rows=None):
+    """Convert a flattened matrix to a list of dictionaries (one per row).
+
+    Arguments:
+        values (list): matrix values, row by row.
+        names (list): names of the matrix columns.
+        num_rows (int or None, optional): number of rows, required if there
+            are no columns (default: None).
+
+    Returns:
+        list: dictionary of each row.
+    """
+    num_cols = len(names)
+
+    if not num_cols:
+        return [{} for _ in range(num_rows or 0)]
+
+    return [dict(zip(names, values[idx:idx + num_cols]))
+            for idx in range(0, len(values), num_cols)]
+
+
+def serve_client(server, state):
+    """Serve the requests of the connected client, until it sends the "exit"
+    or "disconnect" message.
+
+    Arguments:
+        server (Server): server that communicates with the client and Cadence.
+        state (dict): state of Cadence, kept across clients: the variables
+            applied to each test ("applied") and the loaded simulator
+            ("session", see "is_loaded").
+
+    Raises:
+        IOError: if the connection with the client is broken.
+        TypeError: if a message is invalid.
+        KeyError: if a request format is invalid.
+
+    Returns:
+        str: the message that ended the connection ('exit' or 'disconnect').
+    """
+    schema = None  # Batches format negotiated with the client (None if JSON)
+    results_sent = None  # Names of the results already sent to the client
+    pending = None  # Next request, already received and processed
+    var_files = [VAR_FILE, NEXT_VAR_FILE]
+    # Variables applied to each test, so only the changes are written. It's
+    # reset (all variables are rewritten) when the simulator is loaded and
+    # when a simulation fails
+    applied = state['applied']
 
-    code = 0  # Return code
     try:
         while True:
-            # Wait for a client request
-            req = server.recv_data()
+            if pending is None:
+                # Wait for a client request, and process it
+                req, binary, expr = recv_request(server, schema, var_files[0], applied,
+                                                 state['session'])
+            else:
+                req, binary, expr = pending
+                pending = None
 
-            # Process the client request
-            expr = process_skill_request(req)
+            if expr in ('exit', 'disconnect'):
+                return expr
 
-            if expr == 'exit':
-                break
+            if expr == 'loaded':
+                # The simulator was loaded before (e.g. by a previous client)
+                typ, obj = 'loadSimulator', state['session']['data']
             else:
+                if req['type'] == 'loadSimulator':
+                    state['session'] = None
+
                 # Send the request to Cadence
                 server.send_skill(expr)
+
+                # Pipelined batches: receive the next batch and write its
+                # variables (to the other file) while this one is simulated
+                if req.get('more') and req['type'] == 'updateAndRun':
+                    var_files.reverse()
+                    try:
+                        pending = recv_request(server, schema, var_files[0], applied,
+                                               state['session'])
+                    except (IOError, KeyError):
+                        # Cadence must finish before the next client (or
+                        # before the server ends)
+                        recv_skill_response(server)
+                        raise
+
                 # Wait for a response from Cadence
-                res = server.recv_skill()
+                res, results = recv_skill_response(server)
                 # Process the Cadence response
-                typ, obj = process_skill_response(res)
-                # Send the processed response to the client
-                server.send_data(dict(type=typ, data=obj))
+                try:
+                    num_sims = len(req['data']) if req['type'] == 'updateAndRun' else 0
+                    typ, obj = process_skill_response(res, num_sims, results)
+                except TypeError:
+                    # The variables of the tests are unknown
+                    applied.clear()
+                    raise
+
+                if typ == 'loadSimulator':
+                    applied.clear()
+                    state['session'] = dict(pop_size=req['data'], hashes=template_hashes(),
+                                            run_timeout=run_timeout(req), data=obj)
+
+            # Send the processed response to the client
+            res = dict(type=typ, data=obj)
+
+            if typ == 'loadSimulator':
+                res['info'] = get_simulator_info()
+                schema = negotiate_schema(server, req)
+                results_sent = None
+                if schema is not None:
+                    res['schema'] = schema
+
+            if typ == 'updateAndRun':
+                names, values, failed = obj
+                # Lines of the variables file written and skipped, and
+                # simulations with missing results
+                res = dict(type=typ, vars_lines=list(req['vars_lines']), failed=failed)
+
+                if binary:
+                    # Send the results in a matrix. The results names are only
+                    # sent when they change
+                    res.update(format=schema['format'], rows=num_sims)
+                    if names != results_sent:
+                        res['results'] = results_sent = names
+
+                    server.send_data(res)
+                    server.send_matrix(values)
+                else:
+                    res['data'] = matrix_to_dicts(values, names, num_sims)
+                    server.send_data(res)
+            else:
+                server.send_data(res)
+    except IOError:
+        # The variables of the received batch were stored, but not applied
+        if pending is not None:
+            applied.clear()
+        raise
+
 
+def main():
+    """Module main function.
+
+    The server keeps the simulator loaded in Cadence across clients: when a
+    client disconnects (or the connection drops), it waits for the next one.
+    Cadence only exits with the "exit" message, or an error.
+    """
+    try:
+        # Start the server
+        options = {}
+        if RECV_SIZE:
+            options['recv_size'] = RECV_SIZE
+        if BUFFER_SIZE:
+            options['buffer_size'] = BUFFER_SIZE
+        server = Server(sys, **options)
+    except OSError as err:
+        server.send_warn("[SOCKET ERROR] {0}".format(err))
+        return 1
+
+    try:
+        server.listen(HOST, PORT)
     except IOError as err:  # NOTE: "ConnectionError" don't exist in Python 2 -_-
         server.send_warn("[CONNECTION ERROR] {0}".format(err))
-        code = 2
-    except TypeError as err:
-        server.send_warn("[TYPE ERROR] {0}".format(err))
-        code = 3
-    except KeyError as err:
-        server.send_warn("[KEY ERROR] {0}".format(err))
-        code = 4
+        return 1
+
+    code = 0  # Return code
+    # State of Cadence, kept across clients (see "serve_client")
+    state = dict(applied={}, session=None)
+    while True:
+        try:
+            # Wait for a client. The message tells that the server is listening
+            server.send_skill("Waiting for a client connection on {0}:{1}".format(HOST, PORT))
+            addr = server.accept()
+
+            # Log the connectivity to Cadence
+            log = "Connected to client with address {0}:{1}".format(addr[0], addr[1])
+            server.send_skill(log)
+
+        except IOError as err:  # NOTE: "ConnectionError" don't exist in Python 2 -_-
+            server.send_warn("[CONNECTION ERROR] {0}".format(err))
+            code = 2
+            break
+
+        try:
+            end = serve_client(server, state)
+        except IOError as err:
+            server.send_warn("[CONNECTION ERROR] {0}".format(err))
+            end = None
+            code = 2
+        except TypeError as err:
+            server.send_warn("[TYPE ERROR] {0}".format(err))
+            code = 3
+            break
+        except KeyError as err:
+            server.send_warn("[KEY ERROR] {0}".format(err))
+            code = 4
+            break
+
+        if end == 'exit':
+            break
+
+        # Keep the simulator for the next client
+        server.disconnect()
+        code = 0
 
     server.close(code)
     return code
@@ -19,21 +19,13 @@ import json
 import socket
 import struct
 import time
-from contextlib import contextmanager
 
-
-@contextmanager
-def closing(thing):
-    """Close stream when using the "with" since the __close__ method of
-    streams is not defined in python 2.
-
-    Arguments:
-        thing (stream): stream (file, socket, ...)
-    """
-    try:
-        yield thing
-    finally:
-        thing.close()
+# "memoryview" only exists in Python 2.7+
+try:
+    memoryview
+    HAS_MEMORYVIEW = True
+except NameError:
+    HAS_MEMORYVIEW = False
 
 
 class Server:
@@ -42,21 +34,32 @@ class Server:
     This server is started and ran by Cadence Virtuoso. It receives data from
     a client and passes it to Cadence. It then gather the Cadence response and
     send it back to the client. The data sent to client is serialized in JSON
-    and the data from client should also be in JSON.
+    and the data from client should also be in JSON. Batches of numbers can
+    also be sent as binary matrices (see "send_matrix" and "recv_matrix").
+
+    The server keeps listening after accepting a client, so it can serve
+    other clients, one at a time (see "accept" and "disconnect").
 
     Arguments:
         cad_stream (object): Cadence stream.
         sock (object, optional): socket to use in the connection
-            (default: None).        
+            (default: None).
+        recv_size (int, optional): max number of bytes received per "recv"
+            call (default: 65536).
+        buffer_size (int or None, optional): size of the socket send and
+            receive buffers. If None, the OS defaults are used (default: None).
     """
 
-    def __init__(self, cad_stream, sock=None):
+    def __init__(self, cad_stream, sock=None, recv_size=65536, buffer_size=None):
         """Create the server socket."""
         self.cad_stream = cad_stream
         self.server_in = cad_stream.stdin
         self.server_out = cad_stream.stdout
         self.server_err = cad_stream.stderr
 
+        self.recv_size = recv_size
+        self.buffer_size = buffer_size
+
         # Uninitialized variables
         self.conn = None  # Client socket
 
@@ -73,12 +76,51 @@ class Server:
             self.socket = sock
 
     def run(self, host, port):
-        """Start the server.
+        """Start the server and wait for a client.
+
+        Arguments:
+            host (str): remote socket IP address.
+            port (int): remote socket port.
+
+        Raises:
+            ConnectionError: if there's a communication problem.
+
+        Returns:
+            list: remote socket name.
+        """
+        self.listen(host, port)
+
+        return self.accept()
+
+    def listen(self, host, port):
+        """Start listening for client connections.
 
         Arguments:
             host (str): remote socket IP address.
             port (int): remote socket port.
 
+        Raises:
+            ConnectionError: if there's a communication problem.
+        """
+        try:
+            # The buffer sizes must be set before the connection, to be
+            # inherited by the client socket
+            if self.buffer_size:
+                self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.buffer_size)
+                self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.buffer_size)
+
+            self.socket.bind((host, port))
+            self.socket.listen(1)
+        except (OSError, socket.error) as err:
+            raise IOError(err)  # TODO: Replace to "ConnectionError"
+
+    def accept(self):
+        """Wait for a client connection (the server must be listening).
+
+        NOTE: After the connection, the "self.conn" is the socket that
+        communicates with the client. The "self.socket" keeps listening, and
+        the next client is only accepted after a "disconnect".
+
         Raises:
             ConnectionError: if there's a communication problem.
 
@@ -86,17 +128,12 @@ class Server:
             list: remote socket name.
         """
         try:
-            # Start connection between client and server (UNIX socket)
-            # NOTE: After the connection with the client, the "self.conn" is the socket
-            # that communicates with the client, so the "self.socket" is not required
-            # anymore and can be closed.
-            with closing(self.socket) as s:
-                s.bind((host, port))
-                s.listen(1)  # Waits for client connection
-
-                # Accept the client connection and get his socket and address
-                self.conn, addr = s.accept()
-        except OSError as err:
+            # Accept the client connection and get his socket and address
+            self.conn, addr = self.socket.accept()
+
+            # Send the small control messages right away (disable Nagle)
+            self.conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except (OSError, socket.error) as err:
             raise IOError(err)  # TODO: Replace to "ConnectionError"
 
         # The next function calls don't need a try statement because if they
@@ -109,16 +146,18 @@ class Server:
         # Receive remote socket name
         return self.recv_data()['data']
 
+    def disconnect(self):
+        """Close the connection with the current client, if any."""
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
     def send_data(self, obj):
         """Send an object through a socket.
 
         1 - Serialize the object in JSON and encode the string;
 
-        2 - pack the serialized object length in an unsigned int (I) [4 bytes],
-            and big-endian byte order (>) (this way the *object size* message
-            has always the same size);
-
-        3 - send the data.
+        2 - send the serialized object in a frame (see "send_frame").
 
         Arguments:
             obj (dict): object to send.
@@ -133,24 +172,24 @@ class Server:
         except (TypeError, ValueError):
             raise TypeError('It can only send JSON-serializable data')
 
-        serialized_len = len(serialized)  # String length
-
-        # Packed string length
-        pack_serialized_len = struct.pack('>I', serialized_len)
-
-        # Data to send
-        data = pack_serialized_len + serialized
-
-        total_sent = 0
+        self.send_frame(serialized)
 
-        while total_sent < serialized_len:
-            sent = self.conn.send(data[total_sent:])
+    def send_frame(self, data):
+        """Send a frame through a socket: the data length, packed in an
+        unsigned int (I) [4 bytes] with big-endian byte order (>), and the
+        data.
 
-            if not sent:
-                # TODO: Replace to "ConnectionError"
-                raise IOError("Socket connection broken while sending data")
+        Arguments:
+            data (bytes): data to send.
 
-            total_sent += sent
+        Raises:
+            ConnectionError: if the socket connection is broken.
+        """
+        try:
+            self.conn.sendall(struct.pack('>I', len(data)) + data)
+        except socket.error as err:
+            # TODO: Replace to "ConnectionError"
+            raise IOError("Socket connection broken while sending data: {0}".format(err))
 
     def recv_data(self):
         """Receive an object through a socket.
@@ -168,15 +207,7 @@ class Server:
         Returns:
             dict: decoded and de-serialized received data.
         """
-        data_len = self.recv_bytes(4)
-
-        if not data_len:
-            # TODO: Replace to "ConnectionError"
-            raise IOError("Socket connection broken while receiving data")
-
-        msg_len = struct.unpack('>I', data_len)[0]
-
-        serialized = self.recv_bytes(msg_len).decode()
+        serialized = self.recv_frame().decode()
 
         try:
             obj = json.loads(serialized)
@@ -185,9 +216,85 @@ class Server:
 
         return obj
 
+    def send_matrix(self, values):
+        """Send a flattened matrix of floats through a socket.
+
+        The matrix is sent as a frame with the data length, packed as the JSON
+        data length (see "send_data"), followed by the values packed as
+        little-endian float64.
+
+        Arguments:
+            values (list): matrix values, row by row.
+
+        Raises:
+            ConnectionError: if the socket connection is broken.
+        """
+        self.send_frame(struct.pack('<%dd' % len(values), *values))
+
+    def recv_matrix(self):
+        """Receive a flattened matrix of floats through a socket (see
+        "send_matrix").
+
+        Raises:
+            ConnectionError: if the socket connection is broken.
+
+        Returns:
+            list: matrix values, row by row.
+        """
+        data = self.recv_frame()
+
+        return list(struct.unpack_from('<%dd' % (len(data) // 8), data))
+
+    def recv_frame(self):
+        """Receive a frame through a socket (see "send_frame").
+
+        Raises:
+            ConnectionError: if the socket connection is broken.
+
+        Returns:
+            bytearray or bytes: received data.
+        """
+        data_len = struct.unpack_from('>I', self.recv_bytes(4))[0]
+
+        return self.recv_bytes(data_len)
+
     def recv_bytes(self, n_bytes):
         """Receive a specified number of bytes through a socket.
 
+        The bytes are received directly into a preallocated buffer (if
+        "memoryview" is available).
+
+        Arguments:
+            n_bytes (int): number of bytes to receive.
+
+        Raises:
+            ConnectionError: if the socket connection is broken.
+
+        Returns:
+            bytearray or bytes: received bytes stream.
+        """
+        if not HAS_MEMORYVIEW:
+            return self.recv_bytes_chunks(n_bytes)
+
+        data = bytearray(n_bytes)
+        view = memoryview(data)
+        received = 0
+
+        while received < n_bytes:
+            num = self.conn.recv_into(view[received:], min(n_bytes - received, self.recv_size))
+
+            if not num:
+                # TODO: Replace to "ConnectionError"
+                raise IOError("Socket connection broken while receiving bytes")
+
+            received += num
+
+        return data
+
+    def recv_bytes_chunks(self, n_bytes):
+        """Receive a specified number of bytes through a socket, joining the
+        received chunks (used if "memoryview" is not available).
+
         Arguments:
             n_bytes (int): number of bytes to receive.
 
@@ -197,21 +304,20 @@ class Server:
         Returns:
             bytes: received bytes stream.
         """
-        data = b''  # Bytes literal
-        data_len = len(data)
+        chunks = []
+        received = 0
 
-        while data_len < n_bytes:
-            # Receives a maximum of 1024 bytes per iteration
-            packet = self.conn.recv(min(n_bytes - data_len, 1024))
+        while received < n_bytes:
+            packet = self.conn.recv(min(n_bytes - received, self.recv_size))
 
             if not packet:
                 # TODO: Replace to "ConnectionError"
                 raise IOError("Socket connection broken while receiving bytes")
 
-            data_len += len(packet)
-            data += packet
+            chunks.append(packet)
+            received += len(packet)
 
-        return data
+        return b''.join(chunks)
 
     def send_skill(self, expr):
         """Send a skill expression to Cadence Virtuoso for evaluation.
@@ -264,7 +370,8 @@ class Server:
         Arguments:
             code (int): exit code.
         """
-        self.conn.close()
+        self.disconnect()
+        self.socket.close()
         # Send feedback to Cadence
         self.send_warn("Connection with the client ended!\n\n")
         self.server_out.close()  # close stdout
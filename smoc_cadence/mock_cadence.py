@@ -0,0 +1,585 @@
+#!/usr/bin/env python
+# This file is part of SMOC
+# Copyright (C) 2018  Miguel Fernandes
+#
+# SMOC is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SMOC is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""Mock of Cadence Virtuoso (ADE-XL), to run SMOC without Cadence.
+
+It starts the SMOC server ("cadence.py") as a child process and plays the role
+of "cadence.il": it talks to the server through the same stdin/stdout pipes,
+evaluates the "loadSimulator" and "updateAndRun" procedures, and replies like
+Virtuoso does. The simulations are replaced by analytic models (see
+"models.py"), with a configurable latency, number of parallel jobs and
+failures, to behave like ADE-XL under load.
+"""
+
+from __future__ import print_function
+
+import argparse
+import heapq
+import json
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from models import MODELS, create_model
+
+# SKILL procedures evaluated by the mock
+PROCEDURES = ('loadSimulator', 'updateAndRun')
+# Initial message sent to the server (see "startServer" in "cadence.il")
+START_MSG = "Python server has started!\n"
+# Message of the server when it's listening for a client (see "main" in
+# "cadence.py")
+LISTEN_MSG = "Waiting for a client connection on "
+# Header of the messages with simulation results (see "sendResults")
+RESULTS_HEADER = "SMOC_RESULTS\n"
+
+TEST_PATTERN = re.compile(r'ocnxlSelectTest\(\s*"(\w+:\d+)"\s*\)')
+DESVAR_PATTERN = re.compile(r'desVar\(\s*"(\w+)"\s*(\S+)\s*\)')
+PROC_PATTERN = re.compile(r'\b(' + '|'.join(PROCEDURES) + r')\(')
+ARG_PATTERN = re.compile(r'"((?:[^"\\]|\\.)*)"|(\S+)')
+
+
+def parse_args(args):
+    """Parse the arguments of a SKILL function call.
+
+    Arguments:
+        args (str): function arguments (without the parentheses).
+
+    Returns:
+        list: arguments, as strings (quoted) or numbers.
+    """
+    values = []
+
+    for match in ARG_PATTERN.finditer(args):
+        if match.group(1) is not None:
+            values.append(match.group(1))
+        else:
+            try:
+                values.append(int(match.group(2)))
+            except ValueError:
+                values.append(float(match.group(2)))
+
+    return values
+
+
+def find_call(data):
+    """Find the first complete SKILL procedure call in the data received
+    from the server.
+
+    Arguments:
+        data (str): data received from the server.
+
+    Returns:
+        tuple: data before the call, procedure name, procedure arguments and
+            data after the call. If there's no complete call, the procedure
+            name is None (and the arguments/remaining data are empty).
+    """
+    match = PROC_PATTERN.search(data)
+    if match is None:
+        return data, None, '', ''
+
+    # Find the closing parenthesis, outside quotes
+    quoted = False
+    idx = match.end()
+    while idx < len(data):
+        char = data[idx]
+        if char == '\\' and quoted:
+            idx += 1
+        elif char == '"':
+            quoted = not quoted
+        elif char == ')' and not quoted:
+            return data[:match.start()], match.group(1), data[match.end():idx], data[idx + 1:]
+        idx += 1
+
+    # Incomplete call, wait for more data
+    return data[:match.start()], None, '', data[match.start():]
+
+
+class MockVirtuoso(object):
+    """Mock of Cadence Virtuoso, that runs the SMOC server.
+
+    The server files (simulator, template, variables and results files) are
+    created in a work directory. The initial design variables are the model
+    defaults.
+
+    The duration of a simulation is "latency", with a normal random deviation
+    of "jitter * latency". The simulations of a run are distributed to "jobs"
+    parallel slots, and a run takes the time of the busiest slot plus
+    "overhead" (e.g. netlisting). A simulation fails (it has no results)
+    with a probability of "failure_rate", and a run fails (SKILL error, which
+    stops the server) with a probability of "crash_rate". A simulation hangs
+    with a probability of "hang_rate": it takes "hang_time" seconds, unless
+    the simulator was loaded with a run timeout, which kills the simulations
+    that run longer (they have no results), like an ADE-XL job.
+
+    Evaluation stages (test sets simulated instead of the full simulation,
+    e.g. a DC screening) only compute some of the model results, and their
+    simulations take "stage_cost" times the latency.
+
+    Arguments:
+        model (Model): analytic model of the circuit.
+        host (str, optional): client address (default: 'localhost').
+        port (int, optional): client port (default: 3000).
+        latency (float, optional): duration of a simulation, in seconds
+            (default: 0).
+        jitter (float, optional): relative standard deviation of the
+            duration of a simulation (default: 0).
+        jobs (int, optional): number of parallel simulations (default: 4).
+        overhead (float, optional): time added to each run, in seconds
+            (default: 0).
+        failure_rate (float, optional): probability of a simulation failing
+            (default: 0).
+        crash_rate (float, optional): probability of a run failing
+            (default: 0).
+        seed (int or None, optional): random seed (default: None).
+        workdir (str or None, optional): work directory. If None, a temporary
+            directory is created and removed at the end (default: None).
+        server_env (dict or None, optional): other environment variables of
+            the server, e.g. SMOC_RECV_SIZE (default: None).
+        verbose (bool, optional): print the messages of the server (default: True).
+        results_pipe (bool, optional): send the results to the server through
+            the pipe, like "run.ocn" with SMOC_RESULTS_PIPE, instead of the
+            results file (default: False).
+        stages (dict or None, optional): names of the results of each
+            evaluation stage (default: None).
+        stage_cost (float, optional): duration of a simulation of an
+            evaluation stage, relative to the latency (default: 0.1).
+        hang_rate (float, optional): probability of a simulation hanging
+            (default: 0).
+        hang_time (float, optional): duration of a hung simulation, in
+            seconds (default: 60).
+    """
+
+    def __init__(self, model, host='localhost', port=3000, latency=0.0, jitter=0.0, jobs=4,
+                 overhead=0.0, failure_rate=0.0, crash_rate=0.0, seed=None, workdir=None,
+                 server_env=None, verbose=True, results_pipe=False, stages=None,
+                 stage_cost=0.1, hang_rate=0.0, hang_time=60.0):
+        """Create the mock and the server files."""
+        self.model = model
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.jobs = max(jobs, 1)
+        self.overhead = overhead
+        self.failure_rate = failure_rate
+        self.crash_rate = crash_rate
+        self.random = random.Random(seed)
+        self.server_env = server_env or {}
+        self.verbose = verbose
+        self.results_pipe = results_pipe
+        self.stages = stages or {}
+        self.stage_cost = stage_cost
+        self.hang_rate = hang_rate
+        self.hang_time = hang_time
+
+        self.tmp_dir = workdir is None
+        self.workdir = tempfile.mkdtemp(prefix='smoc_mock_') if workdir is None else workdir
+        if not os.path.exists(self.workdir):
+            os.makedirs(self.workdir)
+
+        self.files = dict(SMOC_ROOT_DIR=self.workdir,
+                          SMOC_LOAD_FILE=os.path.join(self.workdir, 'loadSimulator.ocn'),
+                          SMOC_SET_SIM_FILE=os.path.join(self.workdir, 'setSimulations.ocn'),
+                          SMOC_TEMPLATE_FILE=os.path.join(self.workdir,
+                                                          'templateSimulations.ocn'),
+                          SMOC_RUN_FILE=os.path.join(self.workdir, 'run.ocn'),
+                          SMOC_VARS_FILE=os.path.join(self.workdir, 'vars.ocn'),
+                          SMOC_RESULTS_FILE=os.path.join(self.workdir, 'sim_res'))
+        # Simulations template and run file of each evaluation stage
+        self.stage_files = dict(
+            (name, dict(template=os.path.join(self.workdir, 'template_{0}.ocn'.format(name)),
+                        run=os.path.join(self.workdir, 'run_{0}.ocn'.format(name))))
+            for name in self.stages)
+        self.create_files()
+
+        # Design variables of each test (by test name), and number of enabled
+        # tests
+        self.tests = {}
+        self.num_evals = 0
+        # Max duration of a simulation (None if unlimited)
+        self.run_timeout = None
+
+        # Server process and statistics
+        self.process = None
+        self.stderr_thread = None
+        self.num_loads = 0
+        self.num_runs = 0
+        self.num_sims = 0
+        self.sim_time = 0.0
+
+    def log(self, msg):
+        """Print a message, if verbose."""
+        if self.verbose:
+            print(msg)
+            sys.stdout.flush()
+
+    def create_files(self):
+        """Create the server files. The template identifies the model, so a
+        different model has a different template hash."""
+        with open(self.files['SMOC_TEMPLATE_FILE'], 'w') as f:
+            f.write('; Mock simulation of the model {0}\n'.format(self.model.name))
+            for var in self.model.variables:
+                f.write('; {0} [{1}, {2}] default {3}\n'.format(*var))
+
+        with open(self.files['SMOC_VARS_FILE'], 'w') as f:
+            for name, _, _, default in self.model.variables:
+                f.write('desVar(\t "{0}" {1!r}\t)\n'.format(name, default))
+
+        # The job setup of the ADE-XL, with the number of parallel jobs
+        with open(self.files['SMOC_LOAD_FILE'], 'w') as f:
+            f.write('ocnxlJobSetup( \'(\n\t"maxjobs" "{0}"\n) )\n'.format(self.jobs))
+
+        for key in ('SMOC_RUN_FILE', 'SMOC_RESULTS_FILE'):
+            open(self.files[key], 'a').close()
+
+        for name, files in self.stage_files.items():
+            with open(files['template'], 'w') as f:
+                f.write('; Mock stage {0}: {1}\n'.format(name, ', '.join(self.stages[name])))
+            open(files['run'], 'a').close()
+
+    def start(self):
+        """Start the server process and wait until it's talking to the mock,
+        and listening for a client.
+
+        Returns:
+            str: data received from the server after the initial message.
+        """
+        env = dict(os.environ)
+        env.update(self.files)
+        env['SMOC_CLIENT_ADDR'] = self.host
+        env['SMOC_CLIENT_PORT'] = str(self.port)
+        env['SMOC_RESULTS_PIPE'] = '1' if self.results_pipe else '0'
+        env['SMOC_STAGES'] = json.dumps(self.stage_files)
+        for key, val in self.server_env.items():
+            env[key] = str(val)
+
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cadence.py')
+        self.process = subprocess.Popen([sys.executable, script], stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                        cwd=self.workdir, env=env)
+
+        self.stderr_thread = threading.Thread(target=self.read_stderr)
+        self.stderr_thread.daemon = True
+        self.stderr_thread.start()
+
+        self.send_data(START_MSG)
+
+        # The server echoes the initial message, and then tells that it's
+        # listening
+        data = ''
+        while len(data) < len(START_MSG) - 1 or LISTEN_MSG not in data[len(START_MSG) - 1:]:
+            chunk = self.read_stdout()
+            if not chunk:
+                raise IOError("The server stopped before starting")
+            data += chunk
+
+        self.log("[INFO] Mock Cadence is talking to the server!")
+
+        return data[len(START_MSG) - 1:]
+
+    def serve(self, data=''):
+        """Handle the server requests until the server stops (e.g. a client
+        sends the exit message). The server keeps the loaded simulator across
+        clients.
+
+        Arguments:
+            data (str, optional): data already received from the server.
+
+        Returns:
+            int: server exit code.
+        """
+        while True:
+            before, proc, args, data = find_call(data)
+
+            if before.strip():
+                self.log("[INFO] {0}".format(before.strip()))
+
+            if proc is not None:
+                self.send_data(self.request_handler(proc, args))
+                continue
+
+            chunk = self.read_stdout()
+            if not chunk:
+                break
+            data += chunk
+
+        code = self.process.wait()
+        self.stderr_thread.join()
+        self.log("[INFO] Server has stopped with the exit code {0}. {1} loads, {2} runs, "
+                 "{3} simulations".format(code, self.num_loads, self.num_runs, self.num_sims))
+
+        return code
+
+    def run(self):
+        """Start the server and handle its requests.
+
+        Returns:
+            int: server exit code.
+        """
+        try:
+            return self.serve(self.start())
+        finally:
+            self.cleanup()
+
+    def cleanup(self):
+        """Stop the server, if running, and remove the temporary directory."""
+        if self.process is not None and self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+
+        if self.tmp_dir:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def read_stdout(self):
+        """Read the available data from the server stdout."""
+        return os.read(self.process.stdout.fileno(), 65536).decode()
+
+    def read_stderr(self):
+        """Print the server warnings (stderr), like the "errorHandler"."""
+        while True:
+            chunk = os.read(self.process.stderr.fileno(), 65536)
+            if not chunk:
+                break
+            self.log("[WARNING] {0}".format(chunk.decode().strip()))
+
+    def send_data(self, msg):
+        """Send a message to the server: first its size and then the message.
+
+        Arguments:
+            msg (str): message.
+        """
+        data = msg.encode()
+        try:
+            self.process.stdin.write('{0}\n'.format(len(data)).encode() + data)
+            self.process.stdin.flush()
+        except (IOError, OSError):
+            # The server stopped, its exit is handled when stdout closes
+            pass
+
+    def request_handler(self, proc, args):
+        """Evaluate a SKILL procedure call, like the "requestHandler" of
+        "cadence.il".
+
+        Arguments:
+            proc (str): procedure name.
+            args (str): procedure arguments.
+
+        Returns:
+            str: message sent to the server, the result ("%L" format) or the
+                error message.
+        """
+        try:
+            result = getattr(self, proc)(*parse_args(args))
+        except Exception as err:
+            self.log("[ERROR] {0}: {1}".format(proc, err))
+            return "*Error* {0}: {1}\n".format(proc, err)
+
+        return '"{0}"\n'.format(result)
+
+    def loadSimulator(self, run_dir, load_file, pop_size, run_timeout='-1'):
+        """Load the simulator: reset the design variables of each test, and
+        set the run timeout of the simulations (-1 if unlimited)."""
+        self.num_evals = int(pop_size)
+        self.run_timeout = float(run_timeout) if float(run_timeout) > 0 else None
+        self.num_loads += 1
+        self.tests = {}
+        for prefix in ['test'] + sorted(self.stages):
+            for idx in range(1, self.num_evals + 1):
+                self.tests['{0}:{1}'.format(prefix, idx)] = self.model.defaults()
+
+        self.log("[INFO] Loaded the model {0} with {1} tests".format(
+            self.model.name, self.num_evals))
+
+        return "loadSimulator_OK"
+
+    def updateAndRun(self, run_file, var_file, result_file, num_sim, prefix='test'):
+        """Update the design variables of each test and run the simulations
+        of a test set (the full simulation, or an evaluation stage)."""
+        self.update_vars(var_file)
+        self.num_evals = num_sim
+
+        if self.random.random() < self.crash_rate:
+            raise RuntimeError("simulation run failed (injected crash)")
+
+        if prefix != 'test' and prefix not in self.stages:
+            raise KeyError("unknown test set {0}".format(prefix))
+        latency = self.latency if prefix == 'test' else self.stage_cost * self.latency
+
+        results = []
+        durations = []
+        for idx in range(1, num_sim + 1):
+            test = '{0}:{1}'.format(prefix, idx)
+            variables = self.tests.setdefault(test, self.model.defaults())
+            durations.append(max(self.random.gauss(latency, self.jitter * latency), 0.0))
+            if self.hang_rate and self.random.random() < self.hang_rate:
+                durations[-1] = self.hang_time
+
+            # A failed simulation has no results
+            if self.random.random() < self.failure_rate:
+                res = {}
+            else:
+                res = self.model.evaluate(variables)
+                if prefix != 'test':
+                    res = dict((key, res[key]) for key in self.stages[prefix])
+
+            # A simulation that runs longer than the run timeout is killed
+            if self.run_timeout is not None and durations[-1] > self.run_timeout:
+                durations[-1] = self.run_timeout
+                res = {}
+            results.append(res)
+
+        elapsed = self.schedule(durations) + self.overhead
+        if elapsed > 0:
+            time.sleep(elapsed)
+
+        self.num_runs += 1
+        self.num_sims += num_sim
+        self.sim_time += elapsed
+
+        lines = [''.join('{0}\t{1}\t{2:e}\n'.format(idx + 1, key, val)
+                         for key, val in sorted(res.items()))
+                 for idx, res in enumerate(results)]
+
+        if self.results_pipe:
+            # The results of each test, like "sendResults"
+            for test_lines in lines:
+                if test_lines:
+                    self.send_data(RESULTS_HEADER + test_lines)
+        else:
+            fname = result_file.split('=', 1)[-1]
+            with open(fname, 'w') as f:
+                f.writelines(lines)
+
+        return "updateAndRun_OK"
+
+    def update_vars(self, var_file):
+        """Load the variables file: set the design variables of each test.
+
+        Arguments:
+            var_file (str): variables file.
+        """
+        with open(var_file, 'r') as f:
+            content = f.read()
+
+        test = None
+        pos = 0
+        while True:
+            match = TEST_PATTERN.search(content, pos)
+            end = match.start() if match else len(content)
+
+            for var in DESVAR_PATTERN.finditer(content, pos, end):
+                key = var.group(1)
+                if test is None:  # No test selected: all tests
+                    for variables in self.tests.values():
+                        variables[key] = float(var.group(2))
+                else:
+                    self.tests.setdefault(test, self.model.defaults())[key] = float(var.group(2))
+
+            if match is None:
+                break
+            test = match.group(1)
+            pos = match.end()
+
+    def schedule(self, durations):
+        """Get the time to run the simulations in the parallel job slots
+        (each simulation runs in the first free slot).
+
+        Arguments:
+            durations (list): duration of each simulation.
+
+        Returns:
+            float: time to run all the simulations.
+        """
+        slots = [0.0] * min(self.jobs, max(len(durations), 1))
+
+        for duration in durations:
+            heapq.heappush(slots, heapq.heappop(slots) + duration)
+
+        return max(slots)
+
+
+def main():
+    """Mock Cadence main function."""
+    description = 'SMOC - Mock of Cadence Virtuoso, with analytic circuit models'
+    parser = argparse.ArgumentParser(description=description, prog='mock_cadence')
+
+    parser.add_argument('-m', '--model', default='common_source',
+                        help='analytic model ({0})'.format(', '.join(sorted(MODELS))))
+    parser.add_argument('--n-vars', type=int, help='number of variables (ZDT)')
+    parser.add_argument('--n-obj', type=int, help='number of objectives (DTLZ)')
+    parser.add_argument('--host', default='localhost', help='client address')
+    parser.add_argument('--port', type=int, default=3000, help='client port')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='duration of a simulation, in seconds')
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help='relative standard deviation of the simulation duration')
+    parser.add_argument('--jobs', type=int, default=4, help='number of parallel simulations')
+    parser.add_argument('--overhead', type=float, default=0.0,
+                        help='time added to each run, in seconds')
+    parser.add_argument('--failure-rate', type=float, default=0.0,
+                        help='probability of a simulation failing')
+    parser.add_argument('--crash-rate', type=float, default=0.0,
+                        help='probability of a run failing (stops the server)')
+    parser.add_argument('--seed', type=int, help='random seed')
+    parser.add_argument('--workdir', help='work directory (default: temporary)')
+    parser.add_argument('--results-pipe', action='store_true',
+                        help='send the results through the pipe instead of the results file')
+    parser.add_argument('--stage', action='append', default=[], metavar='NAME=RES1,RES2',
+                        help='evaluation stage and the results it computes (repeatable)')
+    parser.add_argument('--stage-cost', type=float, default=0.1,
+                        help='duration of a stage simulation, relative to the latency')
+    parser.add_argument('--hang-rate', type=float, default=0.0,
+                        help='probability of a simulation hanging')
+    parser.add_argument('--hang-time', type=float, default=60.0,
+                        help='duration of a hung simulation, in seconds')
+
+    args = parser.parse_args()
+
+    params = {}
+    if args.n_vars is not None:
+        params['n_vars'] = args.n_vars
+    if args.n_obj is not None:
+        params['n_obj'] = args.n_obj
+
+    try:
+        model = create_model(args.model, **params)
+        stages = dict((name, results.split(','))
+                      for name, results in (stage.split('=', 1) for stage in args.stage))
+    except (KeyError, TypeError, ValueError) as err:
+        print("[ERROR] {0}. Exiting...".format(err))
+        return 1
+
+    print("[INFO] Model {0}. Circuit variables:".format(args.model))
+    for var in model.variables:
+        print("    {0}: [{1}, {2}]".format(*var))
+
+    mock = MockVirtuoso(model, args.host, args.port, args.latency, args.jitter, args.jobs,
+                        args.overhead, args.failure_rate, args.crash_rate, args.seed,
+                        args.workdir, results_pipe=args.results_pipe, stages=stages,
+                        stage_cost=args.stage_cost, hang_rate=args.hang_rate,
+                        hang_time=args.hang_time)
+
+    return mock.run()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
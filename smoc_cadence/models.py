@@ -0,0 +1,261 @@
+# This file is part of SMOC
+# Copyright (C) 2018  Miguel Fernandes
+#
+# SMOC is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SMOC is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""Analytic models that replace the circuit simulations in the mock Cadence."""
+
+import math
+
+
+class Model(object):
+    """An analytic model of a circuit (or a test problem).
+
+    Each model has a list of design variables, with their bounds and default
+    value, and computes the simulation results of a set of variables.
+    """
+
+    def __init__(self):
+        """Create the model."""
+        self.name = type(self).__name__.lower()
+        # (name, lower bound, upper bound, default value) of each variable
+        self.variables = []
+
+    def defaults(self):
+        """Get the default value of each design variable.
+
+        Returns:
+            dict: default design variables.
+        """
+        return dict((name, default) for name, _, _, default in self.variables)
+
+    def evaluate(self, variables):
+        """Compute the simulation results.
+
+        Arguments:
+            variables (dict): design variables.
+
+        Returns:
+            dict: simulation results.
+        """
+        raise NotImplementedError
+
+
+class CommonSource(Model):
+    """A common-source amplifier with a PMOS current-source load, based on the
+    square-law MOSFET model.
+
+    The variables are the widths of the input (W1) and load (W2) transistors,
+    their length (L), in um, the bias current (IB), in A, and the gate voltage
+    of the load (VBIAS), in V. The results are the power (POWER), DC gain in dB
+    (GAIN), gain-bandwidth product (GBW), output swing (OS) and the operating
+    region of each transistor (REG1/REG2: 0 - cut-off, 1 - triode,
+    2 - saturation).
+    """
+
+    VDD = 1.2       # Supply voltage
+    KN = 300e-6     # NMOS transconductance parameter (un * Cox)
+    KP = 80e-6      # PMOS transconductance parameter (up * Cox)
+    VTP = 0.4       # PMOS threshold voltage
+    LAMBDA_N = 0.08     # NMOS channel-length modulation, per um of length
+    LAMBDA_P = 0.1      # PMOS channel-length modulation, per um of length
+    CL = 1e-12      # Load capacitance
+
+    def __init__(self):
+        """Create the model."""
+        super(CommonSource, self).__init__()
+        self.name = 'common_source'
+        self.variables = [('W1', 1, 100, 2), ('W2', 3, 100, 6), ('L', 140e-3, 560e-3, 0.28),
+                          ('IB', 10e-6, 100e-6, 40e-6), ('VBIAS', 0.3, 1.0, 0.5)]
+
+    def evaluate(self, variables):
+        """Compute the simulation results."""
+        w1 = variables['W1']
+        w2 = variables['W2']
+        length = variables['L']
+        ib = variables['IB']
+        vbias = variables['VBIAS']
+
+        gm1 = math.sqrt(2 * self.KN * (w1 / length) * ib)
+        gds = (self.LAMBDA_N + self.LAMBDA_P) / length * ib
+
+        # Overdrive voltages required to carry the bias current
+        vov1 = math.sqrt(2 * ib / (self.KN * w1 / length))
+        vov2 = math.sqrt(2 * ib / (self.KP * w2 / length))
+        # Overdrive voltage set by the load gate voltage. The current mismatch
+        # moves the output voltage
+        vov2_bias = self.VDD - vbias - self.VTP
+        vout = min(max(self.VDD / 2 + 4 * (vov2_bias - vov2), 0.0), self.VDD)
+
+        reg1 = 2 if vout > vov1 else 1
+        if vov2_bias <= 0:
+            reg2 = 0
+        else:
+            reg2 = 2 if self.VDD - vout > vov2 else 1
+
+        return dict(POWER=self.VDD * ib, GAIN=20 * math.log10(gm1 / gds),
+                    GBW=gm1 / (2 * math.pi * self.CL), OS=self.VDD - vov1 - vov2, REG1=reg1,
+                    REG2=reg2)
+
+
+class ZDT(Model):
+    """The ZDT test problems (ZDT1, ZDT2, ZDT3, ZDT4 and ZDT6), with two
+    objectives (f1 and f2) to minimize.
+
+    Arguments:
+        problem (int): problem number.
+        n_vars (int, optional): number of variables (default: 30, or 10 for
+            ZDT4 and ZDT6).
+    """
+
+    def __init__(self, problem, n_vars=None):
+        """Create the model."""
+        super(ZDT, self).__init__()
+
+        if problem not in (1, 2, 3, 4, 6):
+            raise ValueError("Invalid ZDT problem: {0}".format(problem))
+
+        if n_vars is None:
+            n_vars = 10 if problem in (4, 6) else 30
+
+        self.problem = problem
+        self.name = 'zdt{0}'.format(problem)
+        self.variables = [('x1', 0.0, 1.0, 0.5)]
+        for idx in range(2, n_vars + 1):
+            if problem == 4:
+                self.variables.append(('x{0}'.format(idx), -5.0, 5.0, 0.0))
+            else:
+                self.variables.append(('x{0}'.format(idx), 0.0, 1.0, 0.5))
+
+    def evaluate(self, variables):
+        """Compute the simulation results."""
+        x = [variables[name] for name, _, _, _ in self.variables]
+        rest = x[1:]
+        num = max(len(rest), 1)
+
+        if self.problem == 4:
+            g = 1 + 10 * len(rest) + sum(xi ** 2 - 10 * math.cos(4 * math.pi * xi) for xi in rest)
+        elif self.problem == 6:
+            g = 1 + 9 * (sum(rest) / num) ** 0.25
+        else:
+            g = 1 + 9 * sum(rest) / num
+
+        if self.problem == 6:
+            f1 = 1 - math.exp(-4 * x[0]) * math.sin(6 * math.pi * x[0]) ** 6
+        else:
+            f1 = x[0]
+
+        ratio = f1 / g
+        if self.problem in (1, 4):
+            h = 1 - math.sqrt(ratio)
+        elif self.problem in (2, 6):
+            h = 1 - ratio ** 2
+        else:
+            h = 1 - math.sqrt(ratio) - ratio * math.sin(10 * math.pi * f1)
+
+        return dict(f1=f1, f2=g * h)
+
+
+class DTLZ(Model):
+    """The DTLZ1 and DTLZ2 test problems, with "n_obj" objectives (f1, f2,
+    ...) to minimize.
+
+    Arguments:
+        problem (int): problem number.
+        n_obj (int, optional): number of objectives (default: 3).
+        k (int, optional): number of distance variables (default: 5 for DTLZ1
+            and 10 for DTLZ2).
+    """
+
+    def __init__(self, problem, n_obj=3, k=None):
+        """Create the model."""
+        super(DTLZ, self).__init__()
+
+        if problem not in (1, 2):
+            raise ValueError("Invalid DTLZ problem: {0}".format(problem))
+
+        if k is None:
+            k = 5 if problem == 1 else 10
+
+        self.problem = problem
+        self.name = 'dtlz{0}'.format(problem)
+        self.n_obj = n_obj
+        self.variables = [('x{0}'.format(idx), 0.0, 1.0, 0.5)
+                          for idx in range(1, n_obj + k)]
+
+    def evaluate(self, variables):
+        """Compute the simulation results."""
+        x = [variables[name] for name, _, _, _ in self.variables]
+        pos = x[:self.n_obj - 1]
+        dist = x[self.n_obj - 1:]
+
+        if self.problem == 1:
+            g = 100 * (len(dist) + sum((xi - 0.5) ** 2 - math.cos(20 * math.pi * (xi - 0.5))
+                                       for xi in dist))
+        else:
+            g = sum((xi - 0.5) ** 2 for xi in dist)
+
+        results = {}
+        for obj in range(self.n_obj):
+            num = self.n_obj - 1 - obj
+            if self.problem == 1:
+                val = 0.5 * (1 + g)
+                for xi in pos[:num]:
+                    val *= xi
+                if obj > 0:
+                    val *= 1 - pos[num]
+            else:
+                val = 1 + g
+                for xi in pos[:num]:
+                    val *= math.cos(xi * math.pi / 2)
+                if obj > 0:
+                    val *= math.sin(pos[num] * math.pi / 2)
+
+            results['f{0}'.format(obj + 1)] = val
+
+        return results
+
+
+# Available models, by name
+MODELS = {
+    'common_source': CommonSource,
+    'zdt1': lambda **kwargs: ZDT(1, **kwargs),
+    'zdt2': lambda **kwargs: ZDT(2, **kwargs),
+    'zdt3': lambda **kwargs: ZDT(3, **kwargs),
+    'zdt4': lambda **kwargs: ZDT(4, **kwargs),
+    'zdt6': lambda **kwargs: ZDT(6, **kwargs),
+    'dtlz1': lambda **kwargs: DTLZ(1, **kwargs),
+    'dtlz2': lambda **kwargs: DTLZ(2, **kwargs),
+}
+
+
+def create_model(name, **kwargs):
+    """Create a model by name.
+
+    Arguments:
+        name (str): model name (see "MODELS").
+        **kwargs: model parameters (e.g. n_vars, n_obj).
+
+    Raises:
+        KeyError: if the model doesn't exist.
+
+    Returns:
+        Model: the model.
+    """
+    try:
+        factory = MODELS[name.lower()]
+    except KeyError:
+        raise KeyError("Invalid model '{0}'. Available: {1}".format(
+            name, ', '.join(sorted(MODELS))))
+
+    return factory(**kwargs)
@@ -65,10 +65,19 @@ def main():
     run_simulation_file = script_dir + '/' + project_cfg['runSimulation_fie']
     variables_file = script_dir + '/' + project_cfg['variables_file']
     results_file = project_dir + '/' + project_cfg['results_file']
+    # Simulations template and run file of each evaluation stage, e.g.
+    #   "stages": {"dc": {"templateSimulations_file": "templateSimulationsDC.ocn",
+    #                     "runSimulation_file": "runDC.ocn"}}
+    stages = {}
+    for name, stage_cfg in project_cfg.get('stages', {}).items():
+        stages[name] = dict(template=script_dir + '/' + stage_cfg['templateSimulations_file'],
+                            run=script_dir + '/' + stage_cfg['runSimulation_file'])
 
     # Check if files exist
     files = [load_simulator_file, template_simulations_file, run_simulation_file,
              variables_file]
+    for stage in stages.values():
+        files += [stage['template'], stage['run']]
     for file in files:
         if not os.path.isfile(file):
             print("[ERROR] The file {0} does not exist! Exiting SMOC...".format(file))
@@ -86,9 +95,15 @@ def main():
     os.environ['SMOC_RUN_FILE'] = run_simulation_file
     os.environ['SMOC_VARS_FILE'] = variables_file
     os.environ['SMOC_RESULTS_FILE'] = results_file
+    # Send the results through the Virtuoso pipe instead of the results file
+    os.environ['SMOC_RESULTS_PIPE'] = '1' if project_cfg.get('results_pipe') else '0'
+    # Evaluation stages
+    os.environ['SMOC_STAGES'] = json.dumps(stages)
     # Server
     os.environ['SMOC_CLIENT_ADDR'] = client_cfg['host']
     os.environ['SMOC_CLIENT_PORT'] = str(client_cfg['port'])
+    os.environ['SMOC_RECV_SIZE'] = str(client_cfg.get('recv_size', 0))
+    os.environ['SMOC_BUFFER_SIZE'] = str(client_cfg.get('buffer_size', 0))
 
     # Print license
     print("\nSMOC  Copyright (C) 2018  Miguel Fernandes")
@@ -111,6 +126,8 @@ def main():
     print("* Run simulation file (script folder):", project_cfg['runSimulation_fie'])
     print("* Variables file (script folder):", project_cfg['variables_file'])
     print("* Results file (project folder):", project_cfg['results_file'])
+    print("* Results through the pipe:", bool(project_cfg.get('results_pipe')))
+    print("* Evaluation stages:", ', '.join(sorted(stages)) or 'None')
     print("****************************** Client Parameters *******************************")
     print("* Host:", client_cfg['host'])
     print("* Port:", client_cfg['port'])
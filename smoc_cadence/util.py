@@ -15,6 +15,9 @@
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 """Helpers to handle data."""
 
+import hashlib
+import mmap
+import os
 import re
 from functools import reduce
 
@@ -63,22 +66,58 @@ def get_vars_from_file(fname):
     return variables
 
 
-def store_vars_in_file(variables, fname):
+def store_vars_in_file(variables, fname, applied=None, prefix='test'):
     """Store circuit variables in a file.
 
+    If the values already applied to each test are given, only the variables
+    that changed (and the selection of their tests) are written, and the
+    applied values are updated.
+
     Arguments:
         variables (dict): dictionary with the circuit variables.
         fname (str): file name.
+        applied (dict or None, optional): values (as written in the file)
+            already applied to each variable of each test, by test name. If
+            None, all variables are written (default: None).
+        prefix (str, optional): prefix of the test names, i.e. the test set
+            of an evaluation stage (default: 'test').
+
+    Returns:
+        tuple: number of lines written and skipped.
     """
+    written = 0
+    skipped = 0
+
     with open(fname, 'w') as f:
 
         for idx, var in enumerate(variables):
-            # Write the header of the correspondent test
-            f.write("ocnxlSelectTest(\"test:{0}\")\n".format(idx + 1))
+            test = '{0}:{1}'.format(prefix, idx + 1)
+            if applied is None:
+                test_vars = {}
+            else:
+                test_vars = applied.setdefault(test, {})
 
-            # Iterate over the dictionary and save variables to file
+            lines = []
             for key, val in var.items():
-                f.write("desVar(\t \"{0}\" {1}\t)\n".format(key, val))
+                val = str(val)
+                if test_vars.get(key) == val:
+                    skipped += 1
+                    continue
+
+                lines.append("desVar(\t \"{0}\" {1}\t)\n".format(key, val))
+                test_vars[key] = val
+
+            if not lines:  # The test is not selected
+                skipped += 1
+                continue
+
+            # Write the header of the correspondent test
+            f.write("ocnxlSelectTest(\"{0}\")\n".format(test))
+            # Save the variables to file
+            f.writelines(lines)
+            written += len(lines) + 1
+
+    return written, skipped
 
 
 def get_results_from_file(fname):
@@ -115,14 +154,206 @@ def get_results_from_file(fname):
     return results_list
 
 
-def generate_simulations_file(template, fname, pop_size):
+def read_results(fname, num_tests):
+    """Read the simulation results of a batch into a matrix, in one pass.
+
+    Each line of the results file has the test index (starting at 1), the
+    result name and its value, separated by whitespace, e.g.
+    "3    GAIN    4.2e+01". The lines can be in any order. The file is mapped in
+    memory, so large files are not read at once.
+
+    Missing values (e.g. failed simulations), and values that are not numbers
+    (e.g. "nil"), are NaN, and their tests are marked as failed, so they never
+    shift the results of the other tests. Files in the old format (result
+    name and value, without the test index) are also read, with
+    "get_results_from_file".
+
+    Arguments:
+        fname (str): file path.
+        num_tests (int): number of tests of the batch.
+
+    Returns:
+        tuple: names of the results (matrix columns, sorted), matrix values
+            (row by row, one row per test) and indexes (starting at 0) of the
+            failed tests.
+    """
+    f = open(fname, 'rb')
+    data = None
+    try:
+        if os.fstat(f.fileno()).st_size == 0:
+            lines = []
+        else:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            lines = iter(data.readline, b'')
+
+        results = parse_results(lines, num_tests)
+    finally:
+        if data is not None:
+            data.close()
+        f.close()
+
+    if results is None:  # Old format
+        return read_old_results(fname, num_tests)
+
+    return results
+
+
+def parse_results(lines, num_tests):
+    """Parse the lines of the simulation results of a batch (see
+    "read_results") into a matrix.
+
+    Arguments:
+        lines (iterable): lines of results (bytes).
+        num_tests (int): number of tests of the batch.
+
+    Returns:
+        tuple or None: names of the results, matrix values and failed tests,
+            or None if the lines are in the old format.
+    """
+    nan = float('nan')
+    columns = {}
+
+    for line in lines:
+        fields = line.split()
+        if not fields:
+            continue
+
+        if len(fields) == 2:  # Old format
+            return None
+
+        try:
+            test = int(fields[0])
+            name = fields[1].decode()
+        except (IndexError, ValueError):
+            continue
+
+        if not 1 <= test <= num_tests:
+            continue
+
+        try:
+            val = float(fields[2])
+        except ValueError:
+            val = nan
+
+        if name not in columns:
+            columns[name] = [nan] * num_tests
+        columns[name][test - 1] = val
+
+    return results_matrix(columns, num_tests)
+
+
+def read_old_results(fname, num_tests):
+    """Read the simulation results of a batch in the old format (see
+    "get_results_from_file") into a matrix (see "read_results").
+
+    Arguments:
+        fname (str): file path.
+        num_tests (int): number of tests of the batch.
+
+    Returns:
+        tuple: names of the results, matrix values and failed tests.
+    """
+    nan = float('nan')
+    columns = {}
+
+    for test, res in enumerate(get_results_from_file(fname)[:num_tests]):
+        for name, val in res.items():
+            if name not in columns:
+                columns[name] = [nan] * num_tests
+            columns[name][test] = val
+
+    return results_matrix(columns, num_tests)
+
+
+def results_matrix(columns, num_tests):
+    """Build the results matrix of a batch from its columns.
+
+    Arguments:
+        columns (dict): values of each result, by test.
+        num_tests (int): number of tests of the batch.
+
+    Returns:
+        tuple: names of the results (sorted), matrix values (row by row) and
+            indexes of the tests with missing values.
+    """
+    names = sorted(columns)
+    values = []
+    failed = []
+
+    for idx in range(num_tests):
+        row = [columns[name][idx] for name in names]
+        # NaN is the only value that is different from itself
+        if not names or [val for val in row if val != val]:
+            failed.append(idx)
+        values.extend(row)
+
+    return names, values, failed
+
+
+def get_file_hash(fname):
+    """Get the MD5 hash of a file content.
+
+    Arguments:
+        fname (str): file path.
+
+    Returns:
+        str: hexadecimal digest of the file content.
+    """
+    md5 = hashlib.md5()
+
+    with open(fname, 'rb') as f:
+        md5.update(f.read())
+
+    return md5.hexdigest()
+
+
+def get_max_jobs(fname):
+    """Get the max number of parallel simulation jobs ("maxjobs" of the ADE-XL
+    job setup) from the file that loads the simulator.
+
+    Arguments:
+        fname (str): file path.
+
+    Returns:
+        int or None: max number of jobs, or None if it's not defined.
+    """
+    try:
+        with open(fname, 'r') as f:
+            content = f.read()
+    except (IOError, OSError):
+        return None
+
+    match = re.search(r'"maxjobs"\s+"(\d+)"', content)
+
+    return int(match.group(1)) if match else None
+
+
+def generate_simulations_file(template, fname, pop_size, prefix='test', append=False,
+                              enabled=True):
+    """Generate the file with the simulation tests: "pop_size" copies of the
+    template ("<prefix>:1", "<prefix>:2", ...).
+
+    Arguments:
+        template (str): simulations template file.
+        fname (str): simulations file.
+        pop_size (int): number of tests.
+        prefix (str, optional): prefix of the test names, i.e. the test set
+            of an evaluation stage (default: 'test').
+        append (bool, optional): append the tests to the file, e.g. the test
+            set of another stage (default: False).
+        enabled (bool, optional): the tests are enabled (default: True).
+    """
     # Read the template
     with open(template, 'r') as f:
         content = f.read()
 
     # Write the simulations file
-    with open(fname, 'w') as f:
+    with open(fname, 'a' if append else 'w') as f:
         for idx in range(1, pop_size + 1):
-            f.write('ocnxlBeginTest("test:{0}")\n'.format(idx))
+            f.write('ocnxlBeginTest("{0}:{1}")\n'.format(prefix, idx))
             f.write(content)
             f.write("ocnxlEndTest()\n\n")
+
+        if not enabled:
+            for idx in range(1, pop_size + 1):
+                f.write('ocnxlDisableTest("{0}:{1}")\n'.format(prefix, idx))